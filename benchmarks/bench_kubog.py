@@ -0,0 +1,320 @@
+#!/usr/bin/env python3
+"""
+Micro-benchmark delle funzioni calde di KuBog su fixture sintetiche.
+
+    python -m benchmarks.bench_kubog --scales 1000 10000 --output bench.json
+    python -m benchmarks.bench_kubog --baseline bench.json --threshold 0.25
+
+Con --baseline il processo esce con codice 1 se uno stage è più lento
+della baseline oltre la soglia (per operazione, stessa scala).
+"""
+import os
+import sys
+import json
+import time
+import random
+import argparse
+import tempfile
+from datetime import datetime, timedelta, timezone
+from kubernetes import client
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from kubog_v1 import generate_summary_csv  # noqa: E402
+from utility.watch_replay import build_offline_debugger, offline_args  # noqa: E402
+from utility.alert_rules import RuleIndex  # noqa: E402
+
+REPO_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+DEFAULT_SCALES = [1000, 10000, 100000]
+CPU_VALUES = ["100m", "250m", "1", "2", "1500m", "123456789n"]
+MEM_VALUES = ["128Mi", "512Mi", "1Gi", "2048Ki", "4Gi", "134217728"]
+WAITING_REASONS = ["CrashLoopBackOff", "ImagePullBackOff", "ContainerCreating", "StartupProbeFailed"]
+
+
+# ── FIXTURES ────────────────────────────────────────────────────────────────
+
+def make_container_status(rng, name, base_time):
+    roll = rng.random()
+    if roll < 0.6:
+        state = client.V1ContainerState(running=client.V1ContainerStateRunning(started_at=base_time))
+    elif roll < 0.8:
+        state = client.V1ContainerState(waiting=client.V1ContainerStateWaiting(
+            reason=rng.choice(WAITING_REASONS), message="back-off restarting failed container"))
+    else:
+        reason = "OOMKilled" if rng.random() < 0.5 else "Error"
+        state = client.V1ContainerState(terminated=client.V1ContainerStateTerminated(
+            exit_code=137 if reason == "OOMKilled" else 1, reason=reason, finished_at=base_time))
+
+    last_state = client.V1ContainerState()
+    if rng.random() < 0.4:
+        last_state = client.V1ContainerState(terminated=client.V1ContainerStateTerminated(
+            exit_code=rng.choice([1, 2, 137, 143]), reason="Error",
+            finished_at=base_time - timedelta(seconds=rng.randint(1, 10 ** 6))))
+
+    return client.V1ContainerStatus(
+        name=name, image="busybox", image_id="", ready=state.running is not None,
+        restart_count=rng.randint(0, 50), state=state, last_state=last_state,
+    )
+
+
+def make_pod(rng, i, nodes, base_time):
+    ns = f"ns-{i % 50}"
+    deployment = f"app-{i % 500}"
+    containers = [f"c{j}" for j in range(rng.randint(1, 3))]
+    return client.V1Pod(
+        metadata=client.V1ObjectMeta(
+            name=f"{deployment}-7d9f8c-{i}", namespace=ns, uid=f"uid-{i}", resource_version=str(i),
+            owner_references=[client.V1OwnerReference(
+                api_version="apps/v1", kind="ReplicaSet", name=f"{deployment}-7d9f8c", uid=f"rs-{i % 500}")],
+        ),
+        spec=client.V1PodSpec(
+            node_name=f"node-{i % nodes}",
+            containers=[client.V1Container(
+                name=c, image="busybox", termination_message_path="/dev/termination-log",
+                resources=client.V1ResourceRequirements(
+                    requests={"cpu": rng.choice(CPU_VALUES), "memory": rng.choice(MEM_VALUES)},
+                    limits={"cpu": rng.choice(CPU_VALUES), "memory": rng.choice(MEM_VALUES)},
+                ),
+            ) for c in containers],
+        ),
+        status=client.V1PodStatus(container_statuses=[
+            make_container_status(rng, c, base_time) for c in containers
+        ]),
+    )
+
+
+def make_node(i):
+    return client.V1Node(
+        metadata=client.V1ObjectMeta(name=f"node-{i}"),
+        spec=client.V1NodeSpec(unschedulable=(i % 40 == 0), taints=[
+            client.V1Taint(effect="NoSchedule", key="dedicated", value="batch")] if i % 10 == 0 else None),
+        status=client.V1NodeStatus(
+            capacity={"cpu": "16", "memory": "64Gi"},
+            allocatable={"cpu": "15800m", "memory": "62Gi"},
+            conditions=[
+                client.V1NodeCondition(type="Ready", status="False" if i % 97 == 0 else "True"),
+                client.V1NodeCondition(type="MemoryPressure", status="True" if i % 53 == 0 else "False"),
+                client.V1NodeCondition(type="DiskPressure", status="False"),
+                client.V1NodeCondition(type="PIDPressure", status="False"),
+            ],
+        ),
+    )
+
+
+class Fixtures:
+    def __init__(self, scale, seed=42):
+        rng = random.Random(seed)
+        base_time = datetime(2025, 1, 1, tzinfo=timezone.utc)
+        self.scale = scale
+        self.out_dir = None  # cartella temporanea dello stage in corso (impostata da run)
+        self.node_count = max(1, scale // 100)
+        self.pods = [make_pod(rng, i, self.node_count, base_time) for i in range(scale)]
+        self.nodes = [make_node(i) for i in range(self.node_count)]
+        self.metrics = [
+            {"metadata": {"name": n.metadata.name},
+             "usage": {"cpu": f"{rng.randint(10 ** 8, 10 ** 10)}n", "memory": f"{rng.randint(10 ** 5, 10 ** 7)}Ki"}}
+            for n in self.nodes
+        ]
+        self.cpu_strings = [rng.choice(CPU_VALUES) for _ in range(scale)]
+        self.mem_strings = [rng.choice(MEM_VALUES) for _ in range(scale)]
+        types = ["TERMINATION", "OOM_KILLED", "PROBE_FAILURE", "POD_DELETED", "STATE_CHANGE"]
+        self.events = [
+            {
+                "timestamp": (base_time + timedelta(seconds=i)).isoformat(),
+                "namespace": f"ns-{i % 50}", "workload": f"Deployment/app-{i % 500}",
+                "type": rng.choice(types), "pod": f"pod-{i}", "container": "c0",
+                "exit_code": rng.choice([None, 1, 137]), "reason": rng.choice([None, "CrashLoopBackOff", "Error"]),
+            }
+            for i in range(scale)
+        ]
+        self.node_rows = [
+            {"timestamp": (base_time + timedelta(minutes=i)).isoformat(), "type": "NODE_RESOURCE",
+             "node": f"node-{i % self.node_count}", "cpu_capacity": 16.0, "cpu_usage": 3.2,
+             "mem_capacity": 65536.0, "mem_usage": 20480.0, "condition_Ready": "True"}
+            for i in range(scale)
+        ]
+
+
+# ── BENCHMARKS ──────────────────────────────────────────────────────────────
+# Ogni benchmark riceve le fixture e ritorna (callable da cronometrare, numero operazioni);
+# il setup (debugger nuovo, stato vuoto) resta fuori dalla misura.
+
+def _debugger(fx):
+    # CSV e nodi nella cartella temporanea dello stage, non nel checkout
+    debugger, _ = build_offline_debugger(offline_args())
+    debugger.base_dir = fx.out_dir
+    return debugger
+
+
+def bench_parse_cpu(fx):
+    d = _debugger(fx)
+    return (lambda: [d._parse_cpu(v) for v in fx.cpu_strings]), fx.scale
+
+
+def bench_parse_mem(fx):
+    d = _debugger(fx)
+    return (lambda: [d._parse_mem(v) for v in fx.mem_strings]), fx.scale
+
+
+def bench_process_pod(fx):
+    d = _debugger(fx)
+    return (lambda: [d._process_pod(p) for p in fx.pods]), fx.scale
+
+
+def bench_handle_watch_event(fx):
+    d = _debugger(fx)
+    events = [{"type": "MODIFIED", "object": p} for p in fx.pods]
+    return (lambda: [d._handle_watch_event(e) for e in events]), fx.scale
+
+
+def bench_handle_watch_event_unchanged(fx):
+    # MODIFIED senza cambi ai container: misura lo short-circuit del fingerprint
+    d = _debugger(fx)
+    events = [{"type": "MODIFIED", "object": p} for p in fx.pods]
+    for e in events:
+        d._handle_watch_event(e)
+    return (lambda: [d._handle_watch_event(e) for e in events]), fx.scale
+
+
+def bench_check_nodes(fx):
+    d = _debugger(fx)
+    d.v1.nodes = client.V1NodeList(items=fx.nodes)
+    d.v1.pods = client.V1PodList(items=fx.pods)
+    d.metrics_api.items = fx.metrics
+    return d._check_nodes, fx.scale
+
+
+def bench_should_alert(fx):
+    d = _debugger(fx)
+    manager = d.alert_manager
+    return (lambda: [manager.should_alert(e) for e in fx.events]), fx.scale
+
+
+def bench_should_alert_overrides(fx):
+    # ~1500 override per namespace, workload e label: il costo per evento deve restare quello di should_alert
+    d = _debugger(fx)
+    manager = d.alert_manager
+    rules = dict(manager.config.get("kube-alerts", {}))
+    for key in ("TERMINATION", "OOM_KILLED", "PROBE_FAILURE"):
+        rules[key] = {**rules[key], "overrides": [
+            {"namespace": f"ns-{i % 50}", "workload": f"app-{i}*", "min_occurrences": 2}
+            if i % 2 else
+            {"namespace": f"ns-{i % 50}", "labels": f"tier=critical,team=t{i}", "within_minutes": 5}
+            for i in range(500)
+        ]}
+    manager.rules = RuleIndex(rules)
+    events = [{**e, "labels": {"tier": "critical", "team": f"t{i % 500}"}} for i, e in enumerate(fx.events)]
+    return (lambda: [manager.should_alert(e) for e in events]), fx.scale
+
+
+def bench_write_csv(fx):
+    d = _debugger(fx)
+    rows = [{**e, **{c: None for c in d.all_columns if c not in e}} for e in fx.events]
+    return (lambda: d._write_csv(rows, "bench")), fx.scale
+
+
+def bench_output_node_status(fx):
+    d = _debugger(fx)
+    return (lambda: [d._output_node_status(r, r["node"]) for r in fx.node_rows]), fx.scale
+
+
+def bench_generate_summary_csv(fx):
+    args = offline_args(chaos=True)
+    return (lambda: generate_summary_csv(fx.events, args)), fx.scale
+
+
+BENCHMARKS = {
+    "parse_cpu": bench_parse_cpu,
+    "parse_mem": bench_parse_mem,
+    "process_pod": bench_process_pod,
+    "handle_watch_event": bench_handle_watch_event,
+    "handle_watch_event_unchanged": bench_handle_watch_event_unchanged,
+    "check_nodes": bench_check_nodes,
+    "should_alert": bench_should_alert,
+    "should_alert_overrides": bench_should_alert_overrides,
+    "write_csv": bench_write_csv,
+    "output_node_status": bench_output_node_status,
+    "generate_summary_csv": bench_generate_summary_csv,
+}
+
+
+def run(scales, stages, repeat):
+    results = {}
+    for scale in scales:
+        print(f"🏗️ Building fixtures for {scale} pods", file=sys.stderr)
+        fx = Fixtures(scale)
+        for name in stages:
+            best = None
+            for _ in range(repeat):
+                with tempfile.TemporaryDirectory() as tmp:
+                    os.chdir(REPO_DIR)  # kube-alerts.yaml
+                    fx.out_dir = tmp
+                    fn, ops = BENCHMARKS[name](fx)
+                    os.chdir(tmp)  # CSV scritti in una cartella temporanea
+                    start = time.perf_counter()
+                    fn()
+                    elapsed = time.perf_counter() - start
+                    os.chdir(REPO_DIR)
+                best = elapsed if best is None else min(best, elapsed)
+            results.setdefault(name, {})[str(scale)] = {
+                "ops": ops,
+                "seconds": round(best, 6),
+                "per_op_us": round(best / ops * 1e6, 3),
+            }
+            print(f"⏱️ {name:<30} {scale:>7}  {best * 1000:10.2f} ms  {best / ops * 1e6:9.2f} µs/op",
+                  file=sys.stderr)
+    return results
+
+
+def compare(results, baseline, threshold):
+    """Ritorna la lista di regressioni (stage, scala, baseline, attuale)"""
+    regressions = []
+    for name, per_scale in results.items():
+        for scale, current in per_scale.items():
+            ref = baseline.get(name, {}).get(scale)
+            if not ref:
+                continue
+            if current["per_op_us"] > ref["per_op_us"] * (1 + threshold):
+                regressions.append((name, scale, ref["per_op_us"], current["per_op_us"]))
+    return regressions
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="KuBog micro-benchmarks")
+    parser.add_argument("--scales", nargs="+", type=int, default=DEFAULT_SCALES)
+    parser.add_argument("--stages", nargs="+", choices=list(BENCHMARKS), default=list(BENCHMARKS))
+    parser.add_argument("--repeat", type=int, default=3, help="Runs per stage; the best one is kept")
+    parser.add_argument("--output", help="Write JSON results to this file")
+    parser.add_argument("--baseline", help="JSON results to compare against")
+    parser.add_argument("--threshold", type=float, default=0.25,
+                        help="Allowed slowdown per op vs baseline (0.25 = +25%%)")
+    args = parser.parse_args(argv)
+
+    output = os.path.abspath(args.output) if args.output else None
+    baseline_path = os.path.abspath(args.baseline) if args.baseline else None
+
+    results = {
+        "meta": {"python": sys.version.split()[0], "timestamp": datetime.now().isoformat()},
+        "results": run(args.scales, args.stages, args.repeat),
+    }
+    text = json.dumps(results, indent=2)
+    if output:
+        with open(output, "w") as f:
+            f.write(text)
+    else:
+        print(text)
+
+    if baseline_path:
+        with open(baseline_path) as f:
+            baseline = json.load(f).get("results", {})
+        regressions = compare(results["results"], baseline, args.threshold)
+        for name, scale, ref, cur in regressions:
+            print(f"❌ {name}@{scale}: {cur:.2f} µs/op vs baseline {ref:.2f} µs/op", file=sys.stderr)
+        if regressions:
+            return 1
+        print("✅ No regressions beyond threshold", file=sys.stderr)
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
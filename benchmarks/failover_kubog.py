@@ -0,0 +1,210 @@
+#!/usr/bin/env python3
+"""
+Prova di failover di --ha: due replica (più un riferimento senza HA) ricevono lo stesso flusso di
+eventi del cluster simulato di soak_kubog, con un Lease condiviso su InMemoryLeaseAPI (API server finto).
+
+    python -m benchmarks.failover_kubog --lease-seconds 3 --report failover.json
+
+Fasi: A leader → crash di A (nessun rilascio) → B subentra alla scadenza del Lease →
+A riparte come nuovo standby → B si ferma con rilascio → A subentra al primo tentativo.
+Misura i tempi di failover e confronta storico e alert dei replica con il riferimento:
+esce con codice 1 se mancano righe di storico o alert, o se il failover supera `--max-failover`.
+"""
+import os
+import sys
+import json
+import time
+import random
+import argparse
+import tempfile
+import threading
+from datetime import datetime
+from collections import defaultdict
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from kubernetes import client  # noqa: E402
+from benchmarks.soak_kubog import SimCluster, VirtualClock  # noqa: E402
+from utility.sharding import InMemoryLeaseAPI  # noqa: E402
+from utility.watch_replay import build_offline_debugger, offline_args  # noqa: E402
+
+REPO_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+
+class Replica:
+    """Un debugger offline con i suoi CSV, le righe di storico scritte e gli alert inviati"""
+
+    def __init__(self, name, out_dir, lease_api=None, lease_seconds=3):
+        args = offline_args(nodes=False, ha=lease_api is not None, lease_namespace="default",
+                            shard_group="failover", shard_id=name, ha_lease_seconds=lease_seconds)
+        self.name = name
+        self.debugger, self.alerts = build_offline_debugger(args)
+        self.debugger.base_dir = os.path.join(out_dir, name)
+        self.rows = set()
+        self.alive = True
+
+        write_csv = self.debugger._write_csv
+
+        def counted_write_csv(data, namespace):
+            for e in data:
+                self.rows.add((e["namespace"], e["pod"], e.get("container"), e["type"], e.get("resource_version")))
+            return write_csv(data, namespace)
+
+        self.debugger._write_csv = counted_write_csv
+        if lease_api is not None:
+            self.debugger.leader.api = lease_api
+            self.debugger.leader.start()
+
+    def feed(self, events):
+        if not self.alive:
+            return
+        d = self.debugger
+        for kind, event in events:
+            if kind == "pod":
+                pod = event["object"]
+                if d._should_monitor(pod, pod.metadata.namespace):
+                    d._handle_watch_event(event)
+            else:
+                d._handle_namespace_event(event)
+
+    def crash(self):
+        """Processo morto: niente più eventi, nessun rilascio del Lease"""
+        self.alive = False
+        self.debugger.leader.stop(release=False)
+
+    def shutdown(self):
+        """Arresto ordinato: pipeline svuotata, poi rilascio del Lease (come _cleanup)"""
+        self.alive = False
+        self.debugger.sinks.flush()
+        self.debugger.leader.stop()
+
+    def is_leader(self):
+        return self.debugger.leader.is_leader()
+
+    def replayed(self):
+        return sum(getattr(w.sink, "replayed", 0) for w in self.debugger.sinks.workers)
+
+    def replayed_alerts(self):
+        standby = self.debugger.standby_alerts
+        return standby.replayed if standby else 0
+
+
+def wait_for(predicate, timeout, step=0.05):
+    start = time.monotonic()
+    while time.monotonic() - start < timeout:
+        if predicate():
+            return time.monotonic() - start
+        time.sleep(step)
+    return None
+
+
+def run(lease_seconds=3, phase_seconds=6, tick=0.1, seed=7):
+    rng = random.Random(seed)
+    clock = VirtualClock(datetime(2025, 1, 1))
+    cluster = SimCluster(rng, clock, namespaces=10, deployments=4, crashloop_ratio=0.3, namespace_every=15)
+    lease_api = InMemoryLeaseAPI()
+    out_dir = tempfile.mkdtemp(prefix="kubog-failover-")
+
+    # il debugger legge kube-alerts.yaml dalla cwd
+    os.chdir(REPO_DIR)
+    reference = Replica("reference", out_dir)
+    replicas = {"A": Replica("A", out_dir, lease_api, lease_seconds)}
+    wait_for(replicas["A"].is_leader, lease_seconds)
+    replicas["B"] = Replica("B", out_dir, lease_api, lease_seconds)
+
+    stop = threading.Event()
+
+    def feeder():
+        # gli ADDED iniziali arrivano come un normale flusso di watch
+        pending = [("namespace", {"type": "ADDED", "object": client.V1Namespace(
+            metadata=client.V1ObjectMeta(name=ns))}) for ns in cluster.namespaces]
+        pending += [("pod", {"type": "ADDED", "object": p}) for p in cluster.pods.values()]
+        while not stop.is_set():
+            clock.advance(60)
+            events = pending + cluster.tick()
+            pending = []
+            reference.feed(events)
+            for replica in list(replicas.values()):
+                replica.feed(events)
+            time.sleep(tick)
+
+    thread = threading.Thread(target=feeder, daemon=True)
+    thread.start()
+
+    report = {"lease_seconds": lease_seconds, "retry_seconds": replicas["A"].debugger.leader.retry_seconds}
+    time.sleep(phase_seconds)
+
+    # 1) crash del leader: B subentra alla scadenza del Lease
+    replicas["A"].crash()
+    report["failover_crash_s"] = wait_for(replicas["B"].is_leader, 3 * lease_seconds)
+    time.sleep(phase_seconds)
+
+    # 2) A riparte come standby, B si ferma con rilascio: A subentra al primo tentativo
+    replicas["A2"] = Replica("A2", out_dir, lease_api, lease_seconds)
+    time.sleep(phase_seconds / 2)
+    replicas["B"].shutdown()
+    report["failover_release_s"] = wait_for(replicas["A2"].is_leader, 3 * lease_seconds)
+    time.sleep(phase_seconds)
+
+    stop.set()
+    thread.join()
+    for replica in replicas.values():
+        replica.debugger.sinks.flush()
+        if replica.alive:
+            replica.debugger.leader.stop()
+
+    written = defaultdict(int)
+    for replica in replicas.values():
+        for row in replica.rows:
+            written[row] += 1
+    expected = reference.rows
+    alerts_reference = sum(reference.alerts.values())
+    sent = defaultdict(int)  # per canale (teams, email, email nodi)
+    for replica in replicas.values():
+        for channel, n in replica.alerts.items():
+            sent[channel] += n
+    channels = set(sent) | set(reference.alerts)
+    report.update({
+        "history_rows_expected": len(expected),
+        "history_rows_missing": len(expected - set(written)),
+        "history_rows_duplicated": sum(1 for n in written.values() if n > 1),
+        "history_rows_per_replica": {name: len(r.rows) for name, r in replicas.items()},
+        "replayed_after_takeover": {name: r.replayed() for name, r in replicas.items()},
+        "alerts_reference": alerts_reference,
+        "alerts_per_replica": {name: sum(r.alerts.values()) for name, r in replicas.items()},
+        "alerts_missing": sum(max(0, reference.alerts[c] - sent[c]) for c in channels),
+        "alerts_duplicated": sum(max(0, sent[c] - reference.alerts[c]) for c in channels),
+        "alerts_replayed_after_takeover": {name: r.replayed_alerts() for name, r in replicas.items()},
+        "output_dir": out_dir,
+    })
+    return report
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="KuBog --ha failover drill")
+    parser.add_argument("--lease-seconds", type=int, default=3)
+    parser.add_argument("--phase-seconds", type=float, default=6)
+    parser.add_argument("--max-failover", type=float, help="Fail if a takeover takes longer (default: 2 x lease)")
+    parser.add_argument("--report", help="Write the JSON report to this file")
+    args = parser.parse_args(argv)
+
+    report_path = os.path.abspath(args.report) if args.report else None
+    report = run(args.lease_seconds, args.phase_seconds)
+    text = json.dumps(report, indent=2)
+    print(text)
+    if report_path:
+        with open(report_path, "w") as f:
+            f.write(text)
+
+    limit = args.max_failover or 2 * args.lease_seconds
+    failed = report["history_rows_missing"] > 0 or report["alerts_missing"] > 0 or any(
+        t is None or t > limit for t in (report["failover_crash_s"], report["failover_release_s"]))
+    if failed:
+        print("❌ Failover drill failed", file=sys.stderr)
+        return 1
+    print("✅ Failover drill passed", file=sys.stderr)
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,389 @@
+#!/usr/bin/env python3
+"""
+Soak test di memoria: simula ore di tempo virtuale di un cluster con churn dei pod,
+rollout, namespace creati/eliminati e crash loop, passando tutto dalla pipeline reale
+(_handle_watch_event, _handle_namespace_event, _check_nodes).
+
+    python -m benchmarks.soak_kubog --hours 24 --report soak.json
+
+Ogni `--snapshot-minutes` prende uno snapshot tracemalloc e misura le strutture
+sospette; al termine confronta lo stato dopo il warm-up con quello finale ed esce
+con codice 1 se la memoria o una struttura cresce oltre `--max-growth`.
+"""
+import os
+import sys
+import json
+import random
+import argparse
+import tempfile
+import tracemalloc
+from datetime import datetime, timedelta, timezone
+from kubernetes import client
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import kubog_v1  # noqa: E402
+from utility import kube_alerts, api_profiler  # noqa: E402
+from utility.watch_replay import build_offline_debugger, offline_args  # noqa: E402
+
+REPO_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+# strutture osservate: nome → funzione che le estrae dal debugger
+STRUCTURES = {
+    "recorded_events": lambda d: d.recorded_events,
+    "pod_states": lambda d: d.pod_states.pods,
+    "all_recent_events": lambda d: d.all_recent_events,
+    "resource_versions": lambda d: d.resource_versions,
+    "api_profiler.records": lambda d: d.api_profiler.records,
+    "alert_manager.event_history": lambda d: d.alert_manager.event_history,
+    "alert_manager.last_alert_sent": lambda d: d.alert_manager.last_alert_sent,
+}
+
+
+# ── VIRTUAL CLOCK ───────────────────────────────────────────────────────────
+
+class VirtualClock:
+    """Sostituisce `datetime` nei moduli di KuBog così le finestre temporali avanzano in tempo virtuale"""
+
+    def __init__(self, start):
+        self.now = start
+        clock = self
+
+        class VirtualDatetime(datetime):
+            @classmethod
+            def now(cls, tz=None):
+                return clock.now if tz is None else clock.now.replace(tzinfo=timezone.utc).astimezone(tz)
+
+            @classmethod
+            def utcnow(cls):
+                return clock.now
+
+        self.datetime = VirtualDatetime
+        self._patched = []
+
+    def advance(self, seconds):
+        self.now += timedelta(seconds=seconds)
+
+    def install(self, *modules):
+        for module in modules:
+            self._patched.append((module, module.datetime))
+            module.datetime = self.datetime
+
+    def uninstall(self):
+        for module, original in self._patched:
+            module.datetime = original
+        self._patched.clear()
+
+
+# ── SIMULATED CLUSTER ───────────────────────────────────────────────────────
+
+class SimCluster:
+    def __init__(self, rng, clock, namespaces=20, deployments=5, replicas=3,
+                 crashloop_ratio=0.1, rollout_prob=0.002, namespace_every=30, noise_ratio=0.05):
+        self.rng = rng
+        self.clock = clock
+        self.replicas = replicas
+        self.crashloop_ratio = crashloop_ratio
+        self.rollout_prob = rollout_prob
+        self.namespace_every = namespace_every
+        self.noise_ratio = noise_ratio
+        self.deployments_per_ns = deployments
+        self.rv = 0
+        self.seq = 0
+        self.ticks = 0
+        self.pods = {}         # uid → pod
+        self.deployments = {}  # (ns, name) → {"hash": str, "crashloop": bool, "pods": [uid]}
+        self.namespaces = []
+        for _ in range(namespaces):
+            self._create_namespace()
+
+    def _next_rv(self):
+        self.rv += 1
+        return str(self.rv)
+
+    def _create_namespace(self):
+        self.seq += 1
+        ns = f"soak-{self.seq}"
+        self.namespaces.append(ns)
+        events = [("namespace", {"type": "ADDED", "object": client.V1Namespace(
+            metadata=client.V1ObjectMeta(name=ns))})]
+        for i in range(self.deployments_per_ns):
+            key = (ns, f"app-{i}")
+            self.deployments[key] = {
+                "hash": self._hash(), "crashloop": self.rng.random() < self.crashloop_ratio, "pods": []}
+            events.extend(self._scale_up(key))
+        return events
+
+    def _delete_namespace(self, ns):
+        self.namespaces.remove(ns)
+        events = []
+        for key in [k for k in self.deployments if k[0] == ns]:
+            events.extend(self._delete_pods(key))
+            del self.deployments[key]
+        events.append(("namespace", {"type": "DELETED", "object": client.V1Namespace(
+            metadata=client.V1ObjectMeta(name=ns))}))
+        return events
+
+    def _hash(self):
+        return "".join(self.rng.choice("abcdef0123456789") for _ in range(8))
+
+    def _scale_up(self, key):
+        ns, name = key
+        dep = self.deployments[key]
+        events = []
+        for _ in range(self.replicas):
+            self.seq += 1
+            uid = f"uid-{self.seq}"
+            pod = client.V1Pod(
+                metadata=client.V1ObjectMeta(
+                    name=f"{name}-{dep['hash']}-{self.seq}", namespace=ns, uid=uid,
+                    resource_version=self._next_rv(),
+                    owner_references=[client.V1OwnerReference(
+                        api_version="apps/v1", kind="ReplicaSet", name=f"{name}-{dep['hash']}", uid=dep["hash"])],
+                ),
+                spec=client.V1PodSpec(
+                    node_name=f"node-{self.seq % 5}",
+                    containers=[client.V1Container(
+                        name="app", image="busybox", termination_message_path="/dev/termination-log",
+                        resources=client.V1ResourceRequirements(
+                            requests={"cpu": "100m", "memory": "128Mi"}, limits={"cpu": "500m", "memory": "256Mi"}),
+                    )],
+                ),
+                status=client.V1PodStatus(container_statuses=[client.V1ContainerStatus(
+                    name="app", image="busybox", image_id="", ready=True, restart_count=0,
+                    state=client.V1ContainerState(running=client.V1ContainerStateRunning(started_at=self.clock.now)),
+                    last_state=client.V1ContainerState(),
+                )]),
+            )
+            self.pods[uid] = pod
+            dep["pods"].append(uid)
+            events.append(("pod", {"type": "ADDED", "object": pod}))
+        return events
+
+    def _delete_pods(self, key):
+        events = []
+        for uid in self.deployments[key]["pods"]:
+            pod = self.pods.pop(uid)
+            pod.metadata.resource_version = self._next_rv()
+            events.append(("pod", {"type": "DELETED", "object": pod}))
+        self.deployments[key]["pods"] = []
+        return events
+
+    def _crash(self, pod):
+        status = pod.status.container_statuses[0]
+        status.restart_count += 1
+        status.last_state = client.V1ContainerState(terminated=client.V1ContainerStateTerminated(
+            exit_code=self.rng.choice([1, 137]), reason=self.rng.choice(["Error", "OOMKilled"]),
+            finished_at=self.clock.now))
+        status.state = client.V1ContainerState(waiting=client.V1ContainerStateWaiting(
+            reason="CrashLoopBackOff", message="back-off restarting failed container"))
+        pod.metadata.resource_version = self._next_rv()
+
+    def tick(self):
+        """Un minuto virtuale: ritorna la lista di (kind, event) da consegnare"""
+        self.ticks += 1
+        events = []
+        for key, dep in list(self.deployments.items()):
+            if self.rng.random() < self.rollout_prob:
+                events.extend(self._delete_pods(key))
+                dep["hash"] = self._hash()
+                events.extend(self._scale_up(key))
+                continue
+            for uid in dep["pods"]:
+                pod = self.pods[uid]
+                if dep["crashloop"]:
+                    self._crash(pod)
+                elif self.rng.random() < self.noise_ratio:
+                    # MODIFIED senza cambi di stato (annotation, condizioni...)
+                    pod.metadata.resource_version = self._next_rv()
+                else:
+                    continue
+                events.append(("pod", {"type": "MODIFIED", "object": pod}))
+
+        if self.ticks % self.namespace_every == 0:
+            events.extend(self._delete_namespace(self.rng.choice(self.namespaces)))
+            events.extend(self._create_namespace())
+        return events
+
+
+# ── MEASUREMENT ─────────────────────────────────────────────────────────────
+
+def deep_sizeof(obj):
+    """Stima in byte di un contenitore e di tutto ciò che contiene (senza doppi conteggi)"""
+    seen = set()
+    stack = [obj]
+    total = 0
+    while stack:
+        o = stack.pop()
+        if id(o) in seen:
+            continue
+        seen.add(id(o))
+        total += sys.getsizeof(o)
+        if isinstance(o, dict):
+            stack.extend(o.keys())
+            stack.extend(o.values())
+        elif isinstance(o, (list, tuple, set, frozenset)):
+            stack.extend(o)
+    return total
+
+
+def measure(debugger):
+    result = {}
+    for name, getter in STRUCTURES.items():
+        try:
+            value = getter(debugger)
+        except AttributeError:
+            continue
+        result[name] = {"len": len(value), "bytes": deep_sizeof(value)}
+    return result
+
+
+def soak(hours, snapshot_minutes, warmup_fraction, seed, sim_options):
+    rng = random.Random(seed)
+    clock = VirtualClock(datetime(2025, 1, 1))
+    clock.install(kubog_v1, kube_alerts, api_profiler)
+
+    tmp = tempfile.TemporaryDirectory()
+    cwd = os.getcwd()
+    os.chdir(REPO_DIR)  # kube-alerts.yaml
+    try:
+        debugger, alerts = build_offline_debugger(offline_args(csv=False, probes=True), out_dir=tmp.name)
+        sim = SimCluster(rng, clock, **sim_options)
+        debugger.v1.nodes = client.V1NodeList(items=[
+            client.V1Node(
+                metadata=client.V1ObjectMeta(name=f"node-{i}"),
+                spec=client.V1NodeSpec(),
+                status=client.V1NodeStatus(
+                    capacity={"cpu": "8", "memory": "32Gi"}, allocatable={"cpu": "8", "memory": "31Gi"},
+                    conditions=[client.V1NodeCondition(type="Ready", status="True")]),
+            ) for i in range(5)
+        ])
+
+        tracemalloc.start(1)
+        total_minutes = int(hours * 60)
+        warmup_minute = int(total_minutes * warmup_fraction)
+        snapshots = []
+        baseline_snapshot = None
+        events_delivered = 0
+
+        # gli ADDED iniziali arrivano come un normale flusso di watch
+        pending = [("namespace", {"type": "ADDED", "object": client.V1Namespace(
+            metadata=client.V1ObjectMeta(name=ns))}) for ns in sim.namespaces]
+        pending += [("pod", {"type": "ADDED", "object": p}) for p in sim.pods.values()]
+
+        for minute in range(1, total_minutes + 1):
+            clock.advance(60)
+            for kind, event in pending + sim.tick():
+                if kind == "pod":
+                    pod = event["object"]
+                    if debugger._should_monitor(pod, pod.metadata.namespace):
+                        debugger._handle_watch_event(event)
+                else:
+                    debugger._handle_namespace_event(event)
+                events_delivered += 1
+            pending = []
+
+            if minute % 10 == 0:
+                debugger.v1.pods = client.V1PodList(items=list(sim.pods.values()))
+                debugger._check_nodes()
+
+            if minute % snapshot_minutes == 0 or minute == warmup_minute:
+                current, _ = tracemalloc.get_traced_memory()
+                snapshots.append({
+                    "virtual_minute": minute,
+                    "live_pods": len(sim.pods),
+                    "events_delivered": events_delivered,
+                    "traced_bytes": current,
+                    "structures": measure(debugger),
+                })
+                print(f"📸 t+{minute // 60}h{minute % 60:02d} traced={current / 1024 / 1024:.1f}MiB "
+                      f"pods={len(sim.pods)} events={events_delivered}", file=sys.stderr)
+                if minute == warmup_minute:
+                    baseline_snapshot = tracemalloc.take_snapshot()
+
+        final_snapshot = tracemalloc.take_snapshot()
+        top = []
+        if baseline_snapshot is not None:
+            for stat in final_snapshot.compare_to(baseline_snapshot, "lineno")[:15]:
+                frame = stat.traceback[0]
+                top.append({"where": f"{os.path.relpath(frame.filename, REPO_DIR)}:{frame.lineno}",
+                            "size_diff_bytes": stat.size_diff, "count_diff": stat.count_diff})
+        tracemalloc.stop()
+    finally:
+        clock.uninstall()
+        os.chdir(cwd)
+        tmp.cleanup()
+
+    return {
+        "virtual_hours": hours,
+        "warmup_minute": warmup_minute,
+        "alerts": dict(alerts),
+        "snapshots": snapshots,
+        "top_growth_since_warmup": top,
+    }
+
+
+def check_bounded(report, max_growth):
+    """Confronta lo snapshot di fine warm-up con l'ultimo: ritorna le violazioni"""
+    snaps = report["snapshots"]
+    base = next((s for s in snaps if s["virtual_minute"] == report["warmup_minute"]), None)
+    if base is None or base is snaps[-1]:
+        return []
+    last = snaps[-1]
+    violations = []
+
+    def grew(before, after):
+        return after > before * (1 + max_growth) and after - before > 64 * 1024
+
+    if grew(base["traced_bytes"], last["traced_bytes"]):
+        violations.append(("traced_memory", base["traced_bytes"], last["traced_bytes"]))
+    for name, after in last["structures"].items():
+        before = base["structures"].get(name)
+        if before and grew(before["bytes"], after["bytes"]):
+            violations.append((name, before["bytes"], after["bytes"]))
+    return violations
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="KuBog long-run memory soak")
+    parser.add_argument("--hours", type=float, default=24, help="Virtual hours to simulate")
+    parser.add_argument("--snapshot-minutes", type=int, default=60)
+    parser.add_argument("--warmup", type=float, default=0.25, help="Fraction of the run treated as warm-up")
+    parser.add_argument("--max-growth", type=float, default=0.10,
+                        help="Allowed growth after warm-up (0.10 = +10%%) for memory and each structure")
+    parser.add_argument("--namespaces", type=int, default=20)
+    parser.add_argument("--deployments", type=int, default=5, help="Deployments per namespace")
+    parser.add_argument("--replicas", type=int, default=3)
+    parser.add_argument("--crashloop-ratio", type=float, default=0.1)
+    parser.add_argument("--seed", type=int, default=42)
+    parser.add_argument("--report", help="Write the JSON report to this file")
+    args = parser.parse_args(argv)
+
+    report_path = os.path.abspath(args.report) if args.report else None
+    report = soak(args.hours, args.snapshot_minutes, args.warmup, args.seed, {
+        "namespaces": args.namespaces, "deployments": args.deployments,
+        "replicas": args.replicas, "crashloop_ratio": args.crashloop_ratio,
+    })
+    violations = check_bounded(report, args.max_growth)
+    report["violations"] = [{"what": w, "before": b, "after": a} for w, b, a in violations]
+
+    text = json.dumps(report, indent=2, default=str)
+    if report_path:
+        with open(report_path, "w") as f:
+            f.write(text)
+    else:
+        print(text)
+
+    last = report["snapshots"][-1]["structures"] if report["snapshots"] else {}
+    for name, m in sorted(last.items(), key=lambda kv: -kv[1]["bytes"]):
+        print(f"📦 {name:<32} len={m['len']:>9}  ~{m['bytes'] / 1024:10.1f} KiB", file=sys.stderr)
+    for what, before, after in violations:
+        print(f"❌ {what} grew from {before} to {after} bytes after warm-up", file=sys.stderr)
+    if violations:
+        return 1
+    print("✅ Memory bounded after warm-up", file=sys.stderr)
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -1,41 +1,74 @@
 #!/usr/bin/env python3
 import os
+import sys
 import csv
+import copy
+import glob
 import argparse
 import re
 import time
-import json
 import threading
 import pandas as pd
-from datetime import datetime
+from datetime import datetime, timedelta
 from kubernetes import client, config, watch
 from kubernetes.client import CustomObjectsApi
 from kubernetes.client.rest import ApiException
 from collections import defaultdict
 from utility.kube_alerts import KubeAlertManager
 from utility.api_profiler import APIProfiler
+from utility.rate_limit import APIRateLimiter, BULK
 from utility.api_usage_analyzer import run_api_analysis
 from utility.root_cause import RootCauseAnalyzer
+from utility.history_compactor import HistoryCompactor
+from utility import history_index
+from utility.sqlite_store import SQLiteStore
+from utility.sharding import ShardCoordinator, LeaseMembership, NODES_KEY, default_identity
+from utility.leader_election import LeaderElector, LeaderOnly, StandbyAlerts
+from utility.watch_replay import WatchRecorder
+from utility.log_capture import LogCapture
+from utility.event_watch import EventAggregator
+from utility.ndjson_sink import NDJSONSink
+from utility.sinks import SinkPipeline, HistorySink, AlertSink, HTTPSink
+from utility.pod_state import PodStateStore, OwnerCache
+from utility.anomaly import load_history, history_seconds, rule_keys
+from utility.node_correlation import NodeConditionIndex, NodeFailureRollup
+from utility.query_api import LiveIndex, LiveQueryAPI
+from utility.diagnostics import Diagnostics
+from utility.scheduler import Scheduler, FIXED_DELAY
+from utility.selectors import resolve_workload_selector, merge_selectors, ACTIVE_POD_FIELD_SELECTOR
+from utility import watch_replay
+from utility import capacity
 
 DEFAULT_NAMESPACE = "test"
 INTERVAL_SEC = 60
 OUTPUT_DIR = os.getenv('OUTPUT_DIR', '.')
 
+# pyplot non è thread-safe: un'analisi API alla volta (con --contexts ce n'è una per cluster)
+_ANALYSIS_LOCK = threading.Lock()
+_UNRESOLVED = object()  # owner di un ReplicaSet non ancora in cache (None è un valore valido)
+
 class PodRestartDebugger:
-    def __init__(self, args):
+    def __init__(self, args, cluster=None, shared=None):
         self.args = args
+        # --contexts: un debugger per cluster; `shared` è il primo, di cui si riusano alert e sink
+        self.cluster = cluster
+        self.base_dir = os.path.join(os.getcwd(), "clusters", cluster) if cluster else os.getcwd()
         self.recorded_events = set()
-        self.previous_states = {}
         self.node_status_cache = {}
         self.watchers = {}
         self.v1 = None
         self.apps_v1 = None
+        self.metrics_api = None
+        self.batch_v1 = None
         self.monitored_workloads = self._parse_workloads()
+        self.workload_selectors = {}  # {namespace: label selector dei workload monitorati}
         self.resource_versions = {}  # {namespace: resource_version}
         self.watch_retry_delay = 5  # seconds between retries
         self.max_retry_delay = 60  # maximum retry delay
         self.backoff_factor = 1.5  # exponential backoff factor
-        self.pod_workloads = {}
+        self.pod_states = PodStateStore()  # {pod uid: workload, fingerprint, stato dei container}
+        self.fingerprint_stats = defaultdict(int)  # checked / skipped
+        self.replicaset_owners = OwnerCache()  # {(namespace, replicaset): deployment name or None}, LRU
 
         self._teams_warning_printed = False
         self._email_warning_printed = False
@@ -55,15 +88,138 @@ class PodRestartDebugger:
             # Probe fields
             "probe_type", "probe_message",
             # Node fields
-            "node", "conditions", "capacity", "allocatable"
+            "node", "conditions", "capacity", "allocatable",
+            # Occorrenze di una riga aggregata (Event di --events): storico, indice e baseline contano questo
+            "count"
         ]
 
-        self.alert_manager = KubeAlertManager("kube-alerts.yaml")
+        self.alert_manager = shared.alert_manager if shared else KubeAlertManager("kube-alerts.yaml")
+
+        # finestre recenti delle condizioni dei nodi: i fallimenti dei pod vengono attribuiti
+        # al nodo e accorpati nel suo alert (condivisi tra cluster, chiave (cluster, nodo))
+        if shared:
+            self.node_conditions = shared.node_conditions
+            self.node_rollup = shared.node_rollup
+        else:
+            self.node_conditions = NodeConditionIndex(grace=2 * INTERVAL_SEC, max_gap=3 * INTERVAL_SEC)
+            self.node_rollup = NodeFailureRollup(self.alert_manager)
 
-        self.api_profiler = APIProfiler()  # Profilatore API
+        # QPS/burst lato client verso l'API server (uno per cluster), applicato da APIProfiler.profile
+        self.api_limiter = None
+        if getattr(args, "api_qps", 0):
+            self.api_limiter = APIRateLimiter(args.api_qps, args.api_burst)
+        self.api_profiler = APIProfiler(self.api_limiter)  # Profilatore API
 
         self._warmup = True
 
+        # serializza append CSV e compattazione dello storico
+        self._csv_lock = threading.Lock()
+        self.compactor = None
+        if getattr(args, "retention_days", None):
+            self.compactor = HistoryCompactor(self.base_dir, args.retention_days, lock=self._csv_lock)
+
+        # --store sqlite: eventi e righe nodo vanno nel DB invece che nei CSV
+        self.store = None
+        if getattr(args, "store", "csv") == "sqlite":
+            os.makedirs(self.base_dir, exist_ok=True)
+            self.store = SQLiteStore(os.path.join(self.base_dir, "kubog_history.db"), self.all_columns)
+            print(f"🗄️ SQLite store enabled: {os.path.join(self.base_dir, 'kubog_history.db')}")
+
+        self.shard = None  # ShardCoordinator quando --shard è attivo
+
+        self.log_capture = None  # creato in setup_clients con --capture-logs
+
+        # --events: Event core/v1 (Unhealthy, BackOff, Evicted...) aggregati per count
+        self.event_watcher = None
+        if getattr(args, "events", False):
+            self.event_watcher = EventAggregator(self, flush_interval=args.events_flush)
+
+        # --ha: tutti i replica osservano e tengono le cache calde, solo il titolare del Lease
+        # scrive lo storico e invia gli alert (l'API del Lease arriva da setup_clients)
+        self.leader = None
+        self.standby_alerts = None  # alert che lo standby avrebbe inviato, inviati alla promozione
+        if shared:
+            self.leader = shared.leader
+            self.standby_alerts = shared.standby_alerts
+        elif getattr(args, "ha", False):
+            self.leader = LeaderElector(
+                None, args.lease_namespace, f"kubog-{args.shard_group}-leader", args.shard_id or default_identity(),
+                lease_seconds=args.ha_lease_seconds, retry_seconds=max(1, args.ha_lease_seconds // 5),
+            )
+            self.standby_alerts = StandbyAlerts(self.leader)
+
+        # Diagnostica a richiesta (SIGUSR1/SIGUSR2, /debug/*): una per processo, inattiva finché non serve
+        self.diagnostics = shared.diagnostics if shared else Diagnostics(
+            getattr(args, "diagnostics_dir", None) or os.path.join(os.getcwd(), "diagnostics"),
+            profile_seconds=getattr(args, "profile_seconds", 30),
+        )
+
+        # Output degli eventi: ogni destinazione è un sink con coda e thread propri
+        self._owns_sinks = shared is None  # le statistiche dei sink le stampa solo chi li possiede
+        if shared:
+            # una sola pipeline per tutti i cluster: lo storico instrada per `cluster`
+            self.sinks = shared.sinks
+            self.history_sink = shared.history_sink
+            self.log_sink = shared.log_sink
+            self.query_index = shared.query_index
+            if self.history_sink:
+                self.history_sink.add(self)
+        else:
+            self._setup_sinks()
+
+        self.query_api = None  # LiveQueryAPI, avviata da _start_query_api
+
+        self.recorder = None
+        if getattr(args, "record", None):
+            self.recorder = WatchRecorder(args.record)
+            print(f"⏺️ Recording watch streams to {args.record}")
+
+    def _setup_sinks(self):
+        args = self.args
+        self.sinks = SinkPipeline()
+        self.history_sink = None
+        if self.store or args.csv:
+            self.history_sink = HistorySink(self)
+            self.sinks.add(self._leader_only(self.history_sink))
+        self.sinks.add(AlertSink(self))  # sullo standby aggiorna solo finestre e cooldown
+
+        # JSON log stream (--logs / --service-account): scritto a blocchi dal worker della pipeline, non print per riga
+        self.log_sink = None
+        if args.service_account or args.logs:
+            self.log_sink = self.sinks.add(self._leader_only(NDJSONSink(
+                getattr(args, "logs_file", None),
+                max_bytes=getattr(args, "logs_max_bytes", None),
+                rotate_seconds=getattr(args, "logs_rotate_seconds", None),
+                compression=getattr(args, "logs_compress", None),
+            )))
+        for url in getattr(args, "sink_http", None) or []:
+            self.sinks.add(self._leader_only(HTTPSink(url)))
+        # --query-port: indici in memoria per la query API HTTP
+        self.query_index = self.sinks.add(LiveIndex()) if getattr(args, "query_port", None) else None
+
+    def _leader_only(self, sink):
+        return LeaderOnly(sink, self.leader) if self.leader else sink
+
+    def _is_active(self):
+        """False sullo standby di --ha: osserva e tiene le cache calde, ma non scrive né invia"""
+        return self.leader is None or self.leader.is_leader()
+
+    def _send_alert(self, send, event, rule):
+        """Invio Teams/email; sullo standby di --ha resta in coda fino all'eventuale promozione"""
+        if self.standby_alerts:
+            self.standby_alerts.send(send, event, rule)
+        else:
+            send(event, rule)
+
+    def _start_query_api(self, debuggers):
+        """Avvia la query API HTTP su tutti i cluster del processo (chiamata sul primo debugger)"""
+        if self.query_index:
+            try:
+                self.query_api = LiveQueryAPI(self.query_index, debuggers, host=self.args.query_host,
+                                              port=self.args.query_port, diagnostics=self.diagnostics).start()
+            except OSError as e:
+                print(f"⚠️ Query API not started: {e}")
+
     def _parse_workloads(self):
         """Parse workload filters from command line arguments"""
         workloads = {}
@@ -85,25 +241,67 @@ class PodRestartDebugger:
     def setup_clients(self):
         """Initialize all Kubernetes API clients"""
         try:
+            # ApiClient dedicato (uno per cluster con --contexts) con pool dimensionato sui thread:
+            # con il default di urllib3 i watch saturano il pool e ogni lookup apre una connessione nuova
+            configuration = client.Configuration()
             if self.args.service_account:
-                config.load_incluster_config()
+                config.load_incluster_config(client_configuration=configuration)
                 print("✅ Using in-cluster configuration")
             else:
-                config.load_kube_config(context=self.args.context)
-                print(f"✅ Using context: {self.args.context or 'current'}")
-
-            self.v1 = client.CoreV1Api()
-            self.apps_v1 = client.AppsV1Api()
-
-            self.root_cause = RootCauseAnalyzer(self.v1, self.apps_v1)
+                context = self.cluster or self.args.context
+                config.load_kube_config(context=context, client_configuration=configuration)
+                print(f"✅ Using context: {context or 'current'}")
+            configuration.connection_pool_maxsize = self._api_pool_size()
+            api_client = client.ApiClient(configuration)
+
+            self.v1 = client.CoreV1Api(api_client)
+            self.apps_v1 = client.AppsV1Api(api_client)
+            self.batch_v1 = client.BatchV1Api(api_client)
+            self.metrics_api = CustomObjectsApi(api_client)
+
+            self.root_cause = RootCauseAnalyzer(self.v1, self.apps_v1, self.metrics_api, self.api_profiler)
+
+            if getattr(self.args, "capture_logs", False):
+                self.log_capture = self.sinks.add(self._leader_only(LogCapture(
+                    self.v1, self.base_dir, cluster=self.cluster, profiler=self.api_profiler,
+                    workers=self.args.log_workers,
+                    tail_lines=self.args.log_tail_lines,
+                    limit_bytes=self.args.log_limit_bytes,
+                    rate_per_minute=self.args.log_rate,
+                )))
+                print(f"📜 Previous-container log capture enabled ({self.args.log_workers} workers)")
 
             print("🧠 Root Cause Analyzer enabled!")
 
-
+            if getattr(self.args, "shard", False):
+                membership = LeaseMembership(
+                    client.CoordinationV1Api(api_client),
+                    self.args.lease_namespace,
+                    self.args.shard_group,
+                    self.args.shard_id or default_identity(),
+                )
+                self.shard = ShardCoordinator(self, membership)
+                print(f"🧩 Sharding enabled: replica {membership.identity} in group {self.args.shard_group}")
+
+            if self.leader and self.leader.api is None:
+                self.leader.api = client.CoordinationV1Api(api_client)
+                print(f"👥 HA mode: replica {self.leader.identity}, lease {self.args.lease_namespace}/"
+                      f"{self.leader.name} ({self.leader.lease_seconds}s)")
+                self.leader.start()
+
+            if self.api_limiter:
+                print(f"🚦 API rate limit: {self.args.api_qps} QPS, burst {self.args.api_burst}, "
+                      f"pool {configuration.connection_pool_maxsize} connections")
             return True
         except Exception as e:
             print(f"❌ Client setup failed: {e}")
             return False
+
+    def _api_pool_size(self):
+        """--api-pool-size, oppure: un watch per namespace + lookup, log capture, sink e task periodici"""
+        if getattr(self.args, "api_pool_size", None):
+            return self.args.api_pool_size
+        return len(self.args.namespaces) + getattr(self.args, "log_workers", 0) + 16
         
     def _start_namespace_watcher(self):
         """
@@ -118,18 +316,65 @@ class PodRestartDebugger:
 
         def namespace_watch_loop():
             for event in w.stream(self.v1.list_namespace, timeout_seconds=0):
-                ns = event["object"].metadata.name
-                if event["type"] == "ADDED" and ns not in self.args.namespaces:
-                    print(f"🆕 New namespace detected: {ns}")
-                    self.args.namespaces.append(ns)
-                    self._process_namespace(ns)
-                    if self.args.watch:
-                        self._start_watcher(ns)
-                elif event["type"] == "DELETED" and ns in self.args.namespaces:
-                    print(f"🗑️ Namespace removed: {ns}")
-                    self.args.namespaces.remove(ns)
-
-        threading.Thread(target=namespace_watch_loop, daemon=True).start()
+                if self.recorder:
+                    self.recorder.record_watch("namespace", event)
+                self._handle_namespace_event(event)
+
+        threading.Thread(target=namespace_watch_loop, name=self._thread_name("watch-namespaces"), daemon=True).start()
+
+    def _handle_namespace_event(self, event):
+        ns = event["object"].metadata.name
+        if self.shard:
+            # con lo sharding l'acquisizione avviene al prossimo rebalance
+            if event["type"] == "ADDED":
+                self.shard.add_namespace(ns)
+            elif event["type"] == "DELETED":
+                self.shard.remove_namespace(ns)
+            return
+        if event["type"] == "ADDED" and ns not in self.args.namespaces:
+            print(f"🆕 New namespace detected: {ns}")
+            self.args.namespaces.append(ns)
+            self._process_namespace(ns)
+            if self.args.watch:
+                self._start_watcher(ns)
+        elif event["type"] == "DELETED" and ns in self.args.namespaces:
+            self._remove_namespace(ns)
+
+    def _remove_namespace(self, namespace):
+        """Namespace cancellato (watch dei namespace, entrambi gli engine): fuori dal monitoraggio, stato dei pod rimosso"""
+        print(f"🗑️ Namespace removed: {namespace}")
+        self._stop_watcher(namespace)
+        self.resource_versions.pop(namespace, None)
+
+    def _resolve_selectors(self):
+        """
+        Calcola il label selector dei pod per ogni namespace con --workloads,
+        così list e watch filtrano lato server. Ritorna i namespace il cui selector è cambiato.
+        """
+        changed = set()
+        for ns, names in self.monitored_workloads.items():
+            selectors = []
+            for name in names:
+                try:
+                    selectors.append(self.api_profiler.profile(
+                        "read", "workloads", ns,
+                        lambda: resolve_workload_selector(self.apps_v1, self.batch_v1, ns, name)
+                    ))
+                except Exception as e:
+                    print(f"⚠️ Failed to resolve selector for {ns}/{name}: {e}")
+                    selectors.append(None)
+            merged = merge_selectors(selectors)
+            if merged is None and ns not in self.workload_selectors:
+                print(f"⚠️ No common label selector for workloads in {ns}: filtering client-side")
+            if self.workload_selectors.get(ns, merged) != merged or ns not in self.workload_selectors:
+                changed.add(ns)
+            self.workload_selectors[ns] = merged
+        return changed
+
+    def _pod_list_kwargs(self, namespace):
+        """Argomenti extra per list/watch dei pod di un namespace (label selector dei workload)"""
+        selector = self.workload_selectors.get(namespace)
+        return {"label_selector": selector} if selector else {}
 
     def _should_monitor(self, pod, namespace):
         """Check if pod should be monitored based on workload filters"""
@@ -142,15 +387,9 @@ class PodRestartDebugger:
         for owner in pod.metadata.owner_references:
             if owner.kind == 'ReplicaSet':
                 try:
-                    rs = self.apps_v1.read_namespaced_replica_set(
-                        owner.name, 
-                        namespace
-                    )
-                    if rs.metadata.owner_references:
-                        for rs_owner in rs.metadata.owner_references:
-                            if rs_owner.kind == 'Deployment':
-                                if namespace in self.monitored_workloads:
-                                    return rs_owner.name in self.monitored_workloads[namespace]
+                    deployment = self._replicaset_owner(owner.name, namespace)
+                    if deployment and namespace in self.monitored_workloads:
+                        return deployment in self.monitored_workloads[namespace]
                 except Exception:
                     continue
             elif owner.kind in ['Deployment', 'StatefulSet', 'Job', 'CronJob', 'DaemonSet']:
@@ -167,20 +406,28 @@ class PodRestartDebugger:
         for owner in pod.metadata.owner_references:
             if owner.kind == 'ReplicaSet':
                 try:
-                    rs = self.api_profiler.profile(
-                        "read", "replicasets", pod.metadata.namespace,
-                        lambda: self.apps_v1.read_namespaced_replica_set(owner.name, pod.metadata.namespace)
-                    )
-                    if rs.metadata.owner_references:
-                        for rs_owner in rs.metadata.owner_references:
-                            if rs_owner.kind == 'Deployment':
-                                return f"Deployment/{rs_owner.name}"
+                    deployment = self._replicaset_owner(owner.name, pod.metadata.namespace)
+                    if deployment:
+                        return f"Deployment/{deployment}"
                 except Exception:
                     continue
             elif owner.kind in ['Deployment', 'StatefulSet', 'Job', 'CronJob', 'DaemonSet']:
                 return f"{owner.kind}/{owner.name}"
         return "Unknown"
 
+    def _replicaset_owner(self, name, namespace):
+        """Deployment proprietario di un ReplicaSet (in cache: l'owner di un RS non cambia)"""
+        key = (namespace, name)
+        owner = self.replicaset_owners.get(key, _UNRESOLVED)
+        if owner is _UNRESOLVED:
+            rs = self.api_profiler.profile(
+                "read", "replicasets", namespace,
+                lambda: self.apps_v1.read_namespaced_replica_set(name, namespace)
+            )
+            owner = next((o.name for o in rs.metadata.owner_references or [] if o.kind == 'Deployment'), None)
+            self.replicaset_owners[key] = owner
+        return owner
+
     def _has_termination(self, container):
         """Check if container has terminated since last check"""
         if not (hasattr(container, 'last_state') and 
@@ -239,16 +486,18 @@ class PodRestartDebugger:
     def _check_state_change(self, pod, container):
         """Detect container state changes"""
         current_state = self._get_container_state(container)
-        state_id = f"{pod.metadata.uid}-{container.name}"
-        
-        if state_id in self.previous_states and self.previous_states[state_id] != current_state:
-            change = {
+        containers = self.pod_states.slot(pod.metadata.uid, pod.metadata.namespace, pod.metadata.name).containers
+        previous_state = containers.get(container.name)
+        containers[container.name] = current_state
+
+        if previous_state is not None and previous_state != current_state:
+            return {
                 "timestamp": datetime.now().isoformat(),
                 "namespace": pod.metadata.namespace,
                 "type": "STATE_CHANGE",
                 "pod": pod.metadata.name,
                 "container": container.name,
-                "from": self.previous_states[state_id],
+                "from": previous_state,
                 "to": current_state,
                 "workload": self._get_workload(pod),
                 "resource_version": pod.metadata.resource_version,
@@ -257,10 +506,6 @@ class PodRestartDebugger:
                     "from", "to", "workload", "resource_version"
                 ]}
             }
-            self.previous_states[state_id] = current_state
-            return change
-            
-        self.previous_states[state_id] = current_state
         return None
 
     def _get_container_state(self, container):
@@ -279,54 +524,196 @@ class PodRestartDebugger:
         if self.args.workloads:
             print(f"   Specific workloads: {', '.join(self.args.workloads)}")
 
-        
-        # Initial sync
-        for ns in self.args.namespaces:
-            self._process_namespace(ns)
-            
+        if getattr(self.args, "engine", "threads") == "asyncio":
+            from utility.async_engine import AsyncWatchEngine
+            self._upgrade_csv_headers()
+            self._backfill_baselines()
+            periodic = [(5 * 60, self._write_reports)]
             if self.args.watch:
-                self._start_watcher(ns)
+                periodic.append((3600, self._reconcile_pod_states))
+            if self.alert_manager.baselines.tracked:
+                periodic.append((3600, self._prune_baselines))
+            if self.compactor:
+                periodic.append((3600, self.compactor.compact))
+            self._start_query_api([self])
+            self.diagnostics.install_signals()
+            AsyncWatchEngine(self, INTERVAL_SEC, periodic).run()
+            return
+
+        run_clusters([self])
 
-        # Fine warm-up: pulisco tutti gli eventi già raccolti, 
+    def _start(self):
+        """Sync iniziale, watch ed Event watcher"""
+        self._upgrade_csv_headers()
+        self._backfill_baselines()
+        if self.monitored_workloads:
+            self._resolve_selectors()
+
+        # Initial sync
+        if self.shard:
+            namespaces = list(self.args.namespaces)
+            self.args.namespaces.clear()
+            self.shard.start(namespaces)
+        else:
+            for ns in self.args.namespaces:
+                self._process_namespace(ns)
+
+                if self.args.watch:
+                    self._start_watcher(ns)
+
+        self._end_warmup()
+
+        if self.event_watcher:
+            self.event_watcher.start()
+
+    def _backfill_baselines(self):
+        """Baseline delle regole `type: anomaly` dallo storico (CSV o SQLite) di questo cluster"""
+        baselines = self.alert_manager.baselines
+        if not baselines.tracked:
+            return
+        start = time.time()
+        since = datetime.now() - timedelta(days=baselines.backfill_days)
+        try:
+            df = load_history(self.base_dir, self.store.path if self.store else None, since=since)
+            keys = rule_keys(df, self.alert_manager.config.get("kube-alerts", {}).keys())
+            tracked = keys.isin(baselines.tracked)
+            df, keys = df[tracked], keys[tracked]
+            ns = df["namespace"].fillna("-")
+            if self.cluster:
+                ns = self.cluster + "/" + ns
+            workload = df["workload"].fillna("Unknown")
+            loaded = baselines.backfill(history_seconds(df["timestamp"]), zip(ns, workload, keys),
+                                        weights=pd.to_numeric(df["count"], errors="coerce").fillna(1).to_numpy())
+        except Exception as e:
+            print(f"⚠️ Anomaly baseline backfill failed: {e}")
+            return
+        print(f"📈 Anomaly baselines: {loaded} series from {len(df)} history rows in {time.time() - start:.1f}s")
+
+    def _tick_nodes(self):
+        if self.args.nodes and (not self.shard or self.shard.owns(NODES_KEY)):
+            self._check_nodes()
+
+    def _refresh_selectors(self):
+        # selector cambiato: il watch riparte con quello nuovo
+        for ns in self._resolve_selectors():
+            if ns in self.watchers:
+                self.watchers[ns].stop()
+
+    def _schedule(self, scheduler):
+        """Registra i task periodici di questo cluster"""
+        prefix = f"{self.cluster}/" if self.cluster else ""
+        if self.args.nodes:
+            scheduler.every(prefix + "nodes", INTERVAL_SEC, self._tick_nodes, budget=INTERVAL_SEC)
+        scheduler.every(prefix + "summary", 5 * 60, self._write_summary, jitter=5, initial_delay=5 * 60)
+        scheduler.every(prefix + "api_analysis", 5 * 60, self._write_api_analysis, mode=FIXED_DELAY,
+                        jitter=15, budget=60, initial_delay=5 * 60)
+        scheduler.every(prefix + "stats", 5 * 60, self._print_stats, initial_delay=5 * 60)
+        if self.monitored_workloads:
+            scheduler.every(prefix + "selectors", 5 * 60, self._refresh_selectors, jitter=15, initial_delay=5 * 60)
+        if self.args.watch:
+            scheduler.every(prefix + "reconcile", 3600, self._reconcile_pod_states, mode=FIXED_DELAY,
+                            jitter=60, initial_delay=3600)
+        if self.alert_manager.baselines.tracked:
+            scheduler.every(prefix + "baselines", 3600, self._prune_baselines, jitter=60, initial_delay=3600)
+        if self.compactor:
+            scheduler.every(prefix + "compaction", 3600, self.compactor.compact, mode=FIXED_DELAY,
+                            jitter=60, initial_delay=3600)
+
+    def _prune_baselines(self):
+        pruned = self.alert_manager.baselines.prune()
+        if pruned:
+            print(f"🧹 Anomaly baselines: {pruned} idle series pruned")
+
+    def _end_warmup(self):
+        # Fine warm-up: pulisco tutti gli eventi già raccolti,
         # così da partire “da zero” per gli alert
         self.recorded_events.clear()
         self.all_recent_events.clear()
         self._warmup = False
         print("✅ Warm-up completed, from now on only new events will alert.")
-        
-        # Main monitoring loop
-        try:
-            while True:
-                if self.args.nodes:
-                    self._check_nodes()
-                time.sleep(INTERVAL_SEC)
-                if int(time.time()) % (5 * 60) < INTERVAL_SEC:
-                    generate_summary_csv(self.all_recent_events, self.args)
-                    run_api_analysis(self.api_profiler.records, output_dir="api_analyzer")
-        except KeyboardInterrupt:
-            self._cleanup()
-            print("\n🛑 Monitoring stopped")
+
+    def _write_reports(self):
+        """Summary CSV, analisi API e statistiche (ogni 5 minuti)"""
+        self._write_summary()
+        self._write_api_analysis()
+        self._print_stats()
+
+    def _write_summary(self):
+        if not self._is_active():
+            return
+        generate_summary_csv(self.all_recent_events, self.args, output_dir=self.base_dir)
+
+    def _write_api_analysis(self):
+        if not self._is_active():
+            return
+        with _ANALYSIS_LOCK:
+            run_api_analysis(self.api_profiler.records, output_dir=os.path.join(self.base_dir, "api_analyzer"))
+
+    def _print_stats(self):
+        if self.fingerprint_stats["checked"]:
+            print(f"⏭️ Unchanged pod events skipped: {self.fingerprint_stats['skipped']}/"
+                  f"{self.fingerprint_stats['checked']} ({self._fingerprint_skip_ratio():.1%})")
+        stats = self.pod_states.stats
+        print(f"🗂️ Pod state store: {len(self.pod_states)} pods "
+              f"(hits {stats['hits']}, misses {stats['misses']}, evicted {stats['evicted']})")
+        if self.api_limiter:
+            print(f"🚦 API calls: {self.api_limiter.summary()}")
+        if self.alert_manager.baselines.tracked:
+            print(f"📈 Anomaly baselines: {len(self.alert_manager.baselines)} series")
+        if self._owns_sinks and self.sinks.workers:
+            print(f"📤 Sinks: {self.sinks.summary()}")
+        if self._owns_sinks and self.log_sink:
+            print(f"🧾 JSON logs: {self.log_sink.summary()}")
+        rollup = self.node_rollup.stats
+        if rollup["attributed"]:
+            print(f"🔗 Node correlation: {rollup['attributed']} pod failures attributed, "
+                  f"{rollup['rollups']} node rollup alerts")
+
+    def _reconcile_pod_states(self):
+        """Allinea lo store dei pod alle liste live (DELETED persi durante riconnessioni dei watch)"""
+        namespaces = set(self.args.namespaces)
+        evicted = self.pod_states.retain_namespaces(namespaces)
+        listed, referenced = set(), set()  # ReplicaSet ancora usati dai pod vivi
+        for ns in list(self.args.namespaces):
+            try:
+                pods = self.api_profiler.profile("list", "pods", ns, lambda: self.v1.list_namespaced_pod(ns, **self._pod_list_kwargs(ns)), priority=BULK)
+            except ApiException as e:
+                print(f"⚠️ API error in {ns}: {e}")
+                continue
+            evicted += self.pod_states.reconcile(ns, {p.metadata.uid for p in pods.items})
+            listed.add(ns)
+            referenced.update((ns, o.name) for p in pods.items
+                              for o in p.metadata.owner_references or [] if o.kind == "ReplicaSet")
+        owners = self.replicaset_owners.retain(namespaces, listed, referenced)
+        if evicted or owners:
+            print(f"🧹 Pod state reconciliation: {evicted} stale pods, {owners} stale ReplicaSet owners evicted")
 
     def _process_namespace(self, namespace):
         """Process all pods in a namespace"""
         try:
-            pods = self.api_profiler.profile("list", "pods", namespace, lambda: self.v1.list_namespaced_pod(namespace))
-            # Store the latest resource version
-            self.resource_versions[namespace] = pods.metadata.resource_version
-            
-            debug_data = []
-            
-            for pod in pods.items:
-                if not self._should_monitor(pod, namespace):
-                    continue
-                    
-                debug_data.extend(self._process_pod(pod))
-            
-            self._output(debug_data, namespace)
-            
+            pods = self.api_profiler.profile("list", "pods", namespace, lambda: self.v1.list_namespaced_pod(namespace, **self._pod_list_kwargs(namespace)), priority=BULK)
+            self._process_pod_list(namespace, pods)
         except ApiException as e:
             print(f"⚠️ API error in {namespace}: {e}")
 
+    def _process_pod_list(self, namespace, pods):
+        """Elabora il risultato di un list dei pod di un namespace"""
+        # Store the latest resource version
+        self.resource_versions[namespace] = pods.metadata.resource_version
+
+        debug_data = []
+
+        for pod in pods.items:
+            if not self._should_monitor(pod, namespace):
+                continue
+
+            debug_data.extend(self._process_pod(pod))
+
+        # la lista è lo stato live del namespace: via i pod spariti
+        self.pod_states.reconcile(namespace, {pod.metadata.uid for pod in pods.items})
+
+        self._output(debug_data, namespace)
+
     def _process_pod(self, pod):
         """Process a single pod and its containers"""
         debug_data = []
@@ -345,11 +732,13 @@ class PodRestartDebugger:
                     "container": container.name,
                     "exit_code": container.state.terminated.exit_code,
                     "message": "OOMKilled",
+                    "finished_at": (container.state.terminated.finished_at.isoformat()
+                                    if container.state.terminated.finished_at else None),
                     "workload": self._get_workload(pod),
                     "resource_version": pod.metadata.resource_version,
                     **{col: None for col in self.all_columns if col not in [
                         "timestamp", "namespace", "type", "pod", "container", 
-                        "exit_code", "message", "workload", "resource_version"
+                        "exit_code", "message", "finished_at", "workload", "resource_version"
                     ]}
                 })
 
@@ -368,7 +757,13 @@ class PodRestartDebugger:
                 state_change = self._check_state_change(pod, container)
                 if state_change:
                     debug_data.append(state_change)
-                    
+
+        # le label servono solo se qualche override di alert ha un label selector
+        labels = pod.metadata.labels if self.alert_manager.rules.uses_labels else None
+        for entry in debug_data:
+            entry["node"] = pod.spec.node_name
+            if labels is not None:
+                entry["labels"] = labels
         return debug_data
 
     def _create_debug_info(self, pod, container, event_type):
@@ -406,7 +801,8 @@ class PodRestartDebugger:
         # Initialize resource version if not exists
         if namespace not in self.resource_versions:
             try:
-                pods = self.v1.list_namespaced_pod(namespace)
+                # serve solo la resourceVersion della lista: limit=1 evita di scaricare tutti i pod
+                pods = self._latest_pod_list(namespace)
                 self.resource_versions[namespace] = pods.metadata.resource_version
             except Exception as e:
                 print(f"⚠️ Failed to get initial resource version for {namespace}: {e}")
@@ -419,19 +815,25 @@ class PodRestartDebugger:
             current_delay = self.watch_retry_delay
             retry_count = 0  # <--- aggiunto contatore
 
-            while True:
+            # il loop termina quando il watcher viene rimosso (_stop_watcher / cleanup)
+            while self.watchers.get(namespace) is w:
                 try:
                     print(f"🔄 Starting watch for namespace {namespace} (resourceVersion: {self.resource_versions[namespace]})")
+                    # le riconnessioni di tutti i watch dopo un riavvio dell'API server sono bulk
+                    self.api_profiler.throttle(BULK)
 
                     stream = w.stream(
                         self.v1.list_namespaced_pod,
                         namespace,
                         resource_version=self.resource_versions[namespace],
-                        timeout_seconds=300
+                        timeout_seconds=300,
+                        **self._pod_list_kwargs(namespace)
                     )
 
                     for event in stream:
                         try:
+                            if self.recorder:
+                                self.recorder.record_watch("pod", event, namespace)
                             self.resource_versions[namespace] = event['object'].metadata.resource_version
                             if event['type'] in ('ADDED', 'MODIFIED', 'DELETED'):
                                 pod = event['object']
@@ -444,6 +846,8 @@ class PodRestartDebugger:
                             continue
 
                 except Exception as e:
+                    if self.watchers.get(namespace) is not w:
+                        return
                     print(f"⚠️ Watch connection error in {namespace}: {str(e)}")
                     print(f"⏳ Retrying in {current_delay} seconds...")
 
@@ -463,7 +867,7 @@ class PodRestartDebugger:
 
                     # Prova ad aggiornare la resourceVersion
                     try:
-                        pods = self.v1.list_namespaced_pod(namespace)
+                        pods = self._latest_pod_list(namespace)
                         self.resource_versions[namespace] = pods.metadata.resource_version
                         print(f"🔄 Updated resource version for {namespace}: {self.resource_versions[namespace]}")
                     except Exception as version_e:
@@ -471,16 +875,125 @@ class PodRestartDebugger:
                         continue
 
 
-        threading.Thread(target=watch_loop, daemon=True).start()
+        # il nome del thread identifica il namespace nei dump degli stack e nei profili
+        threading.Thread(target=watch_loop, name=self._thread_name(f"watch-pods/{namespace}"), daemon=True).start()
+
+    def _thread_name(self, name):
+        return f"{name}@{self.cluster}" if self.cluster else name
+
+    def _latest_pod_list(self, namespace):
+        """List con limit=1: solo per la resourceVersion corrente"""
+        return self.api_profiler.profile(
+            "list", "pods", namespace,
+            lambda: self.v1.list_namespaced_pod(namespace, limit=1, **self._pod_list_kwargs(namespace)),
+            priority=BULK,
+        )
+
+    def _stop_watcher(self, namespace):
+        """Ferma il watch di un namespace e lo toglie dal monitoraggio"""
+        w = self.watchers.pop(namespace, None)
+        if w:
+            w.stop()
+        if namespace in self.args.namespaces:
+            self.args.namespaces.remove(namespace)
+        self.pod_states.reconcile(namespace, set())
+
+    def _acquire_namespace(self, namespace, resource_version=None):
+        """
+        Inizia a monitorare un namespace assegnato a questo shard.
+        Lo stato dei pod viene caricato senza emettere nulla (come nel warm-up), alla
+        resourceVersion ereditata dal replica precedente quando c'è: il watch riparte da lì
+        e rielabora solo quello che il replica precedente non ha visto.
+        """
+        if namespace not in self.args.namespaces:
+            self.args.namespaces.append(namespace)
+        if resource_version:
+            print(f"📥 Shard hand-off: resuming {namespace} at resourceVersion {resource_version}")
+        else:
+            print(f"📥 Shard acquired namespace {namespace}")
+        try:
+            self._seed_namespace(namespace, resource_version)
+        except ApiException as e:
+            print(f"⚠️ API error in {namespace}: {e}")
+        if self.args.watch:
+            self._start_watcher(namespace)
+
+    def _seed_namespace(self, namespace, resource_version=None):
+        """
+        Registra pod, fingerprint, stati dei container e terminazioni già avvenute di un namespace
+        senza produrre output, così il primo MODIFIED di un pod non rilancia le sue vecchie terminazioni.
+        Con `resource_version` il list è a quella versione esatta; se non è più disponibile
+        (compattata, 410) si parte dallo stato corrente.
+        """
+        kwargs = self._pod_list_kwargs(namespace)
+        pods = None
+        if resource_version:
+            try:
+                pods = self.api_profiler.profile(
+                    "list", "pods", namespace,
+                    lambda: self.v1.list_namespaced_pod(namespace, resource_version=resource_version,
+                                                        resource_version_match="Exact", **kwargs),
+                    priority=BULK,
+                )
+            except ApiException as e:
+                print(f"⚠️ resourceVersion {resource_version} of {namespace} not available ({e.status}), "
+                      f"starting from the current state")
+        if pods is None:
+            pods = self.api_profiler.profile(
+                "list", "pods", namespace, lambda: self.v1.list_namespaced_pod(namespace, **kwargs), priority=BULK)
+
+        self.resource_versions[namespace] = pods.metadata.resource_version
+        for pod in pods.items:
+            if not self._should_monitor(pod, namespace):
+                continue
+            state = self.pod_states.slot(pod.metadata.uid, namespace, pod.metadata.name)
+            state.fingerprint = self._pod_fingerprint(pod)
+            state.workload = self._get_workload(pod)
+            state.labels = pod.metadata.labels
+            self._process_pod(pod)  # segna terminazioni e stati dei container come già visti; output scartato
+        self.pod_states.reconcile(namespace, {pod.metadata.uid for pod in pods.items})
+
+    def _pod_fingerprint(self, pod):
+        """Solo i campi che _process_pod guarda: stato, last_state.terminated e restart dei container"""
+        statuses = (pod.status.container_statuses if pod.status else None) or []
+        fingerprint = []
+        for c in statuses:
+            state = c.state
+            term = state.terminated if state else None
+            last = c.last_state.terminated if c.last_state else None
+            fingerprint.append((
+                c.name,
+                c.restart_count,
+                bool(state and state.running),
+                state.waiting.reason if state and state.waiting else None,
+                (term.reason, term.exit_code, term.finished_at) if term else None,
+                last.finished_at if last else None,
+            ))
+        return tuple(fingerprint)
+
+    def _fingerprint_skip_ratio(self):
+        checked = self.fingerprint_stats["checked"]
+        return self.fingerprint_stats["skipped"] / checked if checked else 0.0
 
     def _handle_watch_event(self, event):
         pod = event['object']
         pod_uid = pod.metadata.uid
+
         if event['type'] == 'DELETED':
-            workload = self.pod_workloads.get(pod_uid, "Unknown")
+            state = self.pod_states.get(pod_uid)
+            workload = state.workload if state and state.workload else "Unknown"
         else:
+            # MODIFIED che non toccano i container (annotation, condition, resourceVersion): nulla da fare
+            state = self.pod_states.slot(pod_uid, pod.metadata.namespace, pod.metadata.name)
+            fingerprint = self._pod_fingerprint(pod)
+            self.fingerprint_stats["checked"] += 1
+            if state.fingerprint == fingerprint:
+                self.fingerprint_stats["skipped"] += 1
+                return
+            state.fingerprint = fingerprint
             workload = self._get_workload(pod)
-            self.pod_workloads[pod_uid] = workload  # cache workload info
+            state.workload = workload  # cache workload info
+            state.labels = pod.metadata.labels
 
         event_id = f"{pod_uid}-{event['type']}-{pod.metadata.resource_version}"
         if event_id in self.recorded_events:
@@ -488,6 +1001,8 @@ class PodRestartDebugger:
         self.recorded_events.add(event_id)
 
         debug_data = self._process_pod(pod)
+        if event['type'] == 'DELETED':
+            self.pod_states.evict(pod_uid)
 
         if event['type'] == 'DELETED':
             debug_data.append({
@@ -497,10 +1012,13 @@ class PodRestartDebugger:
                 "pod": pod.metadata.name,
                 "workload": workload,
                 "resource_version": pod.metadata.resource_version,
+                "node": pod.spec.node_name,
                 **{col: None for col in self.all_columns if col not in [
-                    "timestamp", "namespace", "type", "pod", "workload", "resource_version"
+                    "timestamp", "namespace", "type", "pod", "workload", "resource_version", "node"
                 ]}
             })
+            if self.alert_manager.rules.uses_labels:
+                debug_data[-1]["labels"] = pod.metadata.labels
 
         self._output(debug_data, pod.metadata.namespace)
 
@@ -542,16 +1060,18 @@ class PodRestartDebugger:
         
 
         try:
-            nodes = self.api_profiler.profile("list", "nodes", "", lambda: self.v1.list_node())
-            pods = self.v1.list_pod_for_all_namespaces()
+            nodes = self.api_profiler.profile("list", "nodes", "", lambda: self.v1.list_node(), priority=BULK)
+            pods = self.api_profiler.profile(
+                "list", "pods", "",
+                lambda: self.v1.list_pod_for_all_namespaces(field_selector=ACTIVE_POD_FIELD_SELECTOR),
+                priority=BULK,
+            )
             metrics = {}
             try:
+                metrics_api = self.metrics_api or client.CustomObjectsApi()
                 if self.metrics_available is None:
                     try:
-                        metrics_api = client.CustomObjectsApi()
-                        metrics_list = metrics_api.list_cluster_custom_object(
-                            group="metrics.k8s.io", version="v1beta1", plural="nodes"
-                        )
+                        metrics_list = self._node_metrics(metrics_api)
                         self.metrics_available = True
                         metrics = {item["metadata"]["name"]: item for item in metrics_list.get("items", [])}
                     except ApiException as e:
@@ -563,15 +1083,36 @@ class PodRestartDebugger:
                         print(f"⚠️ Unexpected error accessing metrics-server: {e}")
                         metrics = {}
                 elif self.metrics_available is True:
-                    metrics_api = client.CustomObjectsApi()
-                    metrics_list = metrics_api.list_cluster_custom_object(
-                        group="metrics.k8s.io", version="v1beta1", plural="nodes"
-                    )
+                    metrics_list = self._node_metrics(metrics_api)
                     metrics = {item["metadata"]["name"]: item for item in metrics_list.get("items", [])}
             except Exception:
                 pass
 
+            self._process_nodes(nodes, pods, metrics)
+
+        except Exception as e:
+            print(f"⚠️ Node monitoring error: {e}")
+
+    def _node_metrics(self, metrics_api):
+        return self.api_profiler.profile(
+            "list", "nodemetrics", "",
+            lambda: metrics_api.list_cluster_custom_object(group="metrics.k8s.io", version="v1beta1", plural="nodes"),
+            priority=BULK,
+        )
+
+    def _process_nodes(self, nodes, pods, metrics):
+        """Aggrega richieste/limiti/uso per nodo, invia gli alert di condizione e scrive le righe nodo"""
+        if self.recorder:
+            self.recorder.record_nodes(nodes, pods, metrics)
+
+        try:
             current_time = datetime.now().isoformat()
+            leader = self._is_active()  # standby di --ha: stato e finestre sì, CSV no, alert in coda
+
+            node_status = {}
+            pods_by_node = defaultdict(list)
+            for p in pods.items:
+                pods_by_node[p.spec.node_name].append(p)
 
             for node in nodes.items:
                 node_name = node.metadata.name
@@ -589,7 +1130,7 @@ class PodRestartDebugger:
                 ])
 
                 # Calcolo richieste/limiti pod attivi
-                node_pods = [p for p in pods.items if p.spec.node_name == node_name]
+                node_pods = pods_by_node.get(node_name, [])
 
                 cpu_req = cpu_lim = mem_req = mem_lim = 0
                 for pod in node_pods:
@@ -608,38 +1149,47 @@ class PodRestartDebugger:
                     usage_mem = self._parse_mem(metrics[node_name]["usage"]["memory"])
 
                 
+                conditions = {
+                    "NotReady" if cond == "Ready" else cond
+                    for cond in ("MemoryPressure", "DiskPressure", "Ready")
+                    if condition_map.get(cond) == ("False" if cond == "Ready" else "True")
+                }
+                self.node_conditions.observe(self.cluster, node_name, conditions)
+
                 for cond in ["MemoryPressure", "DiskPressure", "Ready", "NetworkUnavailable"]:
                     status = condition_map.get(cond)
                     # per “NotReady” usiamo Ready==False
                     if (cond == "Ready" and status == "False") or (cond != "Ready" and status == "True"):
                         evt = {
                             "timestamp": current_time,
+                            "cluster":     self.cluster,
                             "type":       "NotReady"         if cond=="Ready" else cond,
                             "node":        node_name,
                             "message":     f"{cond} status = {status}",
                         }
                         should, cfg = self.alert_manager.should_alert(evt)
                         if should:
-                            self.alert_manager.send_teams_alert(evt, cfg)
+                            self._send_alert(self.alert_manager.send_teams_alert, evt, cfg)
                             if self.alert_manager.mail_config:
-                                self.alert_manager.send_nodes_email_alert(evt, cfg)
+                                self._send_alert(self.alert_manager.send_nodes_email_alert, evt, cfg)
 
                 # NotSchedulable
                 if getattr(node.spec, "unschedulable", False):
                     evt = {
                         "timestamp": current_time,
+                        "cluster":     self.cluster,
                         "type":       "NotSchedulable",
                         "node":        node_name,
                         "message":     "Node is cordoned (unschedulable)",
                     }
                     should, cfg = self.alert_manager.should_alert(evt)
                     if should:
-                        self.alert_manager.send_teams_alert(evt, cfg)
+                        self._send_alert(self.alert_manager.send_teams_alert, evt, cfg)
                         if self.alert_manager.mail_config:
-                            self.alert_manager.send_nodes_email_alert(evt, cfg)
+                            self._send_alert(self.alert_manager.send_nodes_email_alert, evt, cfg)
 
 
-                self._output_node_status({
+                row = {
                     "timestamp": current_time,
                     "type": "NODE_RESOURCE",
                     "node": node_name,
@@ -659,10 +1209,22 @@ class PodRestartDebugger:
                     "condition_PIDPressure": condition_map.get("PIDPressure"),
                     "condition_NetworkUnavailable": condition_map.get("NetworkUnavailable"),
                     "taints": taint_summary,
-                }, node_name)
-        
-
-                
+                }
+                if leader:
+                    self._output_node_status(row, node_name)
+
+                node_status[node_name] = {
+                    **row,
+                    "cluster": self.cluster,
+                    "pressure": sorted(conditions | {c for c in ("PIDPressure", "NetworkUnavailable")
+                                                 if condition_map.get(c) == "True"}),
+                    "unschedulable": bool(getattr(node.spec, "unschedulable", False)),
+                }
+
+            # sostituita per intero: la query API la legge senza lock
+            self.node_status_cache = node_status
+            self.node_rollup.flush(send=self._send_alert)
+            self.node_conditions.prune()
 
         except Exception as e:
             print(f"⚠️ Node monitoring error: {e}")
@@ -672,7 +1234,11 @@ class PodRestartDebugger:
     def _output_node_status(self, data, node_name):
         """Scrive i dati dei nodi in ./nodes/debug_node_<node>.csv"""
 
-        node_dir = os.path.join(os.getcwd(), "nodes")
+        if self.store:
+            self.store.write_node(data)
+            return
+
+        node_dir = os.path.join(self.base_dir, "nodes")
         os.makedirs(node_dir, exist_ok=True)
 
         filename = os.path.join(node_dir, f"debug_node_{node_name}.csv")
@@ -687,7 +1253,7 @@ class PodRestartDebugger:
             "taints"
         ]
 
-        with open(filename, 'a', newline='') as f:
+        with self._csv_lock, open(filename, 'a', newline='') as f:
             writer = csv.DictWriter(f, fieldnames=fieldnames)
             if not file_exists:
                 writer.writeheader()
@@ -698,23 +1264,13 @@ class PodRestartDebugger:
 
 
     def _output(self, data, namespace):
-        """Handle output to both CSV and log stream"""
+        """Filtra gli eventi già visti e li consegna ai sink (storico, alert, log JSON, ...)"""
 
         if self._warmup:
             return
 
         self.all_recent_events.extend(data)
 
-        EVENT_PRIORITY = {
-            "OOM_KILLED":       100,
-            "ExitCode_137":     90,
-            "TERMINATION":      80,
-            "PROBE_FAILURE":    70,
-            "CrashLoopBackOff": 60,
-            "STATE_CHANGE":     10,
-            # ... altri tipi se servono
-        }
-
         if not data:
             return
             
@@ -726,64 +1282,61 @@ class PodRestartDebugger:
             if entry_id not in self.recorded_events:
                 self.recorded_events.add(entry_id)
                 filtered_data.append(entry)
-        
-        if not filtered_data:
-            return
-                    
-        # CSV output
-        if self.args.csv:
-            self._write_csv(filtered_data, namespace)
-
-        teams_enabled = bool(self.alert_manager.teams_webhook_url)
-        email_enabled = bool(self.alert_manager.mail_config)
-
-        if not teams_enabled and not self._teams_warning_printed:
-            print("⚠️ No Teams webhook configured.")
-            self._teams_warning_printed = True
-        if not email_enabled and not self._email_warning_printed:
-            print("⚠️ No email config defined.")
-            self._email_warning_printed = True
-            
-
-        # Send alerts
-        best_events = {}
-        for entry in filtered_data:
-            pod = entry["pod"]
-            container = entry.get("container", "")
-            key = (pod, container)
-            # prendi priorità, default 0 se non in dict
-            prio = EVENT_PRIORITY.get(entry["type"], 0)
-            # se non abbiamo ancora un evento, o questo ha priorità maggiore
-            if key not in best_events or prio > EVENT_PRIORITY.get(best_events[key]["type"], 0):
-                best_events[key] = entry
 
-        # usa solo gli eventi selezionati
-        filtered_data = list(best_events.values())
+        if self.cluster:
+            # sink condivisi tra cluster: storico, alert e log distinguono per `cluster`
+            for entry in filtered_data:
+                entry["cluster"] = self.cluster
 
+        if self.alert_manager.baselines.tracked:
+            for entry in filtered_data:
+                self.alert_manager.observe(entry)
 
+        # fallimento durante una condizione del nodo che notifica: l'AlertSink lo accorpa nell'alert del nodo
         for entry in filtered_data:
-            should_alert, cfg = self.alert_manager.should_alert(entry)
-            if not should_alert:
-                continue
-            if teams_enabled:
-                self.alert_manager.send_teams_alert(entry, cfg)
-            if email_enabled:
-                self.alert_manager.send_email_alert(entry, cfg)
+            cond = self.node_conditions.attribute(self.cluster, entry.get("node"), entry.get("type"),
+                                                  accept=self.node_rollup.notifies)
+            if cond:
+                entry["node_condition"] = cond
 
-            
-        # JSON log stream
-        if self.args.service_account or self.args.logs:
-            for entry in filtered_data:
-                print(json.dumps(entry))
+        self.sinks.publish(filtered_data)
 
 
+    def _upgrade_csv_headers(self):
+        """
+        I CSV di workload scritti prima di una nuova colonna (es. `count`) vengono riscritti una volta
+        con l'header completo: le righe appese dopo hanno tutte le colonne al posto giusto.
+        """
+        if self.store:
+            return
+        upgraded = 0
+        for path in glob.glob(os.path.join(self.base_dir, "workload", "*", "debug_*.csv")):
+            with self._csv_lock:
+                try:
+                    with open(path, newline="") as f:
+                        header = next(csv.reader(f), None)
+                        if not header or header == self.all_columns:
+                            continue
+                        rows = list(csv.DictReader(f, fieldnames=header))
+                    tmp = path + ".tmp"
+                    with open(tmp, "w", newline="") as f:
+                        writer = csv.DictWriter(f, fieldnames=self.all_columns, extrasaction="ignore")
+                        writer.writeheader()
+                        writer.writerows(rows)
+                    os.replace(tmp, path)
+                    upgraded += 1
+                except (OSError, csv.Error) as e:
+                    print(f"⚠️ CSV header upgrade failed for {path}: {e}")
+        if upgraded:
+            print(f"🧾 Upgraded the header of {upgraded} history CSVs")
+
     def _write_csv(self, data, namespace):
         """Scrive i CSV per i workload nella cartella 'workload/' relativa alla working dir"""
 
         if not data:
             return
 
-        workload_dir = os.path.join(os.getcwd(), "workload", namespace)
+        workload_dir = os.path.join(self.base_dir, "workload", namespace)
         os.makedirs(workload_dir, exist_ok=True)
 
         
@@ -794,7 +1347,7 @@ class PodRestartDebugger:
             file_exists = os.path.isfile(filename)
 
 
-            with open(filename, 'a', newline='') as f:
+            with self._csv_lock, open(filename, 'a', newline='') as f:
                 writer = csv.DictWriter(f, fieldnames=self.all_columns)
                 if not file_exists:
                     writer.writeheader()
@@ -804,10 +1357,47 @@ class PodRestartDebugger:
 
     def _cleanup(self):
         """Clean up resources before exit"""
-        for watcher in self.watchers.values():
+        if self.shard:
+            self.shard.stop()
+        if self.event_watcher:
+            self.event_watcher.stop()
+        for watcher in list(self.watchers.values()):
             watcher.stop()
-
-def generate_summary_csv(events, args):
+        self.watchers.clear()
+        if self.query_api:
+            self.query_api.stop()
+        self.sinks.close()  # prima dello store: l'HistorySink ci scrive
+        if self.store:
+            self.store.close()
+        if self.recorder:
+            self.recorder.close()
+        if self.leader:
+            self.leader.stop()  # dopo lo svuotamento dei sink: lo standby riparte da qui
+
+def run_clusters(debuggers):
+    """Loop principale condiviso da uno o più cluster (--contexts): stessi tempi, stessi sink"""
+    for d in debuggers:
+        d._start()
+
+    debuggers[0]._start_query_api(debuggers)
+    debuggers[0].diagnostics.install_signals()
+
+    scheduler = Scheduler(workers=min(32, 4 + 2 * len(debuggers)))
+    for d in debuggers:
+        d._schedule(scheduler)
+    scheduler.every("scheduler_report", 3600, scheduler.report, initial_delay=3600)
+
+    try:
+        scheduler.run()
+    except KeyboardInterrupt:
+        scheduler.stop()
+        # il primo debugger possiede i sink condivisi: li svuota prima che gli altri chiudano gli store
+        for d in debuggers:
+            d._cleanup()
+        print("\n🛑 Monitoring stopped")
+
+
+def generate_summary_csv(events, args, output_dir=None):
     summary = defaultdict(lambda: defaultdict(int))
     for e in events:
         if e.get("type") not in ["TERMINATION", "POD_DELETED"]:
@@ -847,13 +1437,24 @@ def generate_summary_csv(events, args):
         return
 
     filename = "cluster_overview_chaos.csv" if args.chaos else "workload_overview.csv"
+    if output_dir:
+        filename = os.path.join(output_dir, filename)
     df.to_csv(filename, index=False)
     print(f"📊 Summary (TERMINATION and POD_DELETED) written to {filename}")
 
 
 def main():
 
-    
+    # Sottocomando offline: `kubog_v1.py query ...` interroga lo storico senza cluster
+    if sys.argv[1:2] == ["query"]:
+        history_index.main(sys.argv[2:])
+        return
+    if sys.argv[1:2] == ["replay"]:
+        watch_replay.main(sys.argv[2:])
+        return
+    if sys.argv[1:2] == ["capacity"]:
+        capacity.main(sys.argv[2:])
+        return
 
     parser = argparse.ArgumentParser(description="Enhanced Kubernetes Pod Debugger")
 
@@ -863,6 +1464,8 @@ def main():
                       help='Use in-cluster service account')
     group.add_argument('--context', type=str,
                       help='Kubeconfig context name')
+    group.add_argument('--contexts', nargs='+', metavar='CONTEXT',
+                      help='Monitor several clusters from one process (one kubeconfig context each)')
 
     # Monitoring scope
     parser.add_argument('--namespaces', nargs='+', default=[DEFAULT_NAMESPACE],
@@ -883,32 +1486,130 @@ def main():
                       help='Track container state changes')
     parser.add_argument('--messages', action='store_true',
                       help='Include termination messages')
+    parser.add_argument('--events', action='store_true',
+                      help='Watch Warning events (Unhealthy, BackOff, Evicted, FailedScheduling, FailedMount)')
+    parser.add_argument('--events-flush', type=int, default=15,
+                      help='Seconds over which repeated events are collapsed into one row')
+
+    # Log capture
+    parser.add_argument('--capture-logs', action='store_true',
+                      help='Save the tail of the terminated container logs on TERMINATION/OOM_KILLED')
+    parser.add_argument('--log-tail-lines', type=int, default=200,
+                      help='Lines of log to capture per restart')
+    parser.add_argument('--log-limit-bytes', type=int, default=256 * 1024,
+                      help='Maximum bytes of log to capture per restart')
+    parser.add_argument('--log-workers', type=int, default=4,
+                      help='Concurrent log fetches')
+    parser.add_argument('--log-rate', type=int, default=6,
+                      help='Maximum log fetches per namespace per minute')
 
     # Output options
     parser.add_argument('--csv', action='store_true', default=True,
                       help='Enable CSV output')
     parser.add_argument('--logs', action='store_true',
                       help='Enable JSON log streaming')
+    parser.add_argument('--logs-file', metavar='FILE',
+                      help='Write the JSON log stream to FILE (NDJSON) instead of stdout')
+    parser.add_argument('--logs-max-bytes', type=int,
+                      help='Rotate --logs-file after this many bytes')
+    parser.add_argument('--logs-rotate-seconds', type=int,
+                      help='Rotate --logs-file after this many seconds')
+    parser.add_argument('--logs-compress', choices=['gzip', 'zstd'],
+                      help='Compress rotated --logs-file segments (zstd needs `pip install zstandard`)')
+    parser.add_argument('--sink-http', metavar='URL', action='append',
+                      help='POST event batches as JSON arrays to URL (repeatable)')
+    parser.add_argument('--api-qps', type=float, default=20,
+                      help='Client-side API rate limit per cluster, requests per second (0 = unlimited)')
+    parser.add_argument('--api-burst', type=int, default=40,
+                      help='Client-side API burst size (token bucket capacity)')
+    parser.add_argument('--api-pool-size', type=int,
+                      help='HTTP connection pool size per cluster (default: namespaces + log workers + 16)')
+    parser.add_argument('--query-port', type=int,
+                      help='Serve the live JSON query API (crash loops, top restarts, nodes, alerts) on this port')
+    parser.add_argument('--query-host', default='127.0.0.1',
+                      help='Bind address of the query API (0.0.0.0 to expose it, e.g. behind a Service)')
+    parser.add_argument('--diagnostics-dir',
+                      help='Where SIGUSR1/SIGUSR2 and /debug/* write stacks, profiles and heap snapshots (default: ./diagnostics)')
+    parser.add_argument('--profile-seconds', type=int, default=30,
+                      help='Duration of the SIGUSR2 profile and heap captures')
+    parser.add_argument('--engine', choices=['threads', 'asyncio'], default='threads',
+                      help='Watch engine: one thread per watch, or a single asyncio event loop (needs kubernetes_asyncio)')
+
+    # Sharding
+    parser.add_argument('--shard', action='store_true',
+                      help='Split namespaces across replicas via consistent hashing (Lease-based membership)')
+    parser.add_argument('--shard-group', default='kubog',
+                      help='Name shared by all replicas of the same sharded (or --ha) deployment')
+    parser.add_argument('--shard-id',
+                      help='Replica identity for --shard and --ha (default: $POD_NAME or hostname)')
+    parser.add_argument('--lease-namespace', default=os.getenv('POD_NAMESPACE', 'default'),
+                      help='Namespace holding the coordination Lease objects')
+
+    # Alta affidabilità
+    parser.add_argument('--ha', action='store_true',
+                      help='Active/passive replicas: all keep warm watches, only the Lease holder writes history and sends alerts')
+    parser.add_argument('--ha-lease-seconds', type=int, default=10,
+                      help='Leader Lease duration: a standby takes over this long after the leader stops renewing')
+
+    parser.add_argument('--record', metavar='FILE',
+                      help='Record raw pod/namespace watch events and node snapshots to FILE (.ndjson.gz)')
+    parser.add_argument('--store', choices=['csv', 'sqlite'], default='csv',
+                      help='History backend: per-workload CSV files or a single SQLite (WAL) database')
+    parser.add_argument('--retention-days', type=int,
+                      help='Keep raw CSV rows for N days, then compact them into gzip hourly/daily rollups')
 
     args = parser.parse_args()
 
-    
+    if args.ha and args.shard:
+        parser.error("--ha and --shard are mutually exclusive")
+    if args.shard and args.engine == 'asyncio':
+        parser.error("--shard is not supported with --engine asyncio")
+    if args.contexts and args.engine == 'asyncio':
+        parser.error("--contexts is not supported with --engine asyncio")
+    if args.contexts and args.record:
+        parser.error("--record is not supported with --contexts")
 
-    if args.chaos:
-        try:
-            config.load_incluster_config() if args.service_account else config.load_kube_config(context=args.context)
-            args.namespaces = [ns.metadata.name for ns in client.CoreV1Api().list_namespace().items]
-            print("🚀 Chaos mode enabled: monitoring ALL namespaces")
-        except Exception as e:
-            print(f"❌ Failed to load namespaces for CAOS mode: {e}")
-            return
+    if not args.contexts:
+        if args.chaos:
+            try:
+                config.load_incluster_config() if args.service_account else config.load_kube_config(context=args.context)
+                args.namespaces = [ns.metadata.name for ns in client.CoreV1Api().list_namespace().items]
+                print("🚀 Chaos mode enabled: monitoring ALL namespaces")
+            except Exception as e:
+                print(f"❌ Failed to load namespaces for CAOS mode: {e}")
+                return
+
+        debugger = PodRestartDebugger(args)
+        if debugger.setup_clients():
+            if args.chaos and args.engine == 'threads':
+                # 🔁 Avvia il watcher per aggiunta/rimozione namespace
+                debugger._start_namespace_watcher()
+            debugger.run()
+        return
 
-    debugger = PodRestartDebugger(args)
-    if debugger.setup_clients():
+    # Multi-cluster: un debugger (client, watch, stato) per context; loop, sink e alert condivisi
+    debuggers = []
+    for context in args.contexts:
+        cluster_args = copy.copy(args)
+        cluster_args.context = context
+        cluster_args.namespaces = list(args.namespaces)
         if args.chaos:
-            # 🔁 Avvia il watcher per aggiunta/rimozione namespace
+            try:
+                api = client.CoreV1Api(config.new_client_from_config(context=context))
+                cluster_args.namespaces = [ns.metadata.name for ns in api.list_namespace().items]
+            except Exception as e:
+                print(f"❌ Failed to load namespaces for CAOS mode in {context}: {e}")
+                return
+        debugger = PodRestartDebugger(cluster_args, cluster=context, shared=debuggers[0] if debuggers else None)
+        if not debugger.setup_clients():
+            return
+        debuggers.append(debugger)
+    print(f"☸️ Monitoring {len(debuggers)} clusters: {', '.join(args.contexts)}")
+
+    if args.chaos:
+        for debugger in debuggers:
             debugger._start_namespace_watcher()
-        debugger.run()
+    run_clusters(debuggers)
 
 if __name__ == "__main__":
 
@@ -0,0 +1,168 @@
+import re
+import heapq
+import fnmatch
+
+# campi di un override che selezionano gli eventi; tutti gli altri sovrascrivono la regola base
+SELECTOR_FIELDS = ("namespace", "cluster", "workload", "labels")
+
+_REQUIREMENT = re.compile(r"^\s*(!?)\s*([\w./-]+)\s*(?:(==|=|!=|\s+in\s+|\s+notin\s+)\s*(.*?))?\s*$")
+
+
+def _split_selector(text):
+    """Divide un label selector sulle virgole fuori dalle parentesi di in/notin"""
+    parts, depth, current = [], 0, ""
+    for ch in text:
+        if ch == "," and not depth:
+            parts.append(current)
+            current = ""
+            continue
+        depth += ch == "("
+        depth -= ch == ")"
+        current += ch
+    parts.append(current)
+    return [p for p in parts if p.strip()]
+
+
+def parse_label_selector(selector):
+    """
+    Label selector in stile Kubernetes (`tier=critical,env in (prod,stage),!canary`) o dict
+    {label: valore} → lista di requisiti (label, operatore, valori).
+    """
+    if isinstance(selector, dict):
+        return [(k, "in", frozenset([str(v)])) for k, v in selector.items()]
+    requirements = []
+    for part in _split_selector(str(selector)):
+        m = _REQUIREMENT.match(part)
+        if not m:
+            raise ValueError(f"invalid label selector: {part!r}")
+        negated, key, op, value = m.groups()
+        if negated:
+            requirements.append((key, "absent", None))
+        elif not op:
+            requirements.append((key, "exists", None))
+        else:
+            op = op.strip()
+            values = frozenset(v.strip() for v in value.strip("() ").split(",")) if op in ("in", "notin") \
+                else frozenset([value])
+            requirements.append((key, "notin" if op in ("!=", "notin") else "in", values))
+    return requirements
+
+
+class Matcher:
+    """Selettori di un override, già compilati: cluster, glob del workload, requisiti sulle label"""
+    __slots__ = ("cluster", "workload", "literal", "labels", "rank")
+
+    def __init__(self, spec, order):
+        self.cluster = spec.get("cluster")
+        pattern = spec.get("workload")
+        self.workload = re.compile(fnmatch.translate(pattern)).match if pattern else None
+        self.literal = pattern if pattern and not any(c in pattern for c in "*?[") else None
+        self.labels = parse_label_selector(spec["labels"]) if spec.get("labels") else []
+        # più specifico prima: namespace, numero di label, workload esatto, glob, cluster; poi ordine nel file
+        self.rank = (-bool(spec.get("namespace")), -len(self.labels), -bool(self.literal), -bool(pattern),
+                     -bool(self.cluster), order)
+
+    def matches(self, event, labels):
+        if self.cluster and event.get("cluster") != self.cluster:
+            return False
+        if self.workload:
+            workload = event.get("workload") or ""
+            # "checkout-*" vale sia per "Deployment/checkout-api" sia per "checkout-api"
+            if not (self.workload(workload) or self.workload(workload.rsplit("/", 1)[-1])):
+                return False
+        for key, op, values in self.labels:
+            value = labels.get(key) if labels else None
+            if op == "exists" and value is None or op == "absent" and value is not None:
+                return False
+            if op == "in" and value not in values or op == "notin" and value in values:
+                return False
+        return True
+
+
+class RuleIndex:
+    """
+    Regole di kube-alerts.yaml compilate per chiave (tipo, reason o ExitCode_<n>).
+    Ogni regola può avere `overrides`: varianti con selettori (namespace, cluster, glob del workload,
+    label selector) e soglie proprie, che ereditano i campi non ridefiniti.
+    Gli override sono indicizzati per (chiave, namespace) e, se il workload è un nome esatto, per workload:
+    una ricerca è una lookup in un dict più la verifica dei selettori dei soli candidati rimasti
+    (glob e label di quel namespace), in ordine di specificità. Il costo non cresce con il numero
+    totale di regole.
+    """
+
+    def __init__(self, rules):
+        self.base = {}
+        self.index = {}           # {(chiave, namespace | None): (generici, {workload esatto: candidati})}
+        self.uses_labels = False  # gli eventi devono portare le label del pod
+        self.build(rules or {})
+
+    def build(self, rules):
+        by_namespace, everywhere = {}, {}
+        order = 0
+        for key, rule in rules.items():
+            if not rule:
+                continue
+            base = {k: v for k, v in rule.items() if k != "overrides"}
+            self.base[key] = base
+            for spec in rule.get("overrides") or []:
+                merged = {**base, **{k: v for k, v in spec.items() if k not in SELECTOR_FIELDS}}
+                try:
+                    matcher = Matcher(spec, order)
+                except ValueError as e:
+                    print(f"⚠️ Skipping alert override for {key}: {e}")
+                    continue
+                order += 1
+                self.uses_labels |= bool(matcher.labels)
+                namespaces = spec.get("namespace")
+                if not namespaces:
+                    everywhere.setdefault(key, []).append((matcher, merged))
+                    continue
+                for ns in [namespaces] if isinstance(namespaces, str) else namespaces:
+                    by_namespace.setdefault((key, ns), []).append((matcher, merged))
+
+        def bucket(candidates):
+            generic, exact = [], {}
+            for matcher, rule in sorted(candidates, key=lambda c: c[0].rank):
+                target = exact.setdefault(matcher.literal, []) if matcher.literal else generic
+                target.append((matcher.rank, matcher, rule))
+            return generic, exact
+
+        for key, candidates in everywhere.items():
+            self.index[(key, None)] = bucket(candidates)
+        # i bucket per namespace includono anche gli override senza namespace: una lookup sola
+        for (key, ns), candidates in by_namespace.items():
+            self.index[(key, ns)] = bucket(candidates + everywhere.get(key, []))
+
+    def lookup(self, key, event, labels=None):
+        """Regola effettiva per la chiave e l'evento: primo override che corrisponde, altrimenti la base"""
+        found = self.index.get((key, event.get("namespace")))
+        if found is None:
+            found = self.index.get((key, None))
+        if found is not None:
+            generic, exact = found
+            candidates = generic
+            if exact:
+                workload = event.get("workload") or ""
+                named = exact.get(workload, []) + exact.get(workload.rsplit("/", 1)[-1], [])
+                if named:
+                    candidates = heapq.merge(sorted(named), generic)
+            for _, matcher, rule in candidates:
+                if matcher.matches(event, labels):
+                    return rule
+        return self.base.get(key)
+
+    def keys(self):
+        return self.base.keys()
+
+    def variants(self, key):
+        """Regola base e override della chiave (es. per sapere se una chiave ha varianti anomaly)"""
+        rules = [self.base[key]] if key in self.base else []
+        seen = set()
+        for (k, _), (generic, exact) in self.index.items():
+            if k != key:
+                continue
+            for _, matcher, rule in generic + [c for named in exact.values() for c in named]:
+                if id(matcher) not in seen:
+                    seen.add(id(matcher))
+                    rules.append(rule)
+        return rules
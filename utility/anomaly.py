@@ -0,0 +1,276 @@
+import os
+import glob
+import math
+import sqlite3
+import threading
+from datetime import datetime
+import numpy as np
+import pandas as pd
+
+_EPOCH = datetime(1970, 1, 1)
+
+
+def local_seconds(dt=None):
+    """
+    Secondi dall'epoch dell'ora locale "naive", come i timestamp scritti nei CSV
+    (datetime.now().isoformat()): stessa scala per gli eventi live e per il backfill.
+    """
+    return ((dt or datetime.now()) - _EPOCH).total_seconds()
+
+
+class RateState:
+    """Baseline di una chiave: conteggio del bucket corrente + EWMA lenta (media/varianza) e veloce"""
+    __slots__ = ("bucket", "count", "mean", "var", "fast", "n")
+
+    def __init__(self, bucket, count=0.0, mean=0.0, var=0.0, fast=0.0, n=0):
+        self.bucket = bucket
+        self.count = count
+        self.mean = mean
+        self.var = var
+        self.fast = fast
+        self.n = n
+
+
+class RateBaselines:
+    """
+    Baseline in streaming degli eventi per (namespace, workload, chiave della regola):
+    conteggi per bucket di `bucket_seconds`, con media e varianza EWMA (emivita `half_life` bucket)
+    e una EWMA veloce (`fast_half_life`) per i peggioramenti lenti ma sostenuti.
+    Ogni evento costa O(1), anche dopo ore senza eventi (i bucket vuoti si applicano in forma chiusa);
+    lo stato è di sei numeri per chiave, quindi decine di migliaia di workload restano pochi MB.
+    Si tracciano solo le chiavi con una regola `type: anomaly` (`tracked`).
+    """
+
+    def __init__(self, bucket_minutes=5, half_life_hours=24, fast_half_life_hours=1,
+                 warmup_hours=2, backfill_days=7, clock=local_seconds):
+        self.bucket_seconds = int(bucket_minutes * 60)
+        per_hour = 3600 / self.bucket_seconds
+        self.alpha = 1 - 0.5 ** (1 / (half_life_hours * per_hour))
+        self.fast_alpha = 1 - 0.5 ** (1 / (fast_half_life_hours * per_hour))
+        self.min_buckets = int(warmup_hours * per_hour)
+        self.backfill_days = backfill_days
+        self.clock = clock
+        self.tracked = set()
+        self.history_start = None  # primo bucket coperto dallo storico caricato con backfill()
+        self.states = {}  # {(namespace, workload, chiave): RateState}
+        self._lock = threading.Lock()
+
+    def __len__(self):
+        return len(self.states)
+
+    # ── STREAMING ───────────────────────────────────────────────────────────
+
+    def _roll(self, state, bucket):
+        """Chiude il bucket corrente e applica i bucket vuoti fino a `bucket`"""
+        if bucket <= state.bucket:
+            return
+        x, a, fa = state.count, self.alpha, self.fast_alpha
+        diff = x - state.mean
+        incr = a * diff
+        state.mean += incr
+        state.var = (1 - a) * (state.var + diff * incr)
+        state.fast += fa * (x - state.fast)
+
+        # k bucket a zero: m → r^k·m, v → r^k·(v + m²·(1 − r^k)), con r = 1 − alpha
+        k = bucket - state.bucket - 1
+        if k:
+            rk = (1 - a) ** k
+            state.var = rk * (state.var + state.mean ** 2 * (1 - rk))
+            state.mean *= rk
+            state.fast *= (1 - fa) ** k
+        state.n += k + 1
+        state.bucket = bucket
+        state.count = 0.0
+
+    def observe(self, namespace, workload, key, n=1, now=None):
+        if key not in self.tracked:
+            return
+        bucket = int((now if now is not None else self.clock()) // self.bucket_seconds)
+        with self._lock:
+            state = self.states.get((namespace, workload, key))
+            if state is None:
+                # chiave mai vista nello storico caricato: baseline a zero per tutto il periodo coperto
+                covered = bucket - self.history_start if self.history_start is not None else 0
+                state = self.states[(namespace, workload, key)] = RateState(bucket, n=max(covered, 0))
+            self._roll(state, bucket)
+            if bucket == state.bucket:
+                state.count += n
+
+    def check(self, namespace, workload, key, rule, now=None):
+        """
+        None se la baseline non ha ancora `warmup_hours` di storia,
+        altrimenti (anomalo, dettaglio) confrontando il bucket corrente e la EWMA veloce con la baseline.
+        """
+        bucket = int((now if now is not None else self.clock()) // self.bucket_seconds)
+        with self._lock:
+            state = self.states.get((namespace, workload, key))
+            if state is None:
+                return None
+            self._roll(state, bucket)
+            if state.n < self.min_buckets:
+                return None
+            count, mean, var, fast = state.count, state.mean, state.var, state.fast
+
+        sigma = rule.get("sigma", 4)
+        # rumore almeno poissoniano: una baseline quasi a zero non rende anomalo ogni singolo evento
+        std = max(math.sqrt(var), math.sqrt(max(mean, 1.0)))
+        minutes = self.bucket_seconds // 60
+        detail = f"{count:g} in {minutes}m vs baseline {mean:.2f}±{std:.2f}"
+
+        if count >= rule.get("min_count", 3) and count > mean + sigma * std:
+            return True, detail
+        # EWMA veloce: media di ~1/fast_alpha bucket, deviazione standard ridotta di conseguenza
+        fa = self.fast_alpha
+        fast_std = std * math.sqrt(fa / (2 - fa))
+        if fast / fa >= rule.get("min_count", 3) and fast > mean + sigma * fast_std:
+            return True, f"sustained {fast:.2f}/{minutes}m vs baseline {mean:.2f}±{std:.2f}"
+        return False, detail
+
+    def prune(self, idle_hours=None, now=None):
+        """Rimuove le chiavi senza eventi da `idle_hours` (default: 10 emivite) con baseline ~0"""
+        bucket = int((now if now is not None else self.clock()) // self.bucket_seconds)
+        idle = (idle_hours * 3600 // self.bucket_seconds) if idle_hours else int(10 / self.alpha)
+        with self._lock:
+            stale = [k for k, s in self.states.items()
+                     if s.count == 0 and bucket - s.bucket >= idle]
+            for k in stale:
+                del self.states[k]
+        return len(stale)
+
+    # ── BACKFILL ────────────────────────────────────────────────────────────
+
+    def backfill(self, ts, keys, weights=None, now=None, chunk_cells=4_000_000):
+        """
+        Inizializza le baseline dalla storia: `ts` secondi (local_seconds), `keys` chiavi
+        (namespace, workload, chiave regola) allineate. Conteggi per bucket con np.bincount
+        ed EWMA vettorializzata su tutte le chiavi insieme, a blocchi per limitare la memoria.
+        """
+        ts = np.asarray(ts, dtype=np.float64)
+        if not len(ts):
+            return 0
+        weights = np.ones(len(ts)) if weights is None else np.asarray(weights, dtype=np.float64)
+        end = int((now if now is not None else self.clock()) // self.bucket_seconds)
+        nb = int(self.backfill_days * 86400 // self.bucket_seconds)
+        start = end - nb
+
+        codes, uniques = pd.factorize(pd.Series(list(keys), dtype=object))
+        valid = np.isfinite(ts)
+        buckets = np.full(len(ts), start - 1, dtype=np.int64)
+        buckets[valid] = (ts[valid] // self.bucket_seconds).astype(np.int64)
+        keep = valid & (buckets >= start) & (buckets <= end) & (codes >= 0)
+        codes, buckets, weights = codes[keep], buckets[keep] - start, weights[keep]
+        if not len(codes):
+            return 0
+        first = start + int(buckets.min())
+        self.history_start = first if self.history_start is None else min(self.history_start, first)
+
+        a, fa = self.alpha, self.fast_alpha
+        step = max(1, chunk_cells // (nb + 1))
+        loaded = 0
+        for lo in range(0, len(uniques), step):
+            hi = min(lo + step, len(uniques))
+            sel = (codes >= lo) & (codes < hi)
+            counts = np.bincount(
+                (codes[sel] - lo) * (nb + 1) + buckets[sel], weights=weights[sel],
+                minlength=(hi - lo) * (nb + 1),
+            ).reshape(hi - lo, nb + 1)
+
+            mean = np.zeros(hi - lo)
+            var = np.zeros(hi - lo)
+            fast = np.zeros(hi - lo)
+            for b in range(nb):  # bucket chiusi; l'ultima colonna è il bucket corrente
+                diff = counts[:, b] - mean
+                incr = a * diff
+                mean += incr
+                var = (1 - a) * (var + diff * incr)
+                fast += fa * (counts[:, b] - fast)
+
+            with self._lock:
+                for i, key in enumerate(uniques[lo:hi]):
+                    live = self.states.get(key)
+                    current = counts[i, nb] if live is None or live.bucket != end else live.count
+                    self.states[key] = RateState(end, float(current), float(mean[i]),
+                                                 float(var[i]), float(fast[i]), end - self.history_start)
+                    loaded += 1
+        return loaded
+
+
+def load_history(base_dir, store_path=None, since=None):
+    """
+    Righe di storico (timestamp, namespace, workload, type, reason, exit_code, count) come DataFrame:
+    dal DB SQLite di --store sqlite oppure dai CSV di workload/<ns>/: le righe grezze di debug_*.csv
+    (count vuoto = 1, altrimenti le occorrenze di una riga aggregata) e, per il periodo già compattato
+    da --retention-days, i rollup orari in compacted/ (timestamp = inizio dell'ora, count = eventi dell'ora).
+    """
+    columns = ["timestamp", "namespace", "workload", "type", "reason", "exit_code", "count"]
+    if store_path:
+        if not os.path.isfile(store_path):
+            return pd.DataFrame(columns=columns)
+        sql = 'SELECT timestamp, namespace, workload, type, reason, exit_code, COALESCE("count", 1) AS count FROM events'
+        params = []
+        if since:
+            sql += " WHERE timestamp >= ?"
+            params.append(since.isoformat())
+        conn = sqlite3.connect(store_path)
+        try:
+            return pd.read_sql_query(sql, conn, params=params)
+        finally:
+            conn.close()
+
+    frames = []
+    for path in glob.glob(os.path.join(base_dir, "workload", "*", "debug_*.csv")):
+        try:
+            frame = pd.read_csv(path, usecols=lambda c: c in columns, dtype=str)
+        except Exception as e:
+            print(f"⚠️ Skipping {path} for baseline backfill: {e}")
+            continue
+        frame["count"] = pd.to_numeric(frame["count"], errors="coerce").fillna(1) if "count" in frame else 1
+        frames.append(frame)
+
+    first_day = since.strftime("%Y%m%d") if since else None
+    for path in glob.glob(os.path.join(base_dir, "workload", "*", "compacted", "debug_*.hourly.*.csv.gz")):
+        # debug_<workload>.hourly.<primo>-<ultimo>.csv.gz: i segmenti finiti prima di `since` non servono
+        days = path[:-len(".csv.gz")].rsplit(".", 1)[-1].split("-")
+        if first_day and len(days) >= 2 and days[1] < first_day:
+            continue
+        try:
+            frame = pd.read_csv(path, dtype=str).rename(columns={"bucket": "timestamp"})
+        except Exception as e:
+            print(f"⚠️ Skipping {path} for baseline backfill: {e}")
+            continue
+        frame["count"] = pd.to_numeric(frame["count"], errors="coerce").fillna(1)
+        frames.append(frame[[c for c in columns if c in frame.columns]])
+
+    if not frames:
+        return pd.DataFrame(columns=columns)
+    df = pd.concat(frames, ignore_index=True)
+    if since:
+        df = df[df["timestamp"] >= since.isoformat()]
+    return df
+
+
+def history_seconds(timestamps):
+    """Timestamp ISO (naive, ora locale) → secondi nella scala di local_seconds; NaN se illeggibili"""
+    try:
+        parsed = pd.to_datetime(pd.Series(timestamps), errors="coerce", format="ISO8601")
+    except (TypeError, ValueError):  # pandas < 2.0
+        parsed = pd.to_datetime(pd.Series(timestamps), errors="coerce")
+    return (parsed - pd.Timestamp(_EPOCH)).dt.total_seconds().to_numpy()
+
+
+def rule_keys(df, enabled_keys):
+    """
+    Chiave della regola per ogni riga, con la stessa precedenza di KubeAlertManager.should_alert
+    (ExitCode_<n>, poi reason, poi type), vettorializzata sulle colonne.
+    """
+    exit_codes = pd.to_numeric(df["exit_code"], errors="coerce")
+    candidates = [
+        ("ExitCode_" + exit_codes.astype("Int64").astype(str)).where(exit_codes.notna()),
+        df["reason"].where(df["reason"].notna() & (df["reason"] != "")),
+        df["type"],
+    ]
+    enabled = list(enabled_keys)
+    keys = pd.Series([None] * len(df), index=df.index, dtype=object)
+    for candidate in reversed(candidates):
+        keys = candidate.where(candidate.isin(enabled), keys)
+    return keys
@@ -1,12 +1,22 @@
 import time
 from datetime import datetime
+from utility.rate_limit import INTERACTIVE
 
 class APIProfiler:
-    def __init__(self):
+    def __init__(self, limiter=None):
         # in-memory storage dei log
         self.records = []
+        # APIRateLimiter condiviso: ogni chiamata profilata prende prima un token
+        self.limiter = limiter
 
-    def profile(self, method, resource, namespace, func):
+    def throttle(self, priority=INTERACTIVE):
+        """Attende il rate limiter per chiamate non profilate (es. apertura di un watch)"""
+        if self.limiter:
+            self.limiter.acquire(priority)
+
+    def profile(self, method, resource, namespace, func, priority=INTERACTIVE):
+        # l'attesa sul rate limiter non rientra nella durata misurata
+        self.throttle(priority)
         start = time.time()
         status_code = 0
         try:
@@ -0,0 +1,361 @@
+import asyncio
+import signal
+from utility.selectors import ACTIVE_POD_FIELD_SELECTOR
+from utility.event_watch import WARNING_FIELD_SELECTOR
+from utility.rate_limit import INTERACTIVE, BULK
+
+try:
+    import aiohttp
+    from kubernetes_asyncio import client as aclient, config as aconfig, watch as awatch
+    from kubernetes_asyncio.client.rest import ApiException as AsyncApiException
+except ImportError:  # dipendenza opzionale, richiesta solo con --engine asyncio
+    aclient = None
+
+
+class AsyncWatchEngine:
+    """
+    Engine alternativo al modello thread-per-watch: tutti i watch (pod, namespace),
+    i controlli periodici dei nodi e l'invio degli alert girano su un unico event loop.
+    L'elaborazione resta quella di PodRestartDebugger (_handle_watch_event, _process_nodes...):
+    l'engine fa l'I/O verso l'API server in modo asincrono e precarica la cache degli owner dei
+    ReplicaSet; la pipeline sincrona (stato, alert, CSV) gira nell'executor di default, così un
+    controllo nodi lungo o una scrittura lenta non fermano i watch.
+    """
+
+    def __init__(self, debugger, interval, periodic=None):
+        if aclient is None:
+            raise RuntimeError("--engine asyncio requires `pip install kubernetes_asyncio`")
+        self.debugger = debugger
+        self.args = debugger.args
+        self.interval = interval
+        self.periodic = periodic or []  # [(secondi, funzione sincrona)]
+        self.tasks = {}                 # {nome: asyncio.Task}
+        self._background = set()
+        self._stop = None
+        self.api_client = None
+        self.http = None
+
+    def run(self):
+        asyncio.run(self._main())
+
+    # ── SETUP / SHUTDOWN ────────────────────────────────────────────────────
+
+    async def _main(self):
+        self._stop = asyncio.Event()
+        loop = asyncio.get_running_loop()
+        diagnostics = getattr(self.debugger, "diagnostics", None)
+        if diagnostics:
+            diagnostics.loop = loop  # i task (pods/<ns>, nodes...) compaiono nel dump degli stack
+        for sig in (signal.SIGINT, signal.SIGTERM):
+            try:
+                loop.add_signal_handler(sig, self._stop.set)
+            except NotImplementedError:
+                pass
+
+        configuration = aclient.Configuration()
+        if self.args.service_account:
+            aconfig.load_incluster_config(client_configuration=configuration)
+        else:
+            await aconfig.load_kube_config(context=self.args.context, client_configuration=configuration)
+        configuration.connection_pool_maxsize = self.debugger._api_pool_size()
+        self.api_client = aclient.ApiClient(configuration)
+        self.v1 = aclient.CoreV1Api(self.api_client)
+        self.apps_v1 = aclient.AppsV1Api(self.api_client)
+        self.metrics_api = aclient.CustomObjectsApi(self.api_client)
+        self.http = aiohttp.ClientSession()
+        self._install_alert_io()
+        print("⚡ asyncio engine started")
+
+        try:
+            if self.debugger.monitored_workloads:
+                await loop.run_in_executor(None, self.debugger._resolve_selectors)
+            for ns in list(self.args.namespaces):
+                await self._sync_namespace(ns)
+                if self.args.watch:
+                    self._start_task(f"pods/{ns}", self._watch_namespace(ns))
+            self.debugger._end_warmup()
+
+            if self.args.chaos:
+                self._start_task("namespaces", self._watch_namespaces())
+            events = self.debugger.event_watcher
+            if events:
+                self._start_task("events", self._watch_events())
+                self._start_task("events/flush", self._every(
+                    events.flush_interval, self._in_executor(events.flush), initial_delay=events.flush_interval))
+            if self.args.nodes:
+                self._start_task("nodes", self._every(self.interval, self._check_nodes))
+            if self.debugger.monitored_workloads:
+                self._start_task("selectors", self._every(5 * 60, self._refresh_selectors, initial_delay=5 * 60))
+            for i, (period, job) in enumerate(self.periodic):
+                self._start_task(f"periodic/{i}", self._every(period, self._in_executor(job), initial_delay=period))
+
+            await self._stop.wait()
+        finally:
+            await self._shutdown()
+
+    async def _shutdown(self):
+        tasks = list(self.tasks.values()) + list(self._background)
+        for task in tasks:
+            task.cancel()
+        await asyncio.gather(*tasks, return_exceptions=True)
+        self.tasks.clear()
+        if self.http:
+            await self.http.close()
+        if self.api_client:
+            await self.api_client.close()
+        self.debugger._cleanup()
+        print("\n🛑 Monitoring stopped")
+
+    def _start_task(self, name, coro):
+        self.tasks[name] = asyncio.create_task(coro, name=name)
+
+    def _stop_task(self, name):
+        task = self.tasks.pop(name, None)
+        if task:
+            task.cancel()
+
+    def _spawn(self, coro):
+        task = asyncio.create_task(coro)
+        self._background.add(task)
+        task.add_done_callback(self._background.discard)
+
+    async def _every(self, period, fn, initial_delay=0):
+        """Esegue fn a intervalli fissi (rate fisso, senza deriva dovuta alla durata di fn)"""
+        loop = asyncio.get_running_loop()
+        next_run = loop.time() + initial_delay
+        while True:
+            await asyncio.sleep(max(0, next_run - loop.time()))
+            try:
+                await fn()
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                print(f"⚠️ Periodic task error: {e}")
+            next_run += period
+            if next_run < loop.time():
+                next_run = loop.time()
+
+    async def _throttle(self, priority=INTERACTIVE):
+        """Rate limit condiviso (--api-qps/--api-burst): attende sul loop senza bloccarlo"""
+        limiter = self.debugger.api_limiter
+        if limiter:
+            await limiter.acquire_async(priority)
+
+    def _in_executor(self, job):
+        async def run():
+            await asyncio.get_running_loop().run_in_executor(None, job)
+        return run
+
+    # ── PODS ────────────────────────────────────────────────────────────────
+
+    async def _prefetch_owners(self, pods):
+        """Risolve in parallelo gli owner dei ReplicaSet non ancora in cache"""
+        cache = self.debugger.replicaset_owners
+        missing = {
+            (p.metadata.namespace, o.name)
+            for p in pods
+            for o in p.metadata.owner_references or []
+            if o.kind == "ReplicaSet" and (p.metadata.namespace, o.name) not in cache
+        }
+        if not missing:
+            return
+
+        async def resolve(ns, name):
+            try:
+                await self._throttle()
+                rs = await self.apps_v1.read_namespaced_replica_set(name, ns)
+            except AsyncApiException:
+                return
+            cache[(ns, name)] = next(
+                (o.name for o in rs.metadata.owner_references or [] if o.kind == "Deployment"), None)
+
+        await asyncio.gather(*(resolve(ns, name) for ns, name in missing))
+
+    async def _sync_namespace(self, namespace):
+        try:
+            await self._throttle(BULK)
+            pods = await self.v1.list_namespaced_pod(namespace, **self.debugger._pod_list_kwargs(namespace))
+        except AsyncApiException as e:
+            print(f"⚠️ API error in {namespace}: {e}")
+            return
+        await self._prefetch_owners(pods.items)
+        await asyncio.get_running_loop().run_in_executor(None, self.debugger._process_pod_list, namespace, pods)
+
+    def _process_pod_event(self, namespace, event):
+        """Parte sincrona di un evento del watch (registrazione, pipeline, CSV): gira nell'executor"""
+        d = self.debugger
+        if d.recorder:
+            d.recorder.record_watch("pod", event, namespace)
+        if event["type"] in ("ADDED", "MODIFIED", "DELETED") and d._should_monitor(event["object"], namespace):
+            d._handle_watch_event(event)
+
+    async def _watch_namespace(self, namespace):
+        d = self.debugger
+        loop = asyncio.get_running_loop()
+        delay = d.watch_retry_delay
+        retries = 0
+        while True:
+            try:
+                print(f"🔄 Starting watch for namespace {namespace} (resourceVersion: {d.resource_versions.get(namespace)})")
+                await self._throttle(BULK)
+                w = awatch.Watch()
+                async with w.stream(self.v1.list_namespaced_pod, namespace,
+                                    resource_version=d.resource_versions.get(namespace, "0"),
+                                    timeout_seconds=300, **d._pod_list_kwargs(namespace)) as stream:
+                    async for event in stream:
+                        try:
+                            pod = event["object"]
+                            d.resource_versions[namespace] = pod.metadata.resource_version
+                            if event["type"] in ("ADDED", "MODIFIED", "DELETED"):
+                                await self._prefetch_owners([pod])
+                            # un evento alla volta per namespace (ordine preservato), fuori dal loop
+                            await loop.run_in_executor(None, self._process_pod_event, namespace, event)
+                            delay = d.watch_retry_delay
+                            retries = 0
+                        except Exception as inner_e:
+                            print(f"⚠️ Error processing event in {namespace}: {inner_e}")
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                print(f"⚠️ Watch connection error in {namespace}: {e}")
+                print(f"⏳ Retrying in {delay} seconds...")
+                await asyncio.sleep(delay)
+                retries += 1
+                if retries >= 4:
+                    print(f"❌ Too many failures in namespace {namespace}. Removing from monitoring.")
+                    if namespace in self.args.namespaces:
+                        self.args.namespaces.remove(namespace)
+                    self.tasks.pop(f"pods/{namespace}", None)
+                    return
+                delay = min(delay * d.backoff_factor, d.max_retry_delay)
+                try:
+                    await self._throttle(BULK)
+                    pods = await self.v1.list_namespaced_pod(namespace, limit=1, **d._pod_list_kwargs(namespace))
+                    d.resource_versions[namespace] = pods.metadata.resource_version
+                except Exception as version_e:
+                    print(f"⚠️ Failed to update resource version: {version_e}")
+
+    async def _refresh_selectors(self):
+        """Ricalcola i selector dei workload: i watch dei namespace con selector cambiato ripartono con quello nuovo"""
+        changed = await asyncio.get_running_loop().run_in_executor(None, self.debugger._resolve_selectors)
+        for ns in changed:
+            if f"pods/{ns}" in self.tasks:
+                self._stop_task(f"pods/{ns}")
+                self._start_task(f"pods/{ns}", self._watch_namespace(ns))
+
+    async def _watch_namespaces(self):
+        while True:
+            try:
+                w = awatch.Watch()
+                async with w.stream(self.v1.list_namespace, timeout_seconds=300) as stream:
+                    async for event in stream:
+                        if self.debugger.recorder:
+                            self.debugger.recorder.record_watch("namespace", event)
+                        ns = event["object"].metadata.name
+                        if event["type"] == "ADDED" and ns not in self.args.namespaces:
+                            print(f"🆕 New namespace detected: {ns}")
+                            self.args.namespaces.append(ns)
+                            await self._sync_namespace(ns)
+                            if self.args.watch:
+                                self._start_task(f"pods/{ns}", self._watch_namespace(ns))
+                        elif event["type"] == "DELETED" and ns in self.args.namespaces:
+                            self._stop_task(f"pods/{ns}")
+                            self.debugger._remove_namespace(ns)
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                print(f"⚠️ Namespace watch error: {e}")
+                await asyncio.sleep(self.debugger.watch_retry_delay)
+
+    async def _watch_events(self):
+        aggregator = self.debugger.event_watcher
+        while True:
+            try:
+                await self._throttle(BULK)
+                if aggregator.resource_version is None:
+                    aggregator.seed(await self.v1.list_event_for_all_namespaces(
+                        field_selector=WARNING_FIELD_SELECTOR))
+                    await self._throttle(BULK)
+                w = awatch.Watch()
+                async with w.stream(self.v1.list_event_for_all_namespaces,
+                                    field_selector=WARNING_FIELD_SELECTOR,
+                                    resource_version=aggregator.resource_version,
+                                    timeout_seconds=300) as stream:
+                    async for event in stream:
+                        if self.debugger.recorder:
+                            self.debugger.recorder.record_watch("event", event)
+                        aggregator.handle(event)
+            except asyncio.CancelledError:
+                raise
+            except AsyncApiException as e:
+                if e.status == 410:
+                    aggregator.resource_version = None
+                    continue
+                print(f"⚠️ Event watch error: {e}")
+                await asyncio.sleep(self.debugger.watch_retry_delay)
+            except Exception as e:
+                print(f"⚠️ Event watch error: {e}")
+                await asyncio.sleep(self.debugger.watch_retry_delay)
+
+    # ── NODES ───────────────────────────────────────────────────────────────
+
+    async def _check_nodes(self):
+        d = self.debugger
+        for _ in range(2):  # due liste: nodi e pod attivi
+            await self._throttle(BULK)
+        nodes, pods = await asyncio.gather(
+            self.v1.list_node(),
+            self.v1.list_pod_for_all_namespaces(field_selector=ACTIVE_POD_FIELD_SELECTOR),
+        )
+        metrics = {}
+        if d.metrics_available is not False:
+            try:
+                await self._throttle(BULK)
+                metrics_list = await self.metrics_api.list_cluster_custom_object(
+                    group="metrics.k8s.io", version="v1beta1", plural="nodes")
+                metrics = {item["metadata"]["name"]: item for item in metrics_list.get("items", [])}
+                d.metrics_available = True
+            except AsyncApiException as e:
+                print(f"⚠️ Metrics-server API error ({e.status}): {e.reason}")
+                d.metrics_available = False
+        # aggregazione, alert e CSV dei nodi nell'executor: il loop resta libero per watch e alert
+        await asyncio.get_running_loop().run_in_executor(None, d._process_nodes, nodes, pods, metrics)
+
+    # ── ALERT I/O ───────────────────────────────────────────────────────────
+
+    def _install_alert_io(self):
+        """
+        Gli invii degli alert diventano task sul loop invece di chiamate bloccanti.
+        Vengono chiamati anche dal thread dell'AlertSink: si passa sempre da call_soon_threadsafe.
+        """
+        manager = self.debugger.alert_manager
+        send_email = manager.send_email_alert
+        send_nodes_email = manager.send_nodes_email_alert
+        loop = asyncio.get_running_loop()
+
+        def spawn(make_coro):
+            loop.call_soon_threadsafe(lambda: self._spawn(make_coro()))
+
+        def teams(event, rule):
+            if manager.teams_webhook_url:
+                card = manager.teams_card(event, rule)
+                spawn(lambda: self._post_teams(card))
+
+        def email(event, rule):
+            spawn(self._in_executor(lambda: send_email(event, rule)))
+
+        def nodes_email(event, rule):
+            spawn(self._in_executor(lambda: send_nodes_email(event, rule)))
+
+        manager.send_teams_alert = teams
+        manager.send_email_alert = email
+        manager.send_nodes_email_alert = nodes_email
+
+    async def _post_teams(self, card):
+        url = self.debugger.alert_manager.teams_webhook_url
+        try:
+            async with self.http.post(url, json=card) as resp:
+                if resp.status >= 300:
+                    print(f"❌ Failed to send alert to Teams: {resp.status} - {await resp.text()}")
+        except Exception as e:
+            print(f"❌ Exception sending Teams alert: {e}")
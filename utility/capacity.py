@@ -0,0 +1,282 @@
+import os
+import csv
+import glob
+import json
+import time
+import sqlite3
+import argparse
+from datetime import datetime, timedelta
+from concurrent.futures import ProcessPoolExecutor
+import numpy as np
+import pandas as pd
+from utility.anomaly import history_seconds, local_seconds
+from utility.history_compactor import NODE_METRICS
+
+# rapporto → (numeratore, denominatore, scala): utilizzo e requests in %, overcommit come rapporto
+RATIOS = {
+    "cpu_util": ("cpu_usage", "cpu_allocatable", 100),
+    "mem_util": ("mem_usage", "mem_allocatable", 100),
+    "cpu_requests": ("cpu_requests", "cpu_allocatable", 100),
+    "mem_requests": ("mem_requests", "mem_allocatable", 100),
+    "cpu_overcommit": ("cpu_limits", "cpu_allocatable", 1),
+    "mem_overcommit": ("mem_limits", "mem_allocatable", 1),
+}
+PRESSURES = {"memory_pressure": "condition_MemoryPressure", "disk_pressure": "condition_DiskPressure"}
+
+# somme per istante usate per i valori di cluster (somma uso / somma allocatable)
+CLUSTER_SUMS = NODE_METRICS + [f"{m}_allocatable_used" for m in ("cpu", "mem")]
+
+DEFAULT_PERCENTILES = (50, 95, 99)
+
+
+def _weighted_percentiles(values, weights, percentiles):
+    """Percentili pesati (i campioni delle rollup orarie pesano quanto i loro campioni raw)"""
+    valid = ~np.isnan(values)
+    values, weights = values[valid], weights[valid]
+    if not len(values):
+        return [None] * len(percentiles)
+    order = np.argsort(values)
+    values, cum = values[order], np.cumsum(weights[order])
+    return [float(v) for v in np.interp(np.asarray(percentiles) / 100 * cum[-1], cum, values)]
+
+
+def _add_ratios(result, columns, weights, percentiles, usage_suffix=""):
+    """Percentili e massimo di ogni rapporto di RATIOS, aggiunti a `result`"""
+    with np.errstate(divide="ignore", invalid="ignore"):
+        for name, (num, den, scale) in RATIOS.items():
+            if num.endswith("_usage"):
+                den += usage_suffix
+            ratio = np.where(columns[den] > 0, columns[num] / columns[den] * scale, np.nan)
+            values = _weighted_percentiles(ratio, weights, list(percentiles) + [100])
+            for q, v in zip(percentiles, values):
+                result[f"{name}_p{q}"] = None if v is None else round(v, 2)
+            result[f"{name}_max"] = None if values[-1] is None else round(values[-1], 2)
+
+
+def _iso(seconds):
+    """Secondi di local_seconds → timestamp ISO (ora locale, come nei CSV)"""
+    return (datetime(1970, 1, 1) + timedelta(seconds=float(seconds))).isoformat()
+
+
+def _node_name(path):
+    name = os.path.basename(path)
+    return name[len("debug_node_"):-len(".csv")]
+
+
+def _frame(df, ts, weights, seconds):
+    """Colonne di un file di storico → array NumPy allineati"""
+    out = {"ts": ts, "weight": weights, "seconds": seconds}
+    for m in NODE_METRICS:
+        out[m] = pd.to_numeric(df[m], errors="coerce").to_numpy(dtype=np.float64) if m in df else np.full(len(df), np.nan)
+    return out
+
+
+def _read_raw(path, since, until):
+    wanted = {"timestamp", *NODE_METRICS, *PRESSURES.values()}
+    df = pd.read_csv(path, usecols=lambda c: c in wanted, dtype={c: str for c in PRESSURES.values()})
+    return _raw_frame(df, since, until)
+
+
+def _raw_frame(df, since, until):
+    """Righe raw (un campione per controllo nodi): la durata di un campione è la distanza dal successivo"""
+    ts = history_seconds(df["timestamp"])
+    keep = ~np.isnan(ts)
+    if since is not None:
+        keep &= ts >= since
+    if until is not None:
+        keep &= ts < until
+    df, ts = df[keep], ts[keep]
+    order = np.argsort(ts, kind="stable")
+    df, ts = df.iloc[order], ts[order]
+
+    gaps = np.diff(ts)
+    step = float(np.median(gaps)) if len(gaps) else 60.0
+    # un buco (KuBog fermo) non conta come tempo sotto pressione: massimo due intervalli per campione
+    seconds = np.minimum(np.append(gaps, step), 2 * step)
+    out = _frame(df, ts, np.ones(len(ts)), seconds)
+    for name, col in PRESSURES.items():
+        out[name] = (df[col].astype(str) == "True").to_numpy() if col in df else np.zeros(len(ts), dtype=bool)
+    return out
+
+
+def _read_hourly(path, since, until):
+    """Rollup orarie di nodes/compacted/: medie orarie pesate per numero di campioni"""
+    df = pd.read_csv(path, compression="gzip")
+    ts = history_seconds(df["bucket"])
+    keep = ~np.isnan(ts)
+    if since is not None:
+        keep &= ts >= since
+    if until is not None:
+        keep &= ts < until
+    df, ts = df[keep], ts[keep]
+    samples = df["samples"].to_numpy(dtype=np.float64)
+    avg = df.rename(columns={f"{m}_avg": m for m in NODE_METRICS})
+    out = _frame(avg, ts, samples, np.full(len(ts), 3600.0))
+    # la frazione di campioni sotto pressione nell'ora diventa tempo
+    for name, col in (("memory_pressure", "memory_pressure_samples"), ("disk_pressure", "disk_pressure_samples")):
+        out[name] = df[col].to_numpy(dtype=np.float64) / np.maximum(samples, 1)
+    return out
+
+
+def summarize_node(job):
+    """
+    Worker (un processo per file): carica lo storico di un nodo e calcola percentili,
+    ore sotto pressione e le somme per minuto usate per i valori di cluster.
+    """
+    node, paths, hourly_paths, since, until, percentiles, frame = job
+    parts = [frame] if frame is not None else []
+    parts += [_read_raw(p, since, until) for p in paths]
+    parts += [_read_hourly(p, since, until) for p in hourly_paths]
+    parts = [p for p in parts if len(p["ts"])]
+    if not parts:
+        return None
+    data = {k: np.concatenate([p[k].astype(np.float64) for p in parts]) for k in parts[0]}
+
+    result = {
+        "node": node,
+        "samples": int(data["weight"].sum()),
+        "first": _iso(data["ts"].min()),
+        "last": _iso(data["ts"].max()),
+    }
+    _add_ratios(result, data, data["weight"], percentiles)
+    for name in PRESSURES:
+        result[f"{name}_hours"] = round(float((data[name] * data["seconds"]).sum()) / 3600, 2)
+
+    # somme per minuto: l'allocatable "used" conta solo i campioni con metriche d'uso
+    minute = (data["ts"] // 60).astype(np.int64)
+    sums = {m: np.nan_to_num(data[m]) for m in NODE_METRICS}
+    for r in ("cpu", "mem"):
+        sums[f"{r}_allocatable_used"] = np.where(np.isnan(data[f"{r}_usage"]), 0, np.nan_to_num(data[f"{r}_allocatable"]))
+    result["_cluster"] = (minute, data["weight"], np.vstack([sums[c] for c in CLUSTER_SUMS]))
+    return result
+
+
+def cluster_summary(results, percentiles):
+    """Valori di cluster: per ogni minuto somma sui nodi, poi percentili nel tempo"""
+    parts = [r["_cluster"] for r in results]
+    if not parts:
+        return None
+    minutes = np.concatenate([p[0] for p in parts])
+    weights = np.concatenate([p[1] for p in parts])
+    sums = np.hstack([p[2] for p in parts])
+    keys, inverse, nodes = np.unique(minutes, return_inverse=True, return_counts=True)
+    totals = {c: np.bincount(inverse, weights=sums[i], minlength=len(keys)) for i, c in enumerate(CLUSTER_SUMS)}
+    weight = np.bincount(inverse, weights=weights, minlength=len(keys)) / nodes
+
+    result = {"node": "CLUSTER", "samples": int(len(keys)),
+              "first": _iso(keys.min() * 60),
+              "last": _iso(keys.max() * 60)}
+    # l'uso si confronta solo con l'allocatable dei nodi che avevano metriche in quel minuto
+    _add_ratios(result, totals, weight, percentiles, usage_suffix="_used")
+    for name in PRESSURES:
+        result[f"{name}_hours"] = round(sum(r[f"{name}_hours"] for r in results), 2)
+    return result
+
+
+def _sqlite_frames(db_path, since, until):
+    """--store sqlite: una sola query sulla tabella node_status, poi un frame NumPy per nodo"""
+    sql, params = "SELECT * FROM node_status", []
+    bounds = [("timestamp >= ?", since), ("timestamp < ?", until)]
+    clauses = [(c, _iso(v)) for c, v in bounds if v is not None]
+    if clauses:
+        sql += " WHERE " + " AND ".join(c for c, _ in clauses)
+        params = [v for _, v in clauses]
+    conn = sqlite3.connect(db_path)
+    try:
+        df = pd.read_sql_query(sql, conn, params=params)
+    finally:
+        conn.close()
+    return {node: _raw_frame(group, since, until) for node, group in df.groupby("node")}
+
+
+def build_jobs(base_dir, since=None, until=None, percentiles=DEFAULT_PERCENTILES, compacted=True, node=None):
+    jobs = {}
+    for path in glob.glob(os.path.join(base_dir, "nodes", "debug_node_*.csv")):
+        jobs.setdefault(_node_name(path), [[], [], None])[0].append(path)
+    if compacted:
+        for path in glob.glob(os.path.join(base_dir, "nodes", "compacted", "debug_node_*.hourly.*.csv.gz")):
+            name = os.path.basename(path)[len("debug_node_"):].split(".hourly.")[0]
+            jobs.setdefault(name, [[], [], None])[1].append(path)
+    db_path = os.path.join(base_dir, "kubog_history.db")
+    if os.path.isfile(db_path):
+        for name, frame in _sqlite_frames(db_path, since, until).items():
+            jobs.setdefault(name, [[], [], None])[2] = frame
+    return [
+        (name, paths, hourly, since, until, tuple(percentiles), frame)
+        for name, (paths, hourly, frame) in sorted(jobs.items())
+        if node is None or name == node
+    ]
+
+
+def capacity_report(base_dir, since=None, until=None, percentiles=DEFAULT_PERCENTILES,
+                    workers=None, compacted=True, node=None):
+    """Ritorna (righe per nodo, riga di cluster)"""
+    jobs = build_jobs(base_dir, since, until, percentiles, compacted, node)
+    if not jobs:
+        return [], None
+    if workers == 1 or len(jobs) == 1:
+        results = [summarize_node(job) for job in jobs]
+    else:
+        with ProcessPoolExecutor(max_workers=workers) as pool:
+            results = list(pool.map(summarize_node, jobs, chunksize=max(1, len(jobs) // (4 * (workers or os.cpu_count() or 1)))))
+    results = [r for r in results if r]
+    return results, cluster_summary(results, percentiles)
+
+
+def _fmt(value, suffix=""):
+    return "-" if value is None else f"{value:.1f}{suffix}"
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(prog="kubog capacity", description="Cluster capacity report from node history")
+    parser.add_argument("--dir", default=os.getcwd(), help="KuBog output directory")
+    parser.add_argument("--since", help="ISO timestamp, e.g. 2025-06-01T00:00")
+    parser.add_argument("--until", help="ISO timestamp (exclusive)")
+    parser.add_argument("--node", help="Only this node")
+    parser.add_argument("--percentiles", type=int, nargs="+", default=list(DEFAULT_PERCENTILES))
+    parser.add_argument("--workers", type=int, help="Processes (default: one per CPU)")
+    parser.add_argument("--raw-only", action="store_true", help="Ignore compacted hourly rollups")
+    parser.add_argument("--csv", metavar="FILE", help="Write all columns per node (and CLUSTER) to FILE")
+    parser.add_argument("--json", metavar="FILE", help="Write the report as JSON to FILE")
+    args = parser.parse_args(argv)
+
+    since = local_seconds(datetime.fromisoformat(args.since)) if args.since else None
+    until = local_seconds(datetime.fromisoformat(args.until)) if args.until else None
+
+    start = time.time()
+    rows, cluster = capacity_report(args.dir, since, until, args.percentiles, args.workers,
+                                    compacted=not args.raw_only, node=args.node)
+    if not rows:
+        print("⚠️ No node history found (run KuBog with --nodes)")
+        return
+    for row in rows:
+        row.pop("_cluster", None)
+    table = rows + [cluster]
+
+    hi = max(args.percentiles)
+    print(f"{'NODE':<32} {'SAMPLES':>8} {'CPU p50':>8} {f'CPU p{hi}':>8} {'MEM p50':>8} {f'MEM p{hi}':>8} "
+          f"{'CPU req':>8} {'MEM req':>8} {'CPU lim':>8} {'MEM lim':>8} {'MemP h':>7} {'DiskP h':>7}")
+    for r in table:
+        print(f"{r['node'][:32]:<32} {r['samples']:>8} "
+              f"{_fmt(r.get('cpu_util_p50'), '%'):>8} {_fmt(r.get(f'cpu_util_p{hi}'), '%'):>8} "
+              f"{_fmt(r.get('mem_util_p50'), '%'):>8} {_fmt(r.get(f'mem_util_p{hi}'), '%'):>8} "
+              f"{_fmt(r.get(f'cpu_requests_p{hi}'), '%'):>8} {_fmt(r.get(f'mem_requests_p{hi}'), '%'):>8} "
+              f"{_fmt(r.get(f'cpu_overcommit_p{hi}'), 'x'):>8} {_fmt(r.get(f'mem_overcommit_p{hi}'), 'x'):>8} "
+              f"{r['memory_pressure_hours']:>7.1f} {r['disk_pressure_hours']:>7.1f}")
+    print(f"📐 {len(rows)} nodes, {sum(r['samples'] for r in rows)} samples in {time.time() - start:.1f}s "
+          f"(req/lim columns: p{hi} of requests and limits over allocatable)")
+
+    if args.csv:
+        with open(args.csv, "w", newline="") as f:
+            writer = csv.DictWriter(f, fieldnames=list(cluster))
+            writer.writeheader()
+            writer.writerows(table)
+        print(f"💾 Saved {args.csv}")
+    if args.json:
+        with open(args.json, "w") as f:
+            json.dump({"nodes": rows, "cluster": cluster}, f, indent=2)
+        print(f"💾 Saved {args.json}")
+
+
+if __name__ == "__main__":
+    main()
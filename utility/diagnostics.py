@@ -0,0 +1,256 @@
+import os
+import sys
+import time
+import signal
+import pstats
+import asyncio
+import cProfile
+import threading
+import traceback
+import tracemalloc
+from io import StringIO
+from datetime import datetime
+from collections import Counter, defaultdict
+
+# cProfile vede tutti i thread solo da Python 3.12 (sys.monitoring); prima solo il thread che lo abilita
+CPROFILE_ALL_THREADS = sys.version_info >= (3, 12)
+
+# frame in cima allo stack di un thread fermo in attesa (socket, code, lock): non è lavoro
+IDLE_LEAVES = {
+    ("threading.py", "wait"), ("threading.py", "_wait_for_tstate_lock"), ("queue.py", "get"),
+    ("socket.py", "readinto"), ("ssl.py", "read"), ("ssl.py", "recv_into"), ("selectors.py", "select"),
+    ("socketserver.py", "serve_forever"),
+}
+
+
+def _thread_cpu(native_id):
+    """Secondi di CPU (user + system) del thread da /proc, None dove non disponibile"""
+    try:
+        with open(f"/proc/self/task/{native_id}/stat") as f:
+            fields = f.read().rsplit(")", 1)[1].split()
+        return (int(fields[11]) + int(fields[12])) / os.sysconf("SC_CLK_TCK")
+    except (OSError, ValueError, IndexError):
+        return None
+
+
+def _role(name):
+    """watch-pods/checkout@prod → watch-pods, kubog-task_3 → kubog-task, Thread-7 (run) → run"""
+    if name.startswith("Thread-") and name.endswith(")"):
+        return name[name.index("(") + 1:-1]
+    role = name.split("/", 1)[0]
+    head, _, tail = role.rpartition("_")
+    return head if head and tail.isdigit() else role
+
+
+class Diagnostics:
+    """
+    Diagnostica a richiesta di un processo KuBog in esecuzione, senza riavvio:
+    - stacks: stack di tutti i thread (i watcher si chiamano watch-pods/<namespace>) e dei task asyncio
+    - profile: N secondi di campionamento degli stack di tutti i thread, con la CPU consumata da ognuno;
+      in più un cProfile .pstats dove l'interprete lo estende a tutti i thread (3.12+)
+    - heap: top-N allocazioni di tracemalloc, acceso solo per la durata della cattura
+    Trigger: SIGUSR1 (stack), SIGUSR2 (profilo e poi heap) o gli endpoint /debug/* della query API.
+    A riposo non c'è nulla di attivo (nessun hook, thread o tracing): il costo è zero.
+    Ogni cattura scrive i suoi file in `out_dir` e ritorna un riassunto.
+    """
+
+    def __init__(self, out_dir, profile_seconds=30, top=25, interval=0.01):
+        self.out_dir = out_dir
+        self.profile_seconds = profile_seconds
+        self.top = top
+        self.interval = interval
+        self.loop = None  # event loop di --engine asyncio: i suoi task finiscono nel dump degli stack
+        self._busy = threading.Lock()  # una cattura lunga (profilo, heap) alla volta
+
+    def install_signals(self):
+        """SIGUSR1 → stack, SIGUSR2 → profilo + heap; solo dal main thread e dove i segnali esistono"""
+        if not hasattr(signal, "SIGUSR1") or threading.current_thread() is not threading.main_thread():
+            return False
+        signal.signal(signal.SIGUSR1, lambda *_: self._background(self.stacks))
+        signal.signal(signal.SIGUSR2, lambda *_: self._background(self.capture))
+        print(f"🩺 Diagnostics: kill -USR1 {os.getpid()} (stacks), kill -USR2 {os.getpid()} "
+              f"({self.profile_seconds}s profile + heap) → {self.out_dir}")
+        return True
+
+    def _background(self, fn):
+        # l'handler del segnale gira nel main thread (lo scheduler): la cattura no
+        def run():
+            try:
+                fn()
+            except Exception as e:
+                print(f"⚠️ Diagnostics capture failed: {e}")
+
+        threading.Thread(target=run, name="kubog-diagnostics", daemon=True).start()
+
+    def capture(self):
+        """Profilo e poi heap (in sequenza: tracemalloc falserebbe i tempi del profilo)"""
+        return {"profile": self.profile(), "heap": self.heap()}
+
+    def _base(self, kind):
+        """Percorso senza estensione: i file di una stessa cattura condividono il timestamp"""
+        os.makedirs(self.out_dir, exist_ok=True)
+        return os.path.join(self.out_dir, f"{kind}-{datetime.now().strftime('%Y%m%d-%H%M%S-%f')}")
+
+    def _write(self, path, text):
+        with open(path, "w") as f:
+            f.write(text)
+        return path
+
+    # ── STACK ───────────────────────────────────────────────────────────────
+
+    def stacks(self):
+        frames = sys._current_frames()
+        threads = sorted(threading.enumerate(), key=lambda t: t.name)
+        lines, roles = [], Counter()
+        for thread in threads:
+            frame = frames.get(thread.ident)
+            if frame is None:
+                continue
+            roles[_role(thread.name)] += 1
+            lines.append(f"--- {thread.name} (ident {thread.ident}{', daemon' if thread.daemon else ''})")
+            lines.extend(line.rstrip("\n") for line in traceback.format_stack(frame))
+            lines.append("")
+
+        tasks = []
+        if self.loop and not self.loop.is_closed():
+            try:
+                tasks = sorted(asyncio.all_tasks(self.loop), key=lambda t: t.get_name())
+            except RuntimeError:
+                tasks = []
+            for task in tasks:
+                lines.append(f"--- task {task.get_name()}")
+                out = StringIO()
+                task.print_stack(file=out)
+                lines.append(out.getvalue())
+
+        path = self._write(self._base("stacks") + ".txt", "\n".join(lines))
+        print(f"🩺 Thread stacks written to {path}")
+        return {"file": path, "threads": sum(roles.values()), "tasks": len(tasks), "by_role": dict(roles)}
+
+    # ── PROFILO ─────────────────────────────────────────────────────────────
+
+    def profile(self, seconds=None):
+        if not self._busy.acquire(blocking=False):
+            raise RuntimeError("another capture is already running")
+        try:
+            return self._profile(seconds or self.profile_seconds)
+        finally:
+            self._busy.release()
+
+    def _profile(self, seconds):
+        own = threading.get_ident()
+        threads = {}                   # ident → (nome, native_id, CPU all'inizio)
+        samples = defaultdict(Counter)  # ident → {stack: campioni}
+        profiler = cProfile.Profile() if CPROFILE_ALL_THREADS else None
+
+        def refresh_threads():
+            for t in threading.enumerate():
+                if t.ident not in threads and t.ident != own:
+                    threads[t.ident] = (t.name, t.native_id, _thread_cpu(t.native_id))
+
+        refresh_threads()
+        if profiler:
+            profiler.enable()
+        start = time.monotonic()
+        next_refresh = start + 1
+        try:
+            while time.monotonic() - start < seconds:
+                for ident, frame in sys._current_frames().items():
+                    if ident not in threads:
+                        continue
+                    stack = []
+                    while frame is not None:
+                        code = frame.f_code
+                        stack.append(f"{os.path.basename(code.co_filename)}:{getattr(code, 'co_qualname', code.co_name)}")
+                        frame = frame.f_back
+                    samples[ident][tuple(reversed(stack))] += 1
+                if time.monotonic() >= next_refresh:
+                    refresh_threads()  # watcher di namespace nuovi durante la cattura
+                    next_refresh += 1
+                time.sleep(self.interval)
+        finally:
+            if profiler:
+                profiler.disable()
+        elapsed = time.monotonic() - start
+
+        report = []
+        for ident, (name, native_id, cpu_start) in threads.items():
+            stacks = samples.get(ident)
+            if not stacks:
+                continue
+            cpu_end = _thread_cpu(native_id)
+            total = sum(stacks.values())
+            busy = Counter()
+            inclusive = Counter()
+            for stack, n in stacks.items():
+                leaf = stack[-1]
+                filename, fn = leaf.split(":", 1)
+                if (filename, fn.rsplit(".", 1)[-1]) in IDLE_LEAVES:
+                    continue
+                busy[leaf] += n
+                for fn in set(stack):
+                    inclusive[fn] += n
+            report.append({
+                "thread": name,
+                "cpu_s": round(cpu_end - cpu_start, 3) if cpu_start is not None and cpu_end is not None else None,
+                "samples": total,
+                "busy_pct": round(100 * sum(busy.values()) / total, 1),
+                "top_self": [(fn, round(100 * n / total, 1)) for fn, n in busy.most_common(5)],
+                "top_inclusive": [(fn, round(100 * n / total, 1)) for fn, n in inclusive.most_common(10)],
+            })
+        report.sort(key=lambda r: (-(r["cpu_s"] or 0), -r["busy_pct"]))
+
+        # formato "collapsed" (flamegraph.pl, speedscope): thread;frame;...;frame campioni
+        base = self._base("profile")
+        folded = self._write(base + ".folded", "".join(
+            f"{threads[ident][0]};{';'.join(stack)} {n}\n" for ident, stacks in samples.items() for stack, n in stacks.items()))
+        lines = [f"KuBog profile: {elapsed:.1f}s, sampled every {self.interval * 1000:.0f}ms, {len(report)} threads", ""]
+        for r in report:
+            cpu = f"{r['cpu_s']:.2f}s CPU" if r["cpu_s"] is not None else "CPU n/a"
+            lines.append(f"{r['thread']}: {cpu}, busy {r['busy_pct']}% of {r['samples']} samples")
+            lines.extend(f"    {pct:5.1f}%  {fn}" for fn, pct in r["top_inclusive"])
+            lines.append("")
+        files = [self._write(base + ".txt", "\n".join(lines)), folded]
+        if profiler:
+            pstats.Stats(profiler).dump_stats(base + ".pstats")
+            files.append(base + ".pstats")
+        print(f"🩺 {elapsed:.0f}s profile written to {files[0]}")
+        return {"files": files, "seconds": round(elapsed, 1), "threads": report[:self.top]}
+
+    # ── HEAP ────────────────────────────────────────────────────────────────
+
+    def heap(self, seconds=None, top=None):
+        """
+        Top-N righe per memoria allocata. Se tracemalloc non era già attivo viene acceso per
+        `seconds` e spento subito dopo: il risultato sono le allocazioni ancora vive fatte nella
+        finestra, cioè quello che sta crescendo.
+        """
+        if not self._busy.acquire(blocking=False):
+            raise RuntimeError("another capture is already running")
+        try:
+            seconds = seconds or self.profile_seconds
+            top = top or self.top
+            tracing = tracemalloc.is_tracing()
+            if not tracing:
+                tracemalloc.start()
+                time.sleep(seconds)
+            snapshot = tracemalloc.take_snapshot()
+            current, peak = tracemalloc.get_traced_memory()
+            if not tracing:
+                tracemalloc.stop()
+        finally:
+            self._busy.release()
+
+        snapshot = snapshot.filter_traces((
+            tracemalloc.Filter(False, tracemalloc.__file__),
+            tracemalloc.Filter(False, "<frozen importlib._bootstrap*>"),
+        ))
+        stats = snapshot.statistics("lineno")[:top]
+        entries = [{"where": f"{s.traceback[0].filename}:{s.traceback[0].lineno}",
+                    "size_kb": round(s.size / 1024, 1), "count": s.count} for s in stats]
+        window = "since tracing started" if tracing else f"allocated in the last {seconds}s and still alive"
+        lines = [f"KuBog heap: traced {current / 1024 / 1024:.1f} MiB (peak {peak / 1024 / 1024:.1f} MiB), {window}", ""]
+        lines.extend(f"{e['size_kb']:>10.1f} KiB {e['count']:>8} blocks  {e['where']}" for e in entries)
+        path = self._write(self._base("heap") + ".txt", "\n".join(lines) + "\n")
+        print(f"🩺 Heap snapshot written to {path}")
+        return {"file": path, "traced_mb": round(current / 1024 / 1024, 2), "window": window, "top": entries}
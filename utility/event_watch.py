@@ -0,0 +1,226 @@
+import time
+import threading
+from datetime import datetime
+from collections import defaultdict
+from kubernetes import watch
+from kubernetes.client.rest import ApiException
+from utility.rate_limit import BULK
+
+# reason degli Event core/v1 → type della riga KuBog
+EVENT_TYPES = {
+    "Unhealthy": "PROBE_FAILURE",
+    "BackOff": "BACK_OFF",
+    "Evicted": "EVICTED",
+    "FailedScheduling": "FAILED_SCHEDULING",
+    "FailedMount": "FAILED_MOUNT",
+    "FailedAttachVolume": "FAILED_MOUNT",
+}
+
+# solo i Warning: i Normal (Pulled, Started, Scheduled...) sono la maggior parte del traffico
+WARNING_FIELD_SELECTOR = "type=Warning"
+
+
+def event_count(ev):
+    """Occorrenze già aggregate dall'API: series.count se presente, altrimenti count"""
+    if ev.series is not None and ev.series.count:
+        return ev.series.count
+    return ev.count or 1
+
+
+def _backoff_reason(message):
+    # stessa chiave delle regole esistenti in kube-alerts.yaml
+    if message and "pulling image" in message:
+        return "ImagePullBackOff"
+    return "CrashLoopBackOff"
+
+
+class EventAggregator:
+    """
+    Watch degli Event core/v1 (Warning) per i pod: probe fallite (Unhealthy), BackOff,
+    Evicted, FailedScheduling, FailedMount.
+    Le ripetizioni di uno stesso Event arrivano come MODIFIED con count/series.count
+    incrementato: si tiene l'ultimo count per uid e si accumula solo il delta in una riga
+    per Event, emessa verso _output ogni `flush_interval` secondi con `count` = occorrenze.
+    """
+
+    def __init__(self, debugger, flush_interval=15):
+        self.debugger = debugger
+        self.flush_interval = flush_interval
+        self.resource_version = None
+        self.counts = {}    # {uid Event: ultimo count visto}
+        self.pending = {}   # {uid Event: (riga, uid pod)}
+        self.stats = defaultdict(int)
+        self._lock = threading.Lock()
+        self._stop = threading.Event()
+        self._watch = None
+
+    def seed(self, events):
+        """Count correnti dalla lista iniziale: si emettono solo le occorrenze successive"""
+        with self._lock:
+            self.counts = {ev.metadata.uid: event_count(ev) for ev in events.items}
+        self.resource_version = events.metadata.resource_version
+
+    def handle(self, event):
+        ev = event["object"]
+        self.resource_version = ev.metadata.resource_version
+        uid = ev.metadata.uid
+        self.stats["received"] += 1
+
+        if event["type"] == "DELETED":
+            # gli Event scadono (TTL 1h): il contatore segue la loro vita
+            with self._lock:
+                self.counts.pop(uid, None)
+            return
+
+        count = event_count(ev)
+        event_type = EVENT_TYPES.get(ev.reason)
+        obj = ev.involved_object
+        if (event_type is None or obj is None or obj.kind != "Pod"
+                or obj.namespace not in self.debugger.args.namespaces):
+            with self._lock:
+                self.counts[uid] = count
+            return
+
+        with self._lock:
+            delta = count - self.counts.get(uid, 0)
+            self.counts[uid] = count
+            if delta <= 0:
+                return
+            self.stats["occurrences"] += delta
+            if uid in self.pending:
+                row = self.pending[uid][0]
+                row["count"] += delta
+                row["timestamp"] = datetime.now().isoformat()
+                row["message"] = ev.message
+                row["resource_version"] = ev.metadata.resource_version
+                self.stats["collapsed"] += 1
+            else:
+                self.pending[uid] = (self._row(ev, event_type, delta), obj.uid)
+
+    def _row(self, ev, event_type, count):
+        obj = ev.involved_object
+        container = None
+        if obj.field_path and obj.field_path.startswith("spec.containers{"):
+            container = obj.field_path[len("spec.containers{"):-1]
+
+        row = {col: None for col in self.debugger.all_columns}
+        row.update({
+            "timestamp": datetime.now().isoformat(),
+            "namespace": obj.namespace,
+            "type": event_type,
+            "pod": obj.name,
+            "container": container,
+            "reason": ev.reason,
+            "message": ev.message,
+            "node": ev.source.host if ev.source else None,
+            "resource_version": ev.metadata.resource_version,
+            "count": count,
+        })
+        if event_type == "PROBE_FAILURE":
+            # "Liveness probe failed: HTTP probe failed with statuscode: 500"
+            row["probe_type"] = (ev.message or "").split(" ", 1)[0] or None
+            row["probe_message"] = ev.message
+        elif event_type == "BACK_OFF":
+            row["reason"] = _backoff_reason(ev.message)
+        return row
+
+    def _workload(self, namespace, pod_name, pod_uid):
+        d = self.debugger
+        state = d.pod_states.get(pod_uid)
+        if state is not None and state.workload:
+            return state.workload
+        try:
+            pod = d.api_profiler.profile(
+                "read", "pods", namespace, lambda: d.v1.read_namespaced_pod(pod_name, namespace))
+            workload, labels = d._get_workload(pod), pod.metadata.labels
+        except ApiException:
+            workload, labels = "Unknown", None  # pod già eliminato (Evicted, FailedScheduling annullato...)
+        # anche "Unknown" resta in cache: lo slot viene rimosso dalla riconciliazione
+        state = d.pod_states.slot(pod_uid, namespace, pod_name)
+        state.workload, state.labels = workload, labels
+        return workload
+
+    def flush(self):
+        """Emette le righe accumulate, raggruppate per namespace"""
+        with self._lock:
+            pending, self.pending = self.pending, {}
+        if not pending:
+            return
+
+        monitored = self.debugger.monitored_workloads
+        by_namespace = defaultdict(list)
+        for row, pod_uid in pending.values():
+            ns = row["namespace"]
+            row["workload"] = self._workload(ns, row["pod"], pod_uid)
+            if self.debugger.alert_manager.rules.uses_labels:
+                state = self.debugger.pod_states.pods.get(pod_uid)
+                row["labels"] = state.labels if state else None
+            if monitored and row["workload"].split("/")[-1] not in monitored.get(ns, []):
+                continue
+            if row["count"] > 1:
+                row["message"] = f"{row['message']} (x{row['count']})"
+            by_namespace[ns].append(row)
+
+        for ns, rows in by_namespace.items():
+            self.stats["emitted"] += len(rows)
+            self.debugger._output(rows, ns)
+
+    # ── WATCH (engine a thread) ─────────────────────────────────────────────
+
+    def start(self):
+        threading.Thread(target=self._watch_loop, name="event-watch", daemon=True).start()
+        threading.Thread(target=self._flush_loop, name="event-flush", daemon=True).start()
+        print(f"📣 Watching Warning events (flush every {self.flush_interval}s)")
+
+    def stop(self):
+        self._stop.set()
+        if self._watch:
+            self._watch.stop()
+        self.flush()
+
+    def _flush_loop(self):
+        while not self._stop.wait(self.flush_interval):
+            try:
+                self.flush()
+            except Exception as e:
+                print(f"⚠️ Event flush error: {e}")
+
+    def _watch_loop(self):
+        d = self.debugger
+        delay = d.watch_retry_delay
+        while not self._stop.is_set():
+            try:
+                if self.resource_version is None:
+                    self.seed(d.api_profiler.profile(
+                        "list", "events", None,
+                        lambda: d.v1.list_event_for_all_namespaces(field_selector=WARNING_FIELD_SELECTOR),
+                        priority=BULK))
+                d.api_profiler.throttle(BULK)
+                self._watch = watch.Watch()
+                for event in self._watch.stream(
+                    d.v1.list_event_for_all_namespaces,
+                    field_selector=WARNING_FIELD_SELECTOR,
+                    resource_version=self.resource_version,
+                    timeout_seconds=300,
+                ):
+                    if d.recorder:
+                        d.recorder.record_watch("event", event)
+                    try:
+                        self.handle(event)
+                    except Exception as inner_e:
+                        print(f"⚠️ Error processing Kubernetes event: {inner_e}")
+                    delay = d.watch_retry_delay
+            except ApiException as e:
+                if e.status == 410:
+                    # resourceVersion scaduta: nuova lista e nuovi count di partenza
+                    self.resource_version = None
+                    continue
+                print(f"⚠️ Event watch error: {e}")
+                time.sleep(delay)
+                delay = min(delay * d.backoff_factor, d.max_retry_delay)
+            except Exception as e:
+                if self._stop.is_set():
+                    return
+                print(f"⚠️ Event watch error: {e}")
+                time.sleep(delay)
+                delay = min(delay * d.backoff_factor, d.max_retry_delay)
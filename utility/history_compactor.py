@@ -0,0 +1,257 @@
+import os
+import csv
+import gzip
+import glob
+from datetime import datetime, timedelta
+from collections import defaultdict
+
+NODE_METRICS = [
+    "cpu_capacity", "cpu_allocatable", "cpu_usage", "cpu_requests", "cpu_limits",
+    "mem_capacity", "mem_allocatable", "mem_usage", "mem_requests", "mem_limits",
+]
+
+# condizioni contate come "campioni sotto pressione" per bucket
+NODE_CONDITIONS = {
+    "memory_pressure_samples": ("condition_MemoryPressure", "True"),
+    "disk_pressure_samples": ("condition_DiskPressure", "True"),
+    "pid_pressure_samples": ("condition_PIDPressure", "True"),
+    "not_ready_samples": ("condition_Ready", "False"),
+}
+
+NODE_ROLLUP_FIELDS = (
+    ["bucket", "node", "samples"]
+    + [f"{m}_{agg}" for m in NODE_METRICS for agg in ("avg", "max")]
+    + list(NODE_CONDITIONS)
+)
+
+EVENT_ROLLUP_FIELDS = ["bucket", "namespace", "workload", "type", "reason", "exit_code", "count"]
+
+GRANULARITIES = {
+    "hourly": lambda ts: ts.replace(minute=0, second=0, microsecond=0),
+    "daily": lambda ts: ts.replace(hour=0, minute=0, second=0, microsecond=0),
+}
+
+
+def _parse_ts(value):
+    try:
+        return datetime.fromisoformat(value)
+    except (TypeError, ValueError):
+        return None
+
+
+def _to_float(value):
+    try:
+        return float(value) if value not in (None, "") else None
+    except ValueError:
+        return None
+
+
+def _to_count(value):
+    """Occorrenze di una riga: `count` delle righe aggregate (Event), 1 per le altre"""
+    try:
+        return max(int(float(value)), 1) if value not in (None, "") else 1
+    except ValueError:
+        return 1
+
+
+class HistoryCompactor:
+    """
+    Compatta i CSV storici (nodes/ e workload/<ns>/):
+    le righe raw più vecchie di `retention_days` vengono aggregate in rollup
+    orari e giornalieri gzip sotto `compacted/`, poi rimosse dal file raw.
+    Si compattano solo giorni interi, così ogni giorno finisce in un solo segmento;
+    righe arrivate in ritardo per un intervallo già compattato vengono unite al segmento esistente.
+    """
+
+    def __init__(self, base_dir, retention_days=7, lock=None):
+        self.base_dir = base_dir
+        self.retention_days = retention_days
+        self.lock = lock
+
+    def compact(self, now=None):
+        now = now or datetime.now()
+        cutoff = GRANULARITIES["daily"](now - timedelta(days=self.retention_days))
+        stats = {"files": 0, "rows_compacted": 0}
+
+        for path in glob.glob(os.path.join(self.base_dir, "nodes", "debug_node_*.csv")):
+            stats["rows_compacted"] += self._compact_file(
+                path, cutoff, self._rollup_nodes, self._merge_nodes, NODE_ROLLUP_FIELDS)
+            stats["files"] += 1
+
+        for path in glob.glob(os.path.join(self.base_dir, "workload", "*", "debug_*.csv")):
+            stats["rows_compacted"] += self._compact_file(
+                path, cutoff, self._rollup_events, self._merge_events, EVENT_ROLLUP_FIELDS)
+            stats["files"] += 1
+
+        if stats["rows_compacted"]:
+            print(f"🗜️ Compacted {stats['rows_compacted']} rows across {stats['files']} history files")
+        return stats
+
+    def _compact_file(self, path, cutoff, rollup, merge, fieldnames):
+        if self.lock:
+            with self.lock:
+                return self._compact_file_locked(path, cutoff, rollup, merge, fieldnames)
+        return self._compact_file_locked(path, cutoff, rollup, merge, fieldnames)
+
+    def _compact_file_locked(self, path, cutoff, rollup, merge, fieldnames):
+        try:
+            with open(path, newline="") as f:
+                reader = csv.DictReader(f)
+                header = reader.fieldnames
+                old_rows, keep_rows = [], []
+                for row in reader:
+                    ts = _parse_ts(row.get("timestamp"))
+                    if ts is not None and ts < cutoff:
+                        old_rows.append((ts, row))
+                    else:
+                        keep_rows.append(row)
+        except Exception as e:
+            print(f"⚠️ Compaction read failed for {path}: {e}")
+            return 0
+
+        if not old_rows:
+            return 0
+
+        stem = os.path.splitext(os.path.basename(path))[0]
+        out_dir = os.path.join(os.path.dirname(path), "compacted")
+        os.makedirs(out_dir, exist_ok=True)
+        first = min(ts for ts, _ in old_rows).strftime("%Y%m%d")
+        last = max(ts for ts, _ in old_rows).strftime("%Y%m%d")
+
+        segments = []
+        for granularity, floor in GRANULARITIES.items():
+            segment = os.path.join(out_dir, f"{stem}.{granularity}.{first}-{last}.csv.gz")
+            rows = rollup(old_rows, floor)
+            if os.path.exists(segment):
+                # stesso intervallo già compattato (righe in ritardo): si unisce, non si sovrascrive
+                try:
+                    with gzip.open(segment, "rt", newline="") as f:
+                        rows = merge(list(csv.DictReader(f)), rows)
+                except Exception as e:
+                    print(f"⚠️ Compaction merge failed for {segment}: {e}")
+                    return 0  # righe raw lasciate al loro posto, si riprova al prossimo giro
+            segments.append((segment, rows))
+
+        for segment, rows in segments:
+            tmp = segment + ".tmp"
+            with gzip.open(tmp, "wt", newline="") as f:
+                writer = csv.DictWriter(f, fieldnames=fieldnames)
+                writer.writeheader()
+                writer.writerows(rows)
+            os.replace(tmp, segment)
+
+        # riscrive il file raw con le sole righe ancora nel periodo di retention
+        tmp = path + ".tmp"
+        with open(tmp, "w", newline="") as f:
+            writer = csv.DictWriter(f, fieldnames=header)
+            writer.writeheader()
+            writer.writerows(keep_rows)
+        os.replace(tmp, path)
+        return len(old_rows)
+
+    def _rollup_nodes(self, rows, floor):
+        buckets = {}
+        for ts, row in rows:
+            key = (floor(ts), row.get("node"))
+            agg = buckets.get(key)
+            if agg is None:
+                agg = buckets[key] = {
+                    "samples": 0,
+                    "sum": defaultdict(float), "n": defaultdict(int), "max": {},
+                    "cond": defaultdict(int),
+                }
+            agg["samples"] += 1
+            for m in NODE_METRICS:
+                v = _to_float(row.get(m))
+                if v is None:
+                    continue
+                agg["sum"][m] += v
+                agg["n"][m] += 1
+                agg["max"][m] = max(agg["max"].get(m, v), v)
+            for out, (col, bad) in NODE_CONDITIONS.items():
+                if row.get(col) == bad:
+                    agg["cond"][out] += 1
+
+        result = []
+        for (bucket, node), agg in sorted(buckets.items(), key=lambda kv: (kv[0][0], kv[0][1] or "")):
+            out = {"bucket": bucket.isoformat(), "node": node, "samples": agg["samples"]}
+            for m in NODE_METRICS:
+                n = agg["n"][m]
+                out[f"{m}_avg"] = round(agg["sum"][m] / n, 3) if n else None
+                out[f"{m}_max"] = agg["max"].get(m)
+            for name in NODE_CONDITIONS:
+                out[name] = agg["cond"][name]
+            result.append(out)
+        return result
+
+    def _rollup_events(self, rows, floor):
+        counts = defaultdict(int)
+        for ts, row in rows:
+            key = (
+                floor(ts), row.get("namespace") or "", row.get("workload") or "",
+                row.get("type") or "", row.get("reason") or "", row.get("exit_code") or "",
+            )
+            counts[key] += _to_count(row.get("count"))
+
+        return [
+            {
+                "bucket": bucket.isoformat(), "namespace": ns, "workload": wl,
+                "type": typ, "reason": reason, "exit_code": code, "count": count,
+            }
+            for (bucket, ns, wl, typ, reason, code), count in sorted(counts.items(), key=lambda kv: kv[0])
+        ]
+
+
+    def _merge_nodes(self, existing, rows):
+        """Unisce due rollup dei nodi: campioni e condizioni sommati, medie pesate sui campioni, massimi"""
+        merged = {}
+        for row in existing + rows:
+            key = (row.get("bucket"), row.get("node") or "")
+            prev = merged.get(key)
+            if prev is None:
+                merged[key] = dict(row)
+                continue
+            a, b = _to_count(prev.get("samples")), _to_count(row.get("samples"))
+            out = {"bucket": key[0], "node": row.get("node"), "samples": a + b}
+            for m in NODE_METRICS:
+                avg_a, avg_b = _to_float(prev.get(f"{m}_avg")), _to_float(row.get(f"{m}_avg"))
+                if avg_a is None or avg_b is None:
+                    out[f"{m}_avg"] = avg_a if avg_b is None else avg_b
+                else:
+                    out[f"{m}_avg"] = round((avg_a * a + avg_b * b) / (a + b), 3)
+                peaks = [v for v in (_to_float(prev.get(f"{m}_max")), _to_float(row.get(f"{m}_max"))) if v is not None]
+                out[f"{m}_max"] = max(peaks) if peaks else None
+            for name in NODE_CONDITIONS:
+                out[name] = int(_to_float(prev.get(name)) or 0) + int(_to_float(row.get(name)) or 0)
+            merged[key] = out
+        return [merged[key] for key in sorted(merged)]
+
+    def _merge_events(self, existing, rows):
+        """Unisce due rollup degli eventi sommando i count per bucket e chiave"""
+        counts = defaultdict(int)
+        for row in existing + rows:
+            key = tuple(str(row.get(col) or "") for col in EVENT_ROLLUP_FIELDS[:-1])
+            counts[key] += _to_count(row.get("count"))
+        return [dict(zip(EVENT_ROLLUP_FIELDS, key + (count,))) for key, count in sorted(counts.items())]
+
+
+def iter_history(csv_path, granularity="raw"):
+    """
+    Legge in streaming la storia di un file CSV (es. nodes/debug_node_x.csv):
+    con granularity='hourly'/'daily' scorre i segmenti gzip in ordine cronologico,
+    con 'raw' restituisce le righe del file non ancora compattato.
+    """
+    if granularity == "raw":
+        if os.path.isfile(csv_path):
+            with open(csv_path, newline="") as f:
+                yield from csv.DictReader(f)
+        return
+
+    if granularity not in GRANULARITIES:
+        raise ValueError(f"Unknown granularity: {granularity}")
+
+    stem = os.path.splitext(os.path.basename(csv_path))[0]
+    pattern = os.path.join(os.path.dirname(csv_path), "compacted", f"{stem}.{granularity}.*.csv.gz")
+    for segment in sorted(glob.glob(pattern)):
+        with gzip.open(segment, "rt", newline="") as f:
+            yield from csv.DictReader(f)
@@ -0,0 +1,255 @@
+import os
+import io
+import csv
+import glob
+import hashlib
+import sqlite3
+import argparse
+from collections import Counter
+from datetime import datetime
+
+INDEX_FILE = "history_index.db"
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS files (
+    path TEXT PRIMARY KEY,
+    header TEXT,
+    offset INTEGER NOT NULL,
+    last_ts REAL NOT NULL,
+    inode INTEGER,
+    head TEXT
+);
+CREATE TABLE IF NOT EXISTS events (
+    ts REAL NOT NULL,
+    namespace TEXT,
+    workload TEXT,
+    type TEXT,
+    reason TEXT,
+    exit_code INTEGER,
+    pod TEXT,
+    container TEXT,
+    count INTEGER NOT NULL DEFAULT 1
+);
+CREATE INDEX IF NOT EXISTS idx_events_wl_ts ON events(namespace, workload, ts);
+CREATE INDEX IF NOT EXISTS idx_events_type_ts ON events(type, ts);
+CREATE INDEX IF NOT EXISTS idx_events_reason_ts ON events(reason, ts);
+CREATE INDEX IF NOT EXISTS idx_events_exit_ts ON events(exit_code, ts);
+CREATE INDEX IF NOT EXISTS idx_events_ts ON events(ts);
+"""
+
+FILTERS = ("namespace", "workload", "type", "reason", "exit_code")
+GROUP_COLUMNS = ("namespace", "workload", "type", "reason", "exit_code", "pod", "container")
+BUCKETS = {"minute": 60, "hour": 3600, "day": 86400}
+HEAD_BYTES = 4096  # inizio del file confrontato a ogni giro per riconoscere le riscritture
+
+
+def _epoch(value):
+    try:
+        return datetime.fromisoformat(value).timestamp()
+    except (TypeError, ValueError):
+        return None
+
+
+def _head(f, length):
+    f.seek(0)
+    return hashlib.sha1(f.read(length)).hexdigest()
+
+
+def _int_or_none(value):
+    try:
+        return int(value) if value not in (None, "") else None
+    except ValueError:
+        return None
+
+
+class HistoryIndex:
+    """
+    Indice SQLite sopra i CSV di workload/<ns>/debug_*.csv.
+    Ogni file viene letto solo dall'ultimo offset indicizzato, quindi
+    `update()` costa quanto le righe appese dall'ultima chiamata.
+    Un file riscritto (compattazione: tmp + os.replace) si riconosce da inode e hash dei primi
+    HEAD_BYTES, anche se nel frattempo è tornato più lungo dell'offset salvato.
+    Le righe aggregate (Event di --events) contano per il loro `count` in count/top/histogram.
+    """
+
+    def __init__(self, base_dir, db_path=None):
+        self.base_dir = base_dir
+        self.db_path = db_path or os.path.join(base_dir, INDEX_FILE)
+        self.conn = sqlite3.connect(self.db_path)
+        self.conn.executescript(SCHEMA)
+        # indici creati prima delle colonne inode/head e count
+        for table, column, kind in (("files", "inode", "INTEGER"), ("files", "head", "TEXT"),
+                                    ("events", "count", "INTEGER NOT NULL DEFAULT 1")):
+            if column not in {r[1] for r in self.conn.execute(f"PRAGMA table_info({table})")}:
+                self.conn.execute(f"ALTER TABLE {table} ADD COLUMN {column} {kind}")
+
+    def close(self):
+        self.conn.close()
+
+    def update(self):
+        """Indicizza le righe nuove di tutti i CSV di workload; ritorna quante ne ha aggiunte"""
+        added = 0
+        for path in sorted(glob.glob(os.path.join(self.base_dir, "workload", "*", "debug_*.csv"))):
+            try:
+                added += self._index_file(path)
+            except Exception as e:
+                print(f"⚠️ Indexing failed for {path}: {e}")
+        self.conn.commit()
+        return added
+
+    def _index_file(self, path):
+        rel = os.path.relpath(path, self.base_dir)
+        row = self.conn.execute(
+            "SELECT header, offset, last_ts, inode, head FROM files WHERE path = ?", (rel,)).fetchone()
+        header, offset, last_ts, inode, head = row if row else (None, 0, 0.0, None, None)
+
+        with open(path, "rb") as f:
+            stat = os.fstat(f.fileno())
+            skip_until = None
+            rewritten = stat.st_size < offset or (inode is not None and inode != stat.st_ino) or (
+                head is not None and _head(f, min(offset, HEAD_BYTES)) != head)
+            if rewritten:
+                # file riscritto (es. compattazione): rilegge tutto ma salta le righe già viste
+                header, offset, skip_until = None, 0, last_ts
+            if stat.st_size == offset:
+                return 0
+            f.seek(offset)
+            chunk = f.read()
+
+            # indicizza solo righe complete, l'eventuale coda parziale al prossimo giro
+            end = chunk.rfind(b"\n")
+            if end < 0:
+                return 0
+            chunk = chunk[:end + 1]
+            new_offset = offset + len(chunk)
+            if offset < HEAD_BYTES or head is None:
+                head = _head(f, min(new_offset, HEAD_BYTES))
+
+        lines = io.StringIO(chunk.decode("utf-8", errors="replace"), newline="")
+        if header is None:
+            header = next(csv.reader(lines), None)
+            if not header:
+                return 0
+            header = ",".join(header)
+        reader = csv.DictReader(lines, fieldnames=header.split(","))
+
+        # righe con lo stesso timestamp dell'ultima indicizzata: si salta solo quelle già nell'indice
+        seen = Counter()
+        if skip_until is not None:
+            seen.update(self.conn.execute(
+                "SELECT ts, namespace, workload, type, reason, exit_code, pod, container, count "
+                "FROM events WHERE ts = ?", (skip_until,)))
+
+        rows = []
+        for r in reader:
+            ts = _epoch(r.get("timestamp"))
+            if ts is None or (skip_until is not None and ts < skip_until):
+                continue
+            row = (
+                ts, r.get("namespace"), r.get("workload"), r.get("type"),
+                r.get("reason") or None, _int_or_none(r.get("exit_code")),
+                r.get("pod"), r.get("container") or None, max(_int_or_none(r.get("count")) or 1, 1),
+            )
+            if seen[row]:
+                seen[row] -= 1
+                continue
+            rows.append(row)
+
+        if rows:
+            self.conn.executemany(
+                "INSERT INTO events (ts, namespace, workload, type, reason, exit_code, pod, container, count) "
+                "VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)", rows)
+            last_ts = max(last_ts, max(r[0] for r in rows))
+        self.conn.execute(
+            "INSERT OR REPLACE INTO files (path, header, offset, last_ts, inode, head) VALUES (?, ?, ?, ?, ?, ?)",
+            (rel, header, new_offset, last_ts, stat.st_ino, head),
+        )
+        return len(rows)
+
+    # ── QUERIES ─────────────────────────────────────────────────────────────
+
+    def _where(self, filters, since=None, until=None):
+        clauses, params = [], []
+        for col in FILTERS:
+            value = filters.get(col)
+            if value is None:
+                continue
+            clauses.append(f"{col} = ?")
+            params.append(value)
+        if since is not None:
+            clauses.append("ts >= ?")
+            params.append(since)
+        if until is not None:
+            clauses.append("ts < ?")
+            params.append(until)
+        return (" WHERE " + " AND ".join(clauses)) if clauses else "", params
+
+    def count(self, filters, since=None, until=None):
+        where, params = self._where(filters, since, until)
+        return self.conn.execute(f"SELECT COALESCE(SUM(count), 0) FROM events{where}", params).fetchone()[0]
+
+    def top(self, filters, by="workload", limit=10, since=None, until=None):
+        if by not in GROUP_COLUMNS:
+            raise ValueError(f"Cannot group by {by}")
+        where, params = self._where(filters, since, until)
+        group = f"namespace, {by}" if by == "workload" else by
+        sql = f"SELECT {group}, SUM(count) AS n FROM events{where} GROUP BY {group} ORDER BY n DESC LIMIT ?"
+        return self.conn.execute(sql, params + [limit]).fetchall()
+
+    def histogram(self, filters, bucket="hour", since=None, until=None):
+        step = BUCKETS[bucket]
+        where, params = self._where(filters, since, until)
+        sql = (f"SELECT CAST(ts / {step} AS INTEGER) * {step} AS b, SUM(count) FROM events{where} "
+               f"GROUP BY b ORDER BY b")
+        return [(datetime.fromtimestamp(b).isoformat(), n) for b, n in self.conn.execute(sql, params)]
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(prog="kubog query", description="Query KuBog workload history")
+    parser.add_argument("mode", choices=["count", "top", "histogram", "reindex"])
+    parser.add_argument("--dir", default=os.getcwd(), help="KuBog output directory")
+    parser.add_argument("--namespace")
+    parser.add_argument("--workload", help="e.g. Deployment/api")
+    parser.add_argument("--type", help="e.g. OOM_KILLED")
+    parser.add_argument("--reason")
+    parser.add_argument("--exit-code", type=int)
+    parser.add_argument("--since", help="ISO timestamp, e.g. 2025-06-03T00:00")
+    parser.add_argument("--until", help="ISO timestamp (exclusive)")
+    parser.add_argument("--by", default="workload", choices=GROUP_COLUMNS, help="Grouping column for top")
+    parser.add_argument("--limit", type=int, default=10)
+    parser.add_argument("--bucket", default="hour", choices=list(BUCKETS))
+    args = parser.parse_args(argv)
+    since = _epoch(args.since) if args.since else None
+    until = _epoch(args.until) if args.until else None
+    if args.since and since is None:
+        parser.error(f"--since: invalid ISO timestamp {args.since!r}")
+    if args.until and until is None:
+        parser.error(f"--until: invalid ISO timestamp {args.until!r}")
+
+    index = HistoryIndex(args.dir)
+    if args.mode == "reindex":
+        index.conn.executescript("DELETE FROM events; DELETE FROM files;")
+    added = index.update()
+    if args.mode == "reindex":
+        print(f"🗂️ Indexed {added} rows")
+        index.close()
+        return
+
+    filters = {
+        "namespace": args.namespace, "workload": args.workload, "type": args.type,
+        "reason": args.reason, "exit_code": args.exit_code,
+    }
+
+    if args.mode == "count":
+        print(index.count(filters, since, until))
+    elif args.mode == "top":
+        for row in index.top(filters, args.by, args.limit, since, until):
+            print("\t".join("" if v is None else str(v) for v in row))
+    else:
+        for bucket, n in index.histogram(filters, args.bucket, since, until):
+            print(f"{bucket}\t{n}")
+    index.close()
+
+
+if __name__ == "__main__":
+    main()
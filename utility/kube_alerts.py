@@ -2,19 +2,31 @@ import yaml
 import requests
 import os
 import smtplib
+import threading
 from email.message import EmailMessage
 from datetime import datetime, timedelta
 from collections import defaultdict
+from utility.anomaly import RateBaselines
+from utility.alert_rules import RuleIndex
 
 class KubeAlertManager:
     def __init__(self, config_path, teams_webhook_url=None, mail_config=None):
         self.config_path = config_path
         self.teams_webhook_url = teams_webhook_url or os.getenv("TEAMS_WEBHOOK_URL")
         self.config = {}
-        self.event_history = defaultdict(lambda: defaultdict(list))  # (ns, workload) -> type -> [timestamps]
+        self.event_history = defaultdict(lambda: defaultdict(list))  # (ns, workload) -> type -> [(timestamp, occorrenze)]
         self.mail_config = mail_config or self._load_mail_config()
         self.last_alert_sent = defaultdict(lambda: defaultdict(lambda: None))  # 👈 AGGIUNTO
+        self.applied_rules = defaultdict(dict)  # (ns, workload) -> chiave -> regola effettiva (override compresi)
+        # should_alert gira nel thread dell'AlertSink e in quello del controllo nodi: finestre e cooldown sotto lock
+        self.lock = threading.Lock()
         self.load_config()
+        # regole `type: anomaly`: baseline EWMA per (namespace, workload, chiave) invece della soglia fissa
+        self.baselines = RateBaselines(**self.config.get("anomaly-baseline", {}))
+        self.baselines.tracked = {
+            key for key in self.rules.keys()
+            if any(r.get("enabled", False) and r.get("type") == "anomaly" for r in self.rules.variants(key))
+        }
 
     def _load_mail_config(self):
         if os.getenv("SMTP_SERVER") and os.getenv("SMTP_TO"):
@@ -36,13 +48,20 @@ class KubeAlertManager:
         except Exception as e:
             print(f"⚠️ Failed to load alert config: {e}")
             self.config = {}
+        # regole e override (namespace / workload / label) compilati in un indice per (chiave, namespace)
+        self.rules = RuleIndex(self.config.get("kube-alerts"))
 
-    def should_alert(self, event):
+    def _scope(self, event):
         ns = event.get("namespace", "-")
-        workload = event.get("workload", "Unknown")
-        now = datetime.utcnow()
-
-        # Determina la chiave
+        if event.get("cluster"):
+            ns = f"{event['cluster']}/{ns}"  # --contexts: stesse regole, contatori separati per cluster
+        return ns, event.get("workload", "Unknown")
+
+    def _match_rule(self, event):
+        """
+        Prima regola abilitata tra ExitCode_<n>, reason e type: (regola, chiave).
+        Per ogni chiave vale l'override più specifico che corrisponde all'evento, altrimenti la regola base.
+        """
         exit_code = event.get("exit_code")
         reason = event.get("reason")
         event_type = event.get("type")
@@ -55,41 +74,74 @@ class KubeAlertManager:
         if event_type:
             possible_keys.append(event_type)
 
+        labels = event.get("labels")
         rule = None
         used_key = None
         for key in possible_keys:
-            rule = self.config.get("kube-alerts", {}).get(key)
+            rule = self.rules.lookup(key, event, labels)
             if rule and rule.get("enabled", False):
                 used_key = key
                 break
+        return (rule, used_key) if used_key else (None, None)
+
+    def observe(self, event):
+        """Aggiorna la baseline dell'evento (O(1)); chiamata da _output per ogni evento"""
+        rule, key = self._match_rule(event)
+        if rule and rule.get("type") == "anomaly":
+            ns, workload = self._scope(event)
+            self.baselines.observe(ns, workload, key, event.get("count") or 1)
+
+    def should_alert(self, event):
+        ns, workload = self._scope(event)
+        now = datetime.utcnow()
 
+        rule, used_key = self._match_rule(event)
         if not rule:
             return False, None
 
-        # Salva evento nella history
-        self.event_history[(ns, workload)][used_key].append(now)
+        with self.lock:
+            if rule.get("type") == "anomaly":
+                verdict = self.baselines.check(ns, workload, used_key, rule)
+                if verdict is not None:
+                    return self._anomaly_alert(ns, workload, used_key, rule, verdict, now)
+                # baseline non ancora pronta (warm-up): vale la soglia statica della regola
 
-        within_minutes = rule.get("within_minutes", 60)
-        cutoff = now - timedelta(minutes=within_minutes)
+            # Salva evento nella history (le righe da --events portano `count` occorrenze aggregate)
+            self.event_history[(ns, workload)][used_key].append((now, event.get("count") or 1))
+            self.applied_rules[(ns, workload)][used_key] = rule
 
-        self.event_history[(ns, workload)][used_key] = [
-            t for t in self.event_history[(ns, workload)][used_key] if t >= cutoff
-        ]
+            within_minutes = rule.get("within_minutes", 60)
+            cutoff = now - timedelta(minutes=within_minutes)
 
-        count = len(self.event_history[(ns, workload)][used_key])
-        min_occur = rule.get("min_occurrences", 1)
+            self.event_history[(ns, workload)][used_key] = [
+                (t, n) for t, n in self.event_history[(ns, workload)][used_key] if t >= cutoff
+            ]
 
-        # ⛔ Check: alert già inviato di recente?
-        last_sent = self.last_alert_sent[(ns, workload)][used_key]
-        if last_sent and last_sent > cutoff:
-            return False, None
+            count = sum(n for _, n in self.event_history[(ns, workload)][used_key])
+            min_occur = rule.get("min_occurrences", 1)
 
-        if count >= min_occur and rule.get("notify", False):
-            # ✅ Invia alert e salva timestamp
-            self.last_alert_sent[(ns, workload)][used_key] = now
-            return True, rule
+            # ⛔ Check: alert già inviato di recente?
+            last_sent = self.last_alert_sent[(ns, workload)][used_key]
+            if last_sent and last_sent > cutoff:
+                return False, None
 
-        return False, None
+            if count >= min_occur and rule.get("notify", False):
+                # ✅ Invia alert e salva timestamp
+                self.last_alert_sent[(ns, workload)][used_key] = now
+                return True, rule
+
+            return False, None
+
+    def _anomaly_alert(self, ns, workload, key, rule, verdict, now):
+        anomalous, detail = verdict
+        if not anomalous or not rule.get("notify", False):
+            return False, None
+        last_sent = self.last_alert_sent[(ns, workload)][key]
+        if last_sent and last_sent > now - timedelta(minutes=rule.get("within_minutes", 60)):
+            return False, None
+        self.last_alert_sent[(ns, workload)][key] = now
+        # copia della regola: l'evento è condiviso con gli altri sink e non va modificato
+        return True, {**rule, "message": f"{rule.get('message', '📈 Anomaly')} ({detail})"}
 
 
 
@@ -97,8 +149,18 @@ class KubeAlertManager:
         if not self.teams_webhook_url:
             print("⚠️ No Teams webhook configured.")
             return
-            
 
+        card = self.teams_card(event, rule)
+
+        try:
+            resp = requests.post(self.teams_webhook_url, json=card)
+            if resp.status_code >= 300:
+                print(f"❌ Failed to send alert to Teams: {resp.status_code} - {resp.text}")
+        except Exception as e:
+            print(f"❌ Exception sending Teams alert: {e}")
+
+    def teams_card(self, event, rule):
+        """MessageCard Teams per un evento (usata anche dall'engine asyncio)"""
         ns = event.get("namespace", "unknown")
         wl = event.get("workload", "unknown")
         typ = event.get("type")
@@ -116,7 +178,8 @@ class KubeAlertManager:
             "title": message,
             "sections": [
                 {
-                    "activityTitle": f"📦 Namespace: **{ns}**<br>🧱 Workload: **{wl}**",
+                    "activityTitle": (f"☸️ Cluster: **{event['cluster']}**<br>" if event.get("cluster") else "")
+                                     + f"📦 Namespace: **{ns}**<br>🧱 Workload: **{wl}**",
                     "facts": [
                         {"name": "Pod", "value": pod},
                         {"name": "Container", "value": container},
@@ -136,13 +199,7 @@ class KubeAlertManager:
                 }
             ]
         }
-
-        try:
-            resp = requests.post(self.teams_webhook_url, json=card)
-            if resp.status_code >= 300:
-                print(f"❌ Failed to send alert to Teams: {resp.status_code} - {resp.text}")
-        except Exception as e:
-            print(f"❌ Exception sending Teams alert: {e}")
+        return card
 
     def send_email_alert(self, event, rule):
         if not self.mail_config:
@@ -158,6 +215,7 @@ class KubeAlertManager:
             body = f"""
 🚨 KuBog Alert: {event.get('type')}
 
+☸️ Cluster:         {event.get('cluster') or '-'}
 📦 Namespace:       {event.get('namespace')}
 🧱 Workload:        {event.get('workload')}
 🐳 Pod:             {event.get('pod')}
@@ -197,6 +255,7 @@ class KubeAlertManager:
             body = f"""
 🚨 KuBog Alert: {event.get('type')}
 
+☸️ Cluster:    {event.get('cluster') or '-'}
 📦 Node:       {event.get('node')}
 
 📝 Message:         {event.get('message')}
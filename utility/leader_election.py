@@ -0,0 +1,244 @@
+import time
+import threading
+from collections import deque
+from datetime import datetime, timezone
+from kubernetes import client
+from kubernetes.client.rest import ApiException
+
+
+class LeaderElector:
+    """
+    Elezione active/passive su un unico Lease (stesso schema di client-go leaderelection).
+    - il leader rinnova il Lease ogni `retry_seconds`; si considera leader solo fino a
+      ultimo rinnovo riuscito + lease - retry (orologio locale), quindi smette di agire
+      prima che un altro replica possa subentrare, anche se l'API server non risponde
+    - uno standby subentra quando il record del Lease (holder, renewTime) non cambia per
+      `lease_seconds` misurati sul proprio orologio: nessuna dipendenza dagli orologi degli altri
+    - replace con resourceVersion: due standby non possono prendere il Lease insieme
+    - stop() rilascia il Lease (holder vuoto): lo standby subentra al tentativo successivo
+    I listener ricevono on_leader_change(leading, since): `since` è l'istante (clock) da cui
+    il vecchio leader potrebbe non aver più elaborato eventi.
+    """
+
+    def __init__(self, coordination_api, lease_namespace, name, identity, lease_seconds=10, retry_seconds=2,
+                 clock=time.monotonic):
+        self.api = coordination_api
+        self.lease_namespace = lease_namespace
+        self.name = name
+        self.identity = identity
+        self.lease_seconds = lease_seconds
+        self.retry_seconds = retry_seconds
+        self.clock = clock
+        self.listeners = []
+        self.leading = False
+        self.transitions = 0
+        self._leader_until = 0.0
+        self._takeover_since = None
+        self._observed = None      # (holder, renewTime) dell'ultima lettura
+        self._observed_at = clock()
+        self._stop = threading.Event()
+        self._thread = None
+
+    def is_leader(self):
+        return self.clock() < self._leader_until
+
+    def holder(self):
+        return self._observed[0] if self._observed else None
+
+    # ── ELEZIONE ────────────────────────────────────────────────────────────
+
+    def try_acquire_or_renew(self):
+        """Un tentativo: True se al termine siamo leader"""
+        now = self.clock()
+        wall = datetime.now(timezone.utc)
+        try:
+            lease = self.api.read_namespaced_lease(self.name, self.lease_namespace)
+        except ApiException as e:
+            if e.status != 404:
+                raise
+            lease = client.V1Lease(
+                metadata=client.V1ObjectMeta(name=self.name),
+                spec=client.V1LeaseSpec(holder_identity=self.identity, lease_duration_seconds=self.lease_seconds,
+                                        acquire_time=wall, renew_time=wall, lease_transitions=0),
+            )
+            try:
+                self.api.create_namespaced_lease(self.lease_namespace, lease)
+            except ApiException as e:
+                if e.status == 409:  # creato da un altro replica nel frattempo
+                    return False
+                raise
+            return self._renewed(now, None)
+
+        spec = lease.spec
+        record = (spec.holder_identity, spec.renew_time)
+        if record != self._observed:
+            self._observed, self._observed_at = record, now
+        holder = spec.holder_identity
+        if holder and holder != self.identity and now < self._observed_at + (spec.lease_duration_seconds or 0):
+            self._leader_until = 0.0
+            return False
+
+        since = None
+        if holder == self.identity and not self.leading and self._leader_until:
+            since = self._leader_until  # Lease ancora nostro ma leadership scaduta (API irraggiungibile)
+        if holder != self.identity:
+            spec.acquire_time = wall
+            spec.lease_transitions = (spec.lease_transitions or 0) + 1
+            since = self._observed_at  # ultimo segno di vita (o rilascio) del vecchio leader
+        spec.holder_identity = self.identity
+        spec.lease_duration_seconds = self.lease_seconds
+        spec.renew_time = wall
+        try:
+            self.api.replace_namespaced_lease(self.name, self.lease_namespace, lease)
+        except ApiException as e:
+            if e.status == 409:  # un altro replica ha scritto il Lease tra la read e la replace
+                return False
+            raise
+        return self._renewed(now, since)
+
+    def _renewed(self, now, since):
+        self._observed, self._observed_at = (self.identity, None), now
+        self._leader_until = now + self.lease_seconds - self.retry_seconds
+        if not self.leading:
+            self._takeover_since = since if since is not None else now
+        return True
+
+    def step(self):
+        try:
+            self.try_acquire_or_renew()
+        except Exception as e:
+            print(f"⚠️ Leader election: {e}")
+        leading = self.is_leader()
+        if leading != self.leading:
+            self.leading = leading
+            self.transitions += 1
+            since = self._takeover_since if leading else None
+            print(f"👑 {self.identity} is now the leader" if leading else f"💤 {self.identity} is now standby")
+            for listener in list(self.listeners):
+                try:
+                    listener(leading, since)
+                except Exception as e:
+                    print(f"⚠️ Leader change handler failed: {e}")
+
+    def start(self):
+        self.step()
+
+        def loop():
+            while not self._stop.wait(self.retry_seconds):
+                self.step()
+
+        self._thread = threading.Thread(target=loop, name="leader-election", daemon=True)
+        self._thread.start()
+        return self
+
+    def stop(self, release=True):
+        """Ferma l'elezione; con release=True libera il Lease se lo teniamo"""
+        if self._stop.is_set():
+            return
+        self._stop.set()
+        if self._thread:
+            self._thread.join(timeout=self.retry_seconds + 5)
+        if release and self.is_leader():
+            try:
+                lease = self.api.read_namespaced_lease(self.name, self.lease_namespace)
+                if lease.spec.holder_identity == self.identity:
+                    lease.spec.holder_identity = None
+                    lease.spec.renew_time = datetime.now(timezone.utc)
+                    self.api.replace_namespaced_lease(self.name, self.lease_namespace, lease)
+            except ApiException as e:
+                print(f"⚠️ Leader lease release failed: {e}")
+        self._leader_until = 0.0
+        self.leading = False
+
+
+class LeaderOnly:
+    """
+    Sink attivo solo sul leader (storico, log JSON, webhook, cattura log).
+    In standby tiene gli ultimi `buffer_seconds` di batch: alla promozione riscrive quelli arrivati
+    dopo l'ultimo segno di vita del vecchio leader, così il failover non lascia buchi nello storico.
+    """
+
+    def __init__(self, sink, elector, buffer_seconds=None):
+        self.sink = sink
+        self.name = sink.name
+        self.elector = elector
+        self.buffer_seconds = buffer_seconds or 2 * elector.lease_seconds
+        self.buffer = deque()  # (clock, batch)
+        self.active = False
+        self.replayed = 0
+        self._lock = threading.Lock()
+        elector.listeners.append(self.on_leader_change)
+
+    def write(self, batch):
+        with self._lock:
+            if self.active and self.elector.is_leader():
+                self.sink.write(batch)
+                return
+            now = self.elector.clock()
+            self.buffer.append((now, batch))
+            while self.buffer and self.buffer[0][0] < now - self.buffer_seconds:
+                self.buffer.popleft()
+
+    def on_leader_change(self, leading, since):
+        with self._lock:
+            if leading:
+                # margine di un retry: eventi a cavallo dell'ultimo rinnovo meglio doppi che persi
+                cutoff = since - self.elector.retry_seconds
+                for t, batch in self.buffer:
+                    if t >= cutoff:
+                        self.sink.write(batch)
+                        self.replayed += len(batch)
+                self.buffer.clear()
+            self.active = leading
+
+    def close(self):
+        close = getattr(self.sink, "close", None)
+        if close:
+            close()
+
+    def __getattr__(self, name):
+        # stats, records... del sink avvolto
+        return getattr(self.sink, name)
+
+
+class StandbyAlerts:
+    """
+    Invii di alert (Teams/email, pod, nodi e rollup) passati per l'elezione.
+    Lo standby valuta le regole come il leader, quindi finestre e cooldown sono già consumati:
+    gli alert che avrebbe inviato restano in coda per `buffer_seconds` e alla promozione partono
+    quelli arrivati dopo l'ultimo segno di vita del vecchio leader, come i batch di LeaderOnly.
+    """
+
+    def __init__(self, elector, buffer_seconds=None):
+        self.elector = elector
+        self.buffer_seconds = buffer_seconds or 2 * elector.lease_seconds
+        self.buffer = deque()  # (clock, send, event, rule)
+        self.active = False
+        self.replayed = 0
+        self._lock = threading.Lock()
+        elector.listeners.append(self.on_leader_change)
+
+    def send(self, send, event, rule):
+        with self._lock:
+            if not (self.active and self.elector.is_leader()):
+                now = self.elector.clock()
+                self.buffer.append((now, send, event, rule))
+                while self.buffer and self.buffer[0][0] < now - self.buffer_seconds:
+                    self.buffer.popleft()
+                return
+        send(event, rule)
+
+    def on_leader_change(self, leading, since):
+        with self._lock:
+            pending = []
+            if leading:
+                cutoff = since - self.elector.retry_seconds
+                pending = [(send, event, rule) for t, send, event, rule in self.buffer if t >= cutoff]
+            self.buffer.clear()
+            self.active = leading
+        for send, event, rule in pending:
+            try:
+                send(event, rule)
+                self.replayed += 1
+            except Exception as e:
+                print(f"⚠️ Replayed alert failed: {e}")
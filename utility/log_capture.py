@@ -0,0 +1,139 @@
+import os
+import gzip
+import time
+import queue
+import threading
+from collections import OrderedDict, defaultdict
+
+CAPTURE_TYPES = ("TERMINATION", "OOM_KILLED")
+
+
+class _TokenBucket:
+    def __init__(self, rate_per_sec, burst):
+        self.rate = rate_per_sec
+        self.capacity = burst
+        self.tokens = burst
+        self.updated = time.monotonic()
+
+    def take(self):
+        now = time.monotonic()
+        self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.rate)
+        self.updated = now
+        if self.tokens >= 1:
+            self.tokens -= 1
+            return True
+        return False
+
+
+class LogCapture:
+    """
+    Scarica la coda dei log del container terminato (TERMINATION / OOM_KILLED)
+    in un file gzip accanto al CSV del workload.
+    - un solo fetch per restart (chiave namespace/pod/container/finished_at)
+    - al massimo `rate_per_minute` fetch per namespace (token bucket)
+    - coda limitata e `workers` thread: un crash loop non genera una tempesta di richieste
+    """
+
+    name = "log-capture"
+
+    def __init__(self, v1, base_dir, workers=4, tail_lines=200, limit_bytes=256 * 1024,
+                 rate_per_minute=6, queue_size=256, dedup_size=10000, cluster=None, profiler=None):
+        self.v1 = v1
+        self.profiler = profiler  # rate limit condiviso delle chiamate API (APIProfiler)
+        self.base_dir = base_dir
+        self.cluster = cluster  # con --contexts: solo gli eventi del proprio cluster
+        self.tail_lines = tail_lines
+        self.limit_bytes = limit_bytes
+        self.rate_per_minute = rate_per_minute
+        self.dedup_size = dedup_size
+        self.queue = queue.Queue(maxsize=queue_size)
+        self.stats = defaultdict(int)
+        self._seen = OrderedDict()
+        self._buckets = {}
+        self._lock = threading.Lock()
+        self._threads = [
+            threading.Thread(target=self._worker, name=f"log-capture-{i}", daemon=True)
+            for i in range(workers)
+        ]
+        for t in self._threads:
+            t.start()
+
+    def submit(self, entry):
+        """Accoda il fetch dei log per un evento; ritorna False se scartato"""
+        if entry.get("type") not in CAPTURE_TYPES or not entry.get("pod"):
+            return False
+
+        ns = entry.get("namespace")
+        key = (ns, entry.get("pod"), entry.get("container"), entry.get("finished_at") or entry.get("exit_code"))
+        with self._lock:
+            if key in self._seen:
+                self.stats["deduplicated"] += 1
+                return False
+            bucket = self._buckets.get(ns)
+            if bucket is None:
+                bucket = self._buckets[ns] = _TokenBucket(self.rate_per_minute / 60.0, self.rate_per_minute)
+            if not bucket.take():
+                self.stats["rate_limited"] += 1
+                return False
+            self._seen[key] = True
+            if len(self._seen) > self.dedup_size:
+                self._seen.popitem(last=False)
+
+        try:
+            self.queue.put_nowait(dict(entry))
+        except queue.Full:
+            self.stats["queue_full"] += 1
+            return False
+        return True
+
+    def write(self, batch):
+        """Interfaccia sink: considera solo TERMINATION / OOM_KILLED"""
+        for entry in batch:
+            if entry.get("cluster") == self.cluster:
+                self.submit(entry)
+
+    def _path(self, entry):
+        workload = str(entry.get("workload") or "unknown").replace("/", "_")
+        stamp = str(entry.get("finished_at") or entry.get("timestamp") or "").replace(":", "-")
+        return os.path.join(
+            self.base_dir, "workload", entry.get("namespace") or "-", "logs", workload,
+            f"{entry['pod']}.{entry.get('container') or 'all'}.{stamp}.log.gz",
+        )
+
+    def _worker(self):
+        while True:
+            entry = self.queue.get()
+            try:
+                self._fetch(entry)
+            except Exception as e:
+                self.stats["failed"] += 1
+                print(f"⚠️ Log capture failed for {entry.get('namespace')}/{entry.get('pod')}: {e}")
+            finally:
+                self.queue.task_done()
+
+    def _fetch(self, entry):
+        # OOM_KILLED guarda lo stato corrente (container ancora terminato), TERMINATION il last_state
+        previous = entry.get("type") == "TERMINATION"
+        kwargs = {"previous": previous, "tail_lines": self.tail_lines, "limit_bytes": self.limit_bytes}
+        if entry.get("container"):
+            kwargs["container"] = entry["container"]
+        if self.profiler:
+            self.profiler.throttle()
+        resp = self.v1.read_namespaced_pod_log(
+            entry["pod"], entry["namespace"], _preload_content=False, **kwargs)
+
+        path = self._path(entry)
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        tmp = path + ".tmp"
+        written = 0
+        try:
+            with gzip.open(tmp, "wb") as f:
+                for chunk in resp.stream(64 * 1024):
+                    f.write(chunk)
+                    written += len(chunk)
+        finally:
+            resp.release_conn()
+        os.replace(tmp, path)
+
+        self.stats["captured"] += 1
+        self.stats["bytes"] += written
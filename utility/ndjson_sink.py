@@ -0,0 +1,140 @@
+import os
+import sys
+import gzip
+import json
+import time
+import threading
+from datetime import datetime
+
+try:
+    import orjson
+except ImportError:  # dipendenza opzionale: serializzatore più veloce
+    orjson = None
+
+try:
+    import zstandard
+except ImportError:  # dipendenza opzionale, richiesta solo con --logs-compress zstd
+    zstandard = None
+
+
+def dumps_line(entry):
+    """Una riga NDJSON (bytes, con newline finale)"""
+    if orjson is not None:
+        return orjson.dumps(entry, default=str, option=orjson.OPT_APPEND_NEWLINE)
+    return (json.dumps(entry, default=str, separators=(",", ":")) + "\n").encode("utf-8")
+
+
+def _compress_file(path, compression):
+    target = path + (".gz" if compression == "gzip" else ".zst")
+    tmp = target + ".tmp"
+    with open(path, "rb") as src:
+        if compression == "gzip":
+            with gzip.open(tmp, "wb", compresslevel=6) as dst:
+                while chunk := src.read(1024 * 1024):
+                    dst.write(chunk)
+        else:
+            with open(tmp, "wb") as dst:
+                zstandard.ZstdCompressor(level=3).copy_stream(src, dst)
+    os.replace(tmp, target)
+    os.remove(path)
+
+
+class NDJSONSink:
+    """
+    Sink NDJSON per --logs: gira nel worker della SinkPipeline (coda e thread sono quelli
+    della pipeline), che gli passa i batch già accorpati; le righe vengono serializzate
+    e scritte a blocchi di `batch_bytes` (una write per blocco, mai righe spezzate).
+    - path None → stdout
+    - rotazione per dimensione (`max_bytes`) e/o tempo (`rotate_seconds`), controllata a ogni write
+    - i file ruotati vengono compressi (gzip o zstd) in background
+    """
+    name = "ndjson"
+
+    def __init__(self, path=None, max_bytes=None, rotate_seconds=None, compression=None,
+                 batch_bytes=1024 * 1024):
+        if compression == "zstd" and zstandard is None:
+            raise RuntimeError("--logs-compress zstd requires `pip install zstandard`")
+        self.path = path
+        self.max_bytes = max_bytes
+        self.rotate_seconds = rotate_seconds
+        self.compression = compression
+        # un blocco non supera la soglia di rotazione: i segmenti restano vicini a max_bytes
+        self.batch_bytes = min(batch_bytes, max_bytes) if max_bytes else batch_bytes
+        self.records = 0
+        self.bytes = 0
+        self.dropped = 0
+        self.rotations = 0
+        self._file = None
+        self._file_bytes = 0
+        self._opened_at = None
+
+    def write(self, entries):
+        lines = []
+        size = 0
+        for entry in entries:
+            line = dumps_line(entry)
+            lines.append(line)
+            size += len(line)
+            if size >= self.batch_bytes:
+                self._write_lines(lines, size)
+                lines, size = [], 0
+        if lines:
+            self._write_lines(lines, size)
+
+    def summary(self):
+        """Una riga per le statistiche periodiche"""
+        part = f"{self.records} records, {self.bytes / 1024 / 1024:.1f} MiB, {self.rotations} rotations"
+        if self.dropped:
+            part += f", {self.dropped} dropped"
+        return part
+
+    # ── WRITE ───────────────────────────────────────────────────────────────
+
+    def _write_lines(self, lines, size):
+        try:
+            self._write_batch(lines, size)
+        except Exception as e:
+            self.dropped += len(lines)
+            print(f"⚠️ NDJSON sink write failed: {e}", file=sys.stderr)
+
+    def _write_batch(self, lines, size):
+        self._maybe_rotate()
+        out = self._target()
+        out.write(b"".join(lines))
+        out.flush()
+        self._file_bytes += size
+        self.records += len(lines)
+        self.bytes += size
+
+    def _target(self):
+        if self.path is None:
+            sys.stdout.flush()  # prima il testo già stampato, poi il blocco NDJSON
+            return sys.stdout.buffer
+        if self._file is None:
+            os.makedirs(os.path.dirname(os.path.abspath(self.path)), exist_ok=True)
+            self._file = open(self.path, "ab")
+            self._file_bytes = self._file.tell()
+            self._opened_at = time.monotonic()
+        return self._file
+
+    def _maybe_rotate(self):
+        if self._file is None:
+            return
+        too_big = self.max_bytes and self._file_bytes >= self.max_bytes
+        too_old = self.rotate_seconds and time.monotonic() - self._opened_at >= self.rotate_seconds
+        if not (too_big or too_old) or self._file_bytes == 0:
+            return
+        self._file.close()
+        self._file = None
+        base, ext = os.path.splitext(self.path)
+        rotated = f"{base}-{datetime.now().strftime('%Y%m%dT%H%M%S%f')}{ext}"
+        os.replace(self.path, rotated)
+        self.rotations += 1
+        if self.compression:
+            threading.Thread(target=_compress_file, args=(rotated, self.compression),
+                             name="ndjson-compress", daemon=True).start()
+
+    def close(self):
+        if self._file:
+            self._file.close()
+            self._file = None
@@ -0,0 +1,148 @@
+import time
+import bisect
+import threading
+from datetime import datetime
+from collections import Counter, defaultdict
+
+# condizione del nodo → eventi pod che può causare (in ordine di priorità se più condizioni sono attive)
+ATTRIBUTABLE = {
+    "MemoryPressure": {"OOM_KILLED", "TERMINATION", "EVICTED", "POD_DELETED"},
+    "DiskPressure": {"EVICTED", "POD_DELETED", "TERMINATION"},
+    "NotReady": {"TERMINATION", "POD_DELETED", "EVICTED", "PROBE_FAILURE"},
+}
+
+
+class NodeConditionIndex:
+    """
+    Indice a intervalli delle condizioni recenti di ogni nodo: per (cluster, nodo, condizione)
+    due liste ordinate di inizio/ultima osservazione delle finestre, disgiunte.
+    Un controllo nodi con la condizione attiva estende l'ultima finestra (o ne apre una nuova
+    dopo un buco di più di `max_gap` secondi); la ricerca è un bisect, O(log n).
+    """
+
+    def __init__(self, grace=120, max_gap=180, retention=3600):
+        self.grace = grace            # tolleranza tra fallimento del pod e campionamento del nodo
+        self.max_gap = max_gap
+        self.retention = retention    # finestre chiuse da più di così vengono scartate
+        self.windows = {}             # {(cluster, nodo, condizione): ([inizi], [fini])}
+        self._lock = threading.Lock()
+
+    def observe(self, cluster, node, conditions, now=None):
+        now = now if now is not None else time.time()
+        with self._lock:
+            for cond in conditions:
+                starts, ends = self.windows.setdefault((cluster, node, cond), ([], []))
+                if ends and now - ends[-1] <= self.max_gap:
+                    ends[-1] = now
+                else:
+                    starts.append(now)
+                    ends.append(now)
+
+    def find(self, cluster, node, condition, t):
+        with self._lock:
+            window = self.windows.get((cluster, node, condition))
+            if not window:
+                return False
+            starts, ends = window
+            i = bisect.bisect_right(starts, t + self.grace) - 1
+            return i >= 0 and ends[i] + self.grace >= t
+
+    def attribute(self, cluster, node, event_type, t=None, accept=None):
+        """
+        Condizione del nodo a cui attribuire il fallimento, o None.
+        `t` è l'istante di osservazione (non finished_at): stessa scala del campionamento
+        dei nodi, anche nel replay. `accept(cluster, condizione)` esclude le condizioni
+        che non possono fare da alert (es. regola disattivata): il fallimento resta un alert del pod.
+        """
+        if not node:
+            return None
+        t = t if t is not None else time.time()
+        for cond, types in ATTRIBUTABLE.items():
+            if accept and not accept(cluster, cond):
+                continue
+            if event_type in types and self.find(cluster, node, cond, t):
+                return cond
+        return None
+
+    def prune(self, now=None):
+        cutoff = (now if now is not None else time.time()) - self.retention
+        with self._lock:
+            for key, (starts, ends) in list(self.windows.items()):
+                drop = bisect.bisect_left(ends, cutoff)
+                if drop == len(ends):
+                    del self.windows[key]
+                elif drop:
+                    del starts[:drop], ends[:drop]
+
+
+class NodeFailureRollup:
+    """
+    Fallimenti dei pod attribuiti a una condizione del nodo: invece di N alert per pod
+    si accumulano per (cluster, nodo, condizione) e partono come un solo alert del nodo,
+    al massimo uno ogni `within_minutes` della regola della condizione.
+    """
+
+    def __init__(self, alert_manager):
+        self.alert_manager = alert_manager
+        self.pending = {}   # {(cluster, nodo, condizione): {"types": Counter, "workloads": Counter, "since": ts}}
+        self.last_sent = {}
+        self.stats = defaultdict(int)
+        self._lock = threading.Lock()
+
+    def _rule(self, cluster, condition):
+        rule = self.alert_manager.rules.lookup(condition, {"cluster": cluster})
+        return rule if rule and rule.get("enabled", False) and rule.get("notify", False) else None
+
+    def notifies(self, cluster, condition):
+        """True se la condizione ha una regola attiva che notifica: solo allora ci si accorpano i pod"""
+        return self._rule(cluster, condition) is not None
+
+    def record(self, entry):
+        key = (entry.get("cluster"), entry.get("node"), entry.get("node_condition"))
+        with self._lock:
+            p = self.pending.get(key)
+            if p is None:
+                p = self.pending[key] = {"types": Counter(), "workloads": Counter(), "since": datetime.now()}
+            p["types"][entry.get("type")] += 1
+            p["workloads"][f"{entry.get('namespace')}/{entry.get('workload')}"] += 1
+            self.stats["attributed"] += 1
+
+    def flush(self, now=None, send=None):
+        """
+        Invia gli alert di rollup pronti (chiamata dopo ogni controllo nodi).
+        `send(fn, evento, regola)` fa l'invio vero e proprio (con --ha passa per StandbyAlerts).
+        """
+        send = send or (lambda fn, evt, rule: fn(evt, rule))
+        now = now or datetime.now()
+        manager = self.alert_manager
+        ready = []
+        with self._lock:
+            for key, p in list(self.pending.items()):
+                rule = self._rule(key[0], key[2])
+                if rule is None:  # record() avviene solo dopo notifies(): qui non ci si arriva
+                    del self.pending[key]
+                    continue
+                last = self.last_sent.get(key)
+                if last and (now - last).total_seconds() < rule.get("within_minutes", 60) * 60:
+                    continue
+                self.last_sent[key] = now
+                ready.append((key, self.pending.pop(key), rule))
+
+        for (cluster, node, cond), p, rule in ready:
+            failures = sum(p["types"].values())
+            types = ", ".join(f"{t}×{n}" for t, n in p["types"].most_common())
+            workloads = ", ".join(w for w, _ in p["workloads"].most_common(5))
+            evt = {
+                "timestamp": now.isoformat(),
+                "cluster": cluster,
+                "type": cond,
+                "node": node,
+                "message": f"{failures} pod failures attributed to {cond} since "
+                           f"{p['since'].strftime('%H:%M')} ({types}); workloads: {workloads}",
+            }
+            rollup = {**rule, "message": f"{rule.get('message', cond)}: {failures} pod failures on {node}"}
+            self.stats["rollups"] += 1
+            if manager.teams_webhook_url:
+                send(manager.send_teams_alert, evt, rollup)
+            if manager.mail_config:
+                send(manager.send_nodes_email_alert, evt, rollup)
@@ -0,0 +1,112 @@
+import threading
+from collections import OrderedDict, defaultdict
+
+
+class PodState:
+    """Stato di un pod tra un evento e l'altro"""
+    __slots__ = ("namespace", "name", "workload", "labels", "fingerprint", "containers")
+
+    def __init__(self, namespace, name):
+        self.namespace = namespace
+        self.name = name
+        self.workload = None
+        self.labels = None  # label del pod, per gli override di alert con label selector
+        self.fingerprint = None
+        self.containers = {}  # {container: ultimo stato leggibile, es. "Waiting(CrashLoopBackOff)"}
+
+
+class PodStateStore:
+    """
+    Stato per pod, chiave uid, con uno slot per container.
+    Le voci si eliminano sul DELETED del watch e con reconcile() sulla lista live,
+    così la dimensione segue i pod vivi e non tutti i pod mai visti (ogni rollout = nuovi uid).
+    """
+
+    def __init__(self):
+        self.pods = {}
+        self.stats = defaultdict(int)  # hits / misses / evicted
+        self._lock = threading.Lock()
+
+    def __len__(self):
+        return len(self.pods)
+
+    def get(self, uid):
+        state = self.pods.get(uid)
+        self.stats["hits" if state is not None else "misses"] += 1
+        return state
+
+    def slot(self, uid, namespace=None, name=None):
+        """Stato del pod, creato se manca"""
+        state = self.get(uid)
+        if state is None:
+            state = self.pods[uid] = PodState(namespace, name)
+        return state
+
+    def evict(self, uid):
+        state = self.pods.pop(uid, None)
+        if state is not None:
+            self.stats["evicted"] += 1
+        return state
+
+    def reconcile(self, namespace, live_uids):
+        """Rimuove i pod del namespace non più presenti nella lista live; ritorna quanti"""
+        with self._lock:
+            stale = [uid for uid, s in list(self.pods.items())
+                     if s.namespace == namespace and uid not in live_uids]
+            for uid in stale:
+                self.evict(uid)
+        return len(stale)
+
+    def retain_namespaces(self, namespaces):
+        """Rimuove i pod dei namespace non più monitorati"""
+        with self._lock:
+            stale = [uid for uid, s in list(self.pods.items()) if s.namespace not in namespaces]
+            for uid in stale:
+                self.evict(uid)
+        return len(stale)
+
+
+class OwnerCache:
+    """
+    Deployment proprietario di ogni ReplicaSet {(namespace, replicaset): deployment o None}.
+    LRU limitata a `maxsize`: ogni rollout crea un ReplicaSet nuovo e quelli vecchi, non più
+    referenziati dai pod, escono dalla cache invece di accumularsi (un miss costa una read).
+    """
+
+    def __init__(self, maxsize=20000):
+        self.maxsize = maxsize
+        self.entries = OrderedDict()
+        self._lock = threading.Lock()
+
+    def __len__(self):
+        return len(self.entries)
+
+    def __contains__(self, key):
+        with self._lock:
+            return key in self.entries
+
+    def get(self, key, default=None):
+        with self._lock:
+            if key not in self.entries:
+                return default
+            self.entries.move_to_end(key)
+            return self.entries[key]
+
+    def __setitem__(self, key, value):
+        with self._lock:
+            self.entries[key] = value
+            self.entries.move_to_end(key)
+            while len(self.entries) > self.maxsize:
+                self.entries.popitem(last=False)
+
+    def retain(self, namespaces, listed, referenced):
+        """
+        Tiene i ReplicaSet dei namespace monitorati e, per i namespace appena listati (`listed`),
+        solo quelli ancora referenziati da un pod vivo; ritorna quanti ne ha rimossi
+        """
+        with self._lock:
+            stale = [key for key in self.entries
+                     if key[0] not in namespaces or (key[0] in listed and key not in referenced)]
+            for key in stale:
+                del self.entries[key]
+        return len(stale)
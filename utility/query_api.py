@@ -0,0 +1,374 @@
+import json
+import time
+import bisect
+import threading
+from datetime import datetime
+from collections import defaultdict, deque
+from http.server import ThreadingHTTPServer, BaseHTTPRequestHandler
+from urllib.parse import urlsplit, parse_qsl
+from utility.sinks import Sink
+
+# come workload_overview.csv: restart = TERMINATION o POD_DELETED; gli OOM si contano a parte
+RESTART_TYPES = {"TERMINATION", "POD_DELETED", "OOM_KILLED"}
+CRASHLOOP = "CrashLoopBackOff"
+
+
+class LiveIndex(Sink):
+    """
+    Sink della query API: indici in memoria aggiornati a ogni batch di eventi.
+    - restart per (cluster, namespace, workload): deque di (istante, tipo, occorrenze) degli ultimi `window_minutes`
+    - container in CrashLoopBackOff per (cluster, namespace, pod) → container, finché un evento non li fa uscire
+      o non vengono più visti per `crashloop_ttl` secondi (il backoff massimo di kubelet è 5 minuti)
+    """
+    name = "query"
+
+    def __init__(self, window_minutes=24 * 60, crashloop_ttl=900, clock=time.time):
+        self.window = window_minutes * 60
+        self.crashloop_ttl = crashloop_ttl
+        self.clock = clock
+        self.restarts = defaultdict(deque)
+        self.crashloops = {}
+        self.events = 0
+        self._lock = threading.Lock()
+
+    def write(self, batch):
+        now = self.clock()
+        with self._lock:
+            for entry in batch:
+                self.events += 1
+                etype = entry.get("type")
+                cluster, ns = entry.get("cluster"), entry.get("namespace")
+                if etype in RESTART_TYPES:
+                    workload = entry.get("workload") or "Unknown"
+                    self.restarts[(cluster, ns, workload)].append((now, etype, entry.get("count") or 1))
+
+                pod, container = (cluster, ns, entry.get("pod")), entry.get("container")
+                if self._is_crashloop(entry):
+                    containers = self.crashloops.setdefault(pod, {})
+                    loop = containers.get(container)
+                    if loop is None:
+                        loop = containers[container] = {"since": now, "sightings": 0}
+                    loop.update(last_seen=now, workload=entry.get("workload"), node=entry.get("node"),
+                                message=entry.get("message"))
+                    loop["sightings"] += entry.get("count") or 1
+                elif etype == "STATE_CHANGE" and pod in self.crashloops:
+                    self.crashloops[pod].pop(container, None)
+                    if not self.crashloops[pod]:
+                        del self.crashloops[pod]
+                elif etype == "POD_DELETED":
+                    self.crashloops.pop(pod, None)
+
+    @staticmethod
+    def _is_crashloop(entry):
+        etype = entry.get("type")
+        if etype == "STATE_CHANGE":
+            return entry.get("to") == f"Waiting({CRASHLOOP})"
+        return etype in ("PROBE_FAILURE", "BACK_OFF") and entry.get("reason") == CRASHLOOP
+
+    def copy(self):
+        """Copia coerente degli indici (scarta le voci scadute): la base di uno snapshot"""
+        now = self.clock()
+        cutoff = now - self.window
+        with self._lock:
+            restarts = {}
+            for key, events in list(self.restarts.items()):
+                while events and events[0][0] < cutoff:
+                    events.popleft()
+                if events:
+                    restarts[key] = tuple(events)
+                else:
+                    del self.restarts[key]
+            crashloops = {}
+            for pod, containers in list(self.crashloops.items()):
+                for container, loop in list(containers.items()):
+                    if now - loop["last_seen"] > self.crashloop_ttl:
+                        del containers[container]
+                    else:
+                        crashloops[pod + (container,)] = dict(loop)
+                if not containers:
+                    del self.crashloops[pod]
+        return now, restarts, crashloops
+
+
+def _iso(ts):
+    return datetime.fromtimestamp(ts).isoformat(timespec="seconds") if ts else None
+
+
+class Snapshot:
+    """
+    Vista immutabile dello stato live, ricostruita ogni `refresh` secondi.
+    Le richieste leggono solo lo snapshot corrente: nessun lock sugli indici, nessun file, nessuna
+    chiamata all'API server. Le risposte già serializzate restano in cache fino allo snapshot successivo,
+    così il polling di più dashboard sulle stesse pagine costa una lookup in un dict.
+    """
+
+    def __init__(self, now, restarts, crashloops, nodes, alerts):
+        self.now = now
+        self.generated_at = _iso(now)
+        self.restarts = restarts        # {(cluster, ns, workload): ((istante, tipo, n), ...)} ordinati
+        self.crashloops = crashloops
+        self.nodes = nodes
+        self.alerts = alerts
+        self.responses = {}
+        self._top = {}
+
+    def top_restarts(self, minutes):
+        top = self._top.get(minutes)
+        if top is None:
+            cutoff = self.now - minutes * 60
+            top = []
+            for (cluster, ns, workload), events in self.restarts.items():
+                start = bisect.bisect_left(events, (cutoff,))
+                if start == len(events):
+                    continue
+                counts = defaultdict(int)
+                for _, etype, n in events[start:]:
+                    counts[etype] += n
+                restarts = counts["TERMINATION"] + counts["POD_DELETED"]
+                if not restarts and not counts["OOM_KILLED"]:
+                    continue
+                top.append({
+                    "cluster": cluster, "namespace": ns, "workload": workload,
+                    "restarts": restarts, "terminations": counts["TERMINATION"],
+                    "pod_deleted": counts["POD_DELETED"], "oom_killed": counts["OOM_KILLED"],
+                    "last_event": _iso(events[-1][0]),
+                })
+            top.sort(key=lambda r: (-r["restarts"], -r["oom_killed"], r["namespace"] or "", r["workload"]))
+            self._top[minutes] = top
+        return top
+
+
+class LiveQueryAPI:
+    """
+    Server HTTP opzionale (--query-port) con endpoint JSON paginati sullo stato live:
+      /v1/crashloops        pod/container in CrashLoopBackOff
+      /v1/restarts/top      workload con più restart negli ultimi `minutes` (default 60)
+      /v1/nodes             stato dei nodi dall'ultimo controllo (?pressure=1 solo quelli con condizioni attive)
+      /v1/alerts            finestre delle regole di alert e rollup dei nodi in attesa
+      /healthz
+    Parametri comuni: cluster, namespace, offset, limit (max MAX_LIMIT).
+    Con `diagnostics` anche le catture a richiesta, fuori dalla cache (i file vanno nella cartella di diagnostica):
+      /debug/stacks         stack di tutti i thread e task
+      /debug/profile        profilo di `seconds` secondi (default --profile-seconds)
+      /debug/heap           top `top` allocazioni di tracemalloc nei prossimi `seconds` secondi
+    """
+
+    MAX_LIMIT = 500
+    DEFAULT_LIMIT = 50
+    MAX_CACHED = 512  # risposte in cache per snapshot
+    MAX_CAPTURE_SECONDS = 300
+
+    def __init__(self, index, debuggers, host="127.0.0.1", port=8080, refresh=2.0, diagnostics=None):
+        self.index = index
+        self.debuggers = debuggers
+        self.diagnostics = diagnostics
+        self.refresh_interval = refresh
+        self.snapshot = None
+        self.stats = defaultdict(int)
+        self._stop = threading.Event()
+        self.refresh()
+
+        api = self
+
+        class Handler(BaseHTTPRequestHandler):
+            protocol_version = "HTTP/1.1"  # keep-alive per il polling delle dashboard
+            disable_nagle_algorithm = True  # header e corpo in due write: senza, +40ms di delayed ACK
+
+            def do_GET(self):
+                status, body = api.handle(self.path)
+                self.send_response(status)
+                self.send_header("Content-Type", "application/json")
+                self.send_header("Content-Length", str(len(body)))
+                self.end_headers()
+                self.wfile.write(body)
+
+            def log_message(self, *args):
+                pass
+
+        self.server = ThreadingHTTPServer((host, port), Handler)
+        self.server.daemon_threads = True
+        self.address = self.server.server_address
+
+    def start(self):
+        threading.Thread(target=self.server.serve_forever, name="kubog-query-api", daemon=True).start()
+        threading.Thread(target=self._refresh_loop, name="kubog-query-snapshot", daemon=True).start()
+        print(f"🔎 Live query API on http://{self.address[0]}:{self.address[1]}/v1/")
+        return self
+
+    def stop(self):
+        self._stop.set()
+        self.server.shutdown()
+        self.server.server_close()
+
+    # ── SNAPSHOT ────────────────────────────────────────────────────────────
+
+    def _refresh_loop(self):
+        while not self._stop.wait(self.refresh_interval):
+            try:
+                self.refresh()
+            except Exception as e:
+                print(f"⚠️ Query API snapshot failed: {e}")
+
+    def refresh(self):
+        now, restarts, crashloops = self.index.copy()
+        loops = sorted((
+            {"cluster": c, "namespace": ns, "pod": pod, "container": container,
+             "workload": v.get("workload"), "node": v.get("node"), "since": _iso(v["since"]),
+             "last_seen": _iso(v["last_seen"]), "sightings": v["sightings"], "message": v.get("message")}
+            for (c, ns, pod, container), v in crashloops.items()
+        ), key=lambda r: (r["since"], r["namespace"] or "", r["pod"] or ""))
+        snapshot = Snapshot(now, restarts, loops, self._nodes(), self._alerts())
+        snapshot.top_restarts(60)  # vista di default calcolata qui, non nel thread della richiesta
+        self.snapshot = snapshot
+        self.stats["snapshots"] += 1
+
+    def _nodes(self):
+        nodes = []
+        for d in self.debuggers:
+            # node_status_cache viene sostituito per intero a ogni controllo nodi: lettura senza lock
+            nodes.extend(d.node_status_cache.values())
+        return sorted(nodes, key=lambda n: (not n["pressure"], n["cluster"] or "", n["node"]))
+
+    def _alerts(self):
+        alerts = []
+        now = datetime.utcnow()
+        managers = {id(d.alert_manager): d.alert_manager for d in self.debuggers}
+        for manager in managers.values():
+            # copia coerente sotto il lock del manager: AlertSink e controllo nodi continuano a scrivere
+            with manager.lock:
+                applied = {scope: dict(rules) for scope, rules in manager.applied_rules.items()}
+                history = {scope: {key: list(events) for key, events in by_key.items()}
+                           for scope, by_key in manager.event_history.items()}
+                sent = {scope: dict(by_key) for scope, by_key in manager.last_alert_sent.items()}
+            for (ns, workload), by_key in history.items():
+                for key, events in by_key.items():
+                    rule = applied.get((ns, workload), {}).get(key) or manager.rules.base.get(key) or {}
+                    within = rule.get("within_minutes", 60)
+                    count = sum(n for t, n in events if (now - t).total_seconds() < within * 60)
+                    last_sent = sent.get((ns, workload), {}).get(key)
+                    cooldown = max(0, within * 60 - (now - last_sent).total_seconds()) if last_sent else 0
+                    if not count and not cooldown:
+                        continue
+                    cluster, _, namespace = ns.rpartition("/")
+                    alerts.append({
+                        "kind": "threshold", "cluster": cluster or None, "namespace": namespace,
+                        "workload": workload, "rule": key, "count": count,
+                        "min_occurrences": rule.get("min_occurrences", 1), "within_minutes": within,
+                        "state": "cooldown" if cooldown else ("firing" if count >= rule.get("min_occurrences", 1) else "pending"),
+                        "cooldown_remaining_s": int(cooldown),
+                        "last_sent": last_sent.isoformat(timespec="seconds") + "Z" if last_sent else None,
+                    })
+
+        rollups = {id(d.node_rollup): d.node_rollup for d in self.debuggers}
+        for rollup in rollups.values():
+            for (cluster, node, cond), pending in dict(rollup.pending).items():
+                alerts.append({
+                    "kind": "node_rollup", "cluster": cluster, "namespace": None, "workload": node,
+                    "rule": cond, "count": sum(dict(pending["types"]).values()),
+                    "state": "pending", "since": pending["since"].isoformat(timespec="seconds"),
+                })
+        return sorted(alerts, key=lambda a: (-a["count"], a["rule"], a["workload"] or ""))
+
+    # ── RICHIESTE ───────────────────────────────────────────────────────────
+
+    def handle(self, path):
+        """(status, corpo JSON) per una GET; le risposte sono in cache per snapshot"""
+        if path.startswith("/debug/"):
+            return self._debug(path)
+        snapshot = self.snapshot
+        self.stats["requests"] += 1
+        cached = snapshot.responses.get(path)
+        if cached is not None:
+            self.stats["cached"] += 1
+            return cached
+        try:
+            response = 200, self._render(snapshot, path)
+        except ValueError as e:
+            response = 400, json.dumps({"error": str(e)}).encode()
+        except LookupError as e:
+            response = 404, json.dumps({"error": str(e)}).encode()
+        if len(snapshot.responses) < self.MAX_CACHED:
+            snapshot.responses[path] = response
+        return response
+
+    def _debug(self, path):
+        """Catture di diagnostica: bloccano solo il thread della richiesta per `seconds`"""
+        self.stats["debug"] += 1
+        url = urlsplit(path)
+        params = dict(parse_qsl(url.query))
+        route = url.path.rstrip("/")
+        diagnostics = self.diagnostics
+        try:
+            if diagnostics is None:
+                raise LookupError("diagnostics are not enabled")
+            seconds = _int(params, "seconds", diagnostics.profile_seconds)
+            if not 1 <= seconds <= self.MAX_CAPTURE_SECONDS:
+                raise ValueError(f"seconds must be between 1 and {self.MAX_CAPTURE_SECONDS}")
+            if route == "/debug/stacks":
+                result = diagnostics.stacks()
+            elif route == "/debug/profile":
+                result = diagnostics.profile(seconds)
+            elif route == "/debug/heap":
+                top = _int(params, "top", diagnostics.top)
+                if not 1 <= top <= self.MAX_LIMIT:
+                    raise ValueError(f"top must be between 1 and {self.MAX_LIMIT}")
+                result = diagnostics.heap(seconds, top=top)
+            else:
+                raise LookupError(f"unknown endpoint {url.path}")
+        except ValueError as e:
+            return 400, json.dumps({"error": str(e)}).encode()
+        except LookupError as e:
+            return 404, json.dumps({"error": str(e)}).encode()
+        except RuntimeError as e:  # un'altra cattura in corso
+            return 409, json.dumps({"error": str(e)}).encode()
+        return 200, json.dumps(result, default=str).encode()
+
+    def _render(self, snapshot, path):
+        url = urlsplit(path)
+        params = dict(parse_qsl(url.query))
+        route = url.path.rstrip("/")
+
+        if route == "/healthz":
+            return json.dumps({"status": "ok", "generated_at": snapshot.generated_at,
+                               "role": "leader" if all(d._is_active() for d in self.debuggers) else "standby",
+                               "events": self.index.events}).encode()
+        if route == "/v1/crashloops":
+            items = snapshot.crashloops
+        elif route == "/v1/restarts/top":
+            minutes = _int(params, "minutes", 60)
+            if not 1 <= minutes <= self.index.window // 60:
+                raise ValueError(f"minutes must be between 1 and {self.index.window // 60}")
+            items = snapshot.top_restarts(minutes)
+        elif route == "/v1/nodes":
+            items = snapshot.nodes
+            if params.get("pressure") in ("1", "true"):
+                items = [n for n in items if n["pressure"]]
+        elif route == "/v1/alerts":
+            items = snapshot.alerts
+        else:
+            raise LookupError(f"unknown endpoint {url.path}")
+
+        for field in ("cluster", "namespace"):
+            if field in params:
+                items = [i for i in items if i.get(field) == params[field]]
+
+        offset = _int(params, "offset", 0)
+        limit = min(_int(params, "limit", self.DEFAULT_LIMIT), self.MAX_LIMIT)
+        if offset < 0 or limit < 1:
+            raise ValueError("offset must be >= 0 and limit >= 1")
+        page = items[offset:offset + limit]
+        return json.dumps({
+            "generated_at": snapshot.generated_at,
+            "total": len(items),
+            "offset": offset,
+            "limit": limit,
+            "next_offset": offset + limit if offset + limit < len(items) else None,
+            "items": page,
+        }, default=str).encode()
+
+
+def _int(params, name, default):
+    try:
+        return int(params.get(name, default))
+    except ValueError:
+        raise ValueError(f"{name} must be an integer")
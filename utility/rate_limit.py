@@ -0,0 +1,75 @@
+import time
+import asyncio
+import threading
+from collections import defaultdict
+
+# Classi di priorità delle chiamate API
+INTERACTIVE = "interactive"  # lookup puntuali legati a un evento (ReplicaSet, pod, deployment, log)
+BULK = "bulk"                # liste, re-list dopo errori del watch, riconnessioni, metriche di cluster
+
+
+class APIRateLimiter:
+    """
+    Token bucket QPS/burst condiviso da tutte le chiamate verso un API server.
+    Le chiamate BULK non possono usare l'ultima quota `reserve` del bucket:
+    durante una tempesta di re-list i lookup INTERACTIVE trovano sempre token disponibili.
+    """
+
+    def __init__(self, qps, burst, reserve=0.25, clock=time.monotonic, sleep=time.sleep):
+        self.qps = qps
+        self.burst = max(burst, 1)
+        self.floor = {INTERACTIVE: 0.0, BULK: min(self.burst * reserve, self.burst - 1)}
+        self.clock = clock
+        self.sleep = sleep
+        self.tokens = float(self.burst)
+        self.updated = clock()
+        self.stats = defaultdict(int)  # calls / throttled per classe, wait_ms totale
+        self._lock = threading.Lock()
+
+    def try_acquire(self, priority=INTERACTIVE):
+        """Prende un token se disponibile: ritorna 0, altrimenti i secondi da attendere"""
+        floor = self.floor[priority]
+        with self._lock:
+            now = self.clock()
+            self.tokens = min(self.burst, self.tokens + (now - self.updated) * self.qps)
+            self.updated = now
+            if self.tokens - floor >= 1:
+                self.tokens -= 1
+                return 0
+            return (1 + floor - self.tokens) / self.qps
+
+    def acquire(self, priority=INTERACTIVE):
+        """Attende un token (bloccante); ritorna i secondi di attesa"""
+        waited = 0.0
+        while True:
+            delay = self.try_acquire(priority)
+            if not delay:
+                break
+            self.sleep(delay)
+            waited += delay
+        self._count(priority, waited)
+        return waited
+
+    async def acquire_async(self, priority=INTERACTIVE):
+        """Come acquire() ma per l'engine asyncio: non blocca il loop"""
+        waited = 0.0
+        while True:
+            delay = self.try_acquire(priority)
+            if not delay:
+                break
+            await asyncio.sleep(delay)
+            waited += delay
+        self._count(priority, waited)
+        return waited
+
+    def _count(self, priority, waited):
+        self.stats[f"{priority}_calls"] += 1
+        if waited:
+            self.stats[f"{priority}_throttled"] += 1
+            self.stats["wait_ms"] += int(waited * 1000)
+
+    def summary(self):
+        s = self.stats
+        return (f"interactive {s['interactive_calls']} ({s['interactive_throttled']} throttled), "
+                f"bulk {s['bulk_calls']} ({s['bulk_throttled']} throttled), "
+                f"total wait {s['wait_ms'] / 1000:.1f}s")
@@ -4,10 +4,16 @@ from kubernetes.client.rest import ApiException
 from kubernetes.client import CustomObjectsApi
 
 class RootCauseAnalyzer:
-    def __init__(self, core_v1, apps_v1):
+    def __init__(self, core_v1, apps_v1, metrics_api=None, profiler=None):
         self.core_v1   = core_v1
         self.apps_v1   = apps_v1
-        self.metrics_api = CustomObjectsApi()
+        self.metrics_api = metrics_api or CustomObjectsApi()
+        self.profiler  = profiler  # APIProfiler condiviso: stesso rate limit del debugger
+
+    def _call(self, method, resource, ns, func):
+        if self.profiler is None:
+            return func()
+        return self.profiler.profile(method, resource, ns, func)
 
     def suggest(self, event):
         # Decidi il ramo in base al type o exit_code
@@ -42,9 +48,9 @@ class RootCauseAnalyzer:
 
     def _get_live_usage(self, ns, pod_name, container):
         try:
-            pods = self.metrics_api.list_namespaced_custom_object(
+            pods = self._call("list", "podmetrics", ns, lambda: self.metrics_api.list_namespaced_custom_object(
                 "metrics.k8s.io", "v1beta1", "pods", ns
-            )["items"]
+            ))["items"]
             for item in pods:
                 if item["metadata"]["name"] == pod_name:
                     for c in item["containers"]:
@@ -61,7 +67,7 @@ class RootCauseAnalyzer:
         wl_kind, wl_name = event["workload"].split("/",1)
         # recupera spec
         try:
-            dep = self.apps_v1.read_namespaced_deployment(wl_name, ns)
+            dep = self._call("read", "deployments", ns, lambda: self.apps_v1.read_namespaced_deployment(wl_name, ns))
         except ApiException:
             return None
 
@@ -82,7 +88,7 @@ class RootCauseAnalyzer:
         ns      = event["namespace"]; ctr = event["container"]
         wl_kind, wl_name = event["workload"].split("/",1)
         try:
-            obj = self.apps_v1.read_namespaced_deployment(wl_name, ns)
+            obj = self._call("read", "deployments", ns, lambda: self.apps_v1.read_namespaced_deployment(wl_name, ns))
         except ApiException:
             return None
 
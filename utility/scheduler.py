@@ -0,0 +1,134 @@
+import time
+import heapq
+import random
+import itertools
+import threading
+from concurrent.futures import ThreadPoolExecutor
+
+FIXED_RATE = "rate"    # ogni `interval` secondi dall'avvio, senza deriva
+FIXED_DELAY = "delay"  # `interval` secondi dopo la fine dell'esecuzione precedente
+
+
+class Task:
+    def __init__(self, name, fn, interval, mode, jitter, budget):
+        self.name = name
+        self.fn = fn
+        self.interval = interval
+        self.mode = mode
+        self.jitter = jitter
+        self.budget = budget
+        self.running = False
+        self.runs = 0
+        self.errors = 0
+        self.skipped = 0      # slot saltati perché l'esecuzione precedente non era finita
+        self.missed = 0       # slot persi perché lo scheduler era in ritardo di più di un periodo
+        self.over_budget = 0
+        self.last_s = 0.0
+        self.total_s = 0.0
+        self.max_s = 0.0
+
+    def stats(self):
+        return {
+            "runs": self.runs,
+            "errors": self.errors,
+            "skipped": self.skipped,
+            "missed": self.missed,
+            "over_budget": self.over_budget,
+            "last_ms": round(self.last_s * 1000, 1),
+            "avg_ms": round(self.total_s / self.runs * 1000, 1) if self.runs else 0.0,
+            "max_ms": round(self.max_s * 1000, 1),
+        }
+
+
+class Scheduler:
+    """
+    Scheduler dei task periodici (controllo nodi, summary, analisi API, compattazione...).
+    - fixed-rate: gli slot sono start + k*interval, la durata dei task non li sposta
+    - fixed-delay: il prossimo run parte `interval` secondi dopo la fine del precedente
+    - jitter: ritardo casuale in [0, jitter] su ogni run, senza spostare gli slot
+    - un task non si sovrappone mai a se stesso (slot saltato e contato)
+    - `budget`: durata massima attesa, oltre viene segnalata
+    I task girano su un pool di thread: un task lento non ritarda gli altri.
+    """
+
+    def __init__(self, workers=4, clock=time.monotonic, rng=None):
+        self.clock = clock
+        self.tasks = {}
+        self._heap = []  # (istante di esecuzione, seq, task, slot nominale)
+        self._seq = itertools.count()
+        self._cond = threading.Condition()
+        self._stopped = False
+        self._rng = rng or random.Random()
+        self._pool = ThreadPoolExecutor(max_workers=workers, thread_name_prefix="kubog-task")
+
+    def every(self, name, interval, fn, mode=FIXED_RATE, jitter=0, budget=None, initial_delay=0):
+        task = Task(name, fn, interval, mode, jitter, budget)
+        with self._cond:
+            self.tasks[name] = task
+            self._push(task, self.clock() + initial_delay)
+        return task
+
+    def _push(self, task, slot):
+        due = slot + (self._rng.uniform(0, task.jitter) if task.jitter else 0)
+        heapq.heappush(self._heap, (due, next(self._seq), task, slot))
+        self._cond.notify()
+
+    def run(self):
+        """Loop dello scheduler (bloccante) fino a stop()"""
+        while True:
+            with self._cond:
+                while not self._stopped and not (self._heap and self._heap[0][0] <= self.clock()):
+                    self._cond.wait(self._heap[0][0] - self.clock() if self._heap else None)
+                if self._stopped:
+                    return
+                _, _, task, slot = heapq.heappop(self._heap)
+
+                if task.mode == FIXED_RATE:
+                    next_slot = slot + task.interval
+                    now = self.clock()
+                    if next_slot <= now:
+                        missed = int((now - next_slot) // task.interval) + 1
+                        task.missed += missed
+                        next_slot += missed * task.interval
+                    self._push(task, next_slot)
+
+                if task.running:
+                    task.skipped += 1
+                    continue
+                task.running = True
+            self._pool.submit(self._execute, task)
+
+    def _execute(self, task):
+        start = self.clock()
+        try:
+            task.fn()
+        except Exception as e:
+            task.errors += 1
+            print(f"⚠️ Scheduled task {task.name} failed: {e}")
+        finally:
+            duration = self.clock() - start
+            task.runs += 1
+            task.last_s = duration
+            task.total_s += duration
+            task.max_s = max(task.max_s, duration)
+            if task.budget and duration > task.budget:
+                task.over_budget += 1
+                print(f"⏱️ Task {task.name} took {duration:.1f}s (budget {task.budget}s)")
+            with self._cond:
+                task.running = False
+                if task.mode == FIXED_DELAY and not self._stopped:
+                    self._push(task, self.clock() + task.interval)
+
+    def stats(self):
+        return {name: task.stats() for name, task in self.tasks.items()}
+
+    def report(self):
+        for name, s in sorted(self.stats().items()):
+            print(f"🗓️ {name}: {s['runs']} runs, avg {s['avg_ms']} ms, max {s['max_ms']} ms, "
+                  f"skipped {s['skipped']}, missed {s['missed']}, over budget {s['over_budget']}, errors {s['errors']}")
+
+    def stop(self):
+        with self._cond:
+            self._stopped = True
+            self._cond.notify_all()
+        self._pool.shutdown(wait=False)
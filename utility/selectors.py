@@ -0,0 +1,61 @@
+from kubernetes.client.rest import ApiException
+
+# pod che non occupano più risorse sul nodo: esclusi lato server dal list per _check_nodes
+ACTIVE_POD_FIELD_SELECTOR = "status.phase!=Succeeded,status.phase!=Failed"
+
+
+def selector_to_string(label_selector):
+    """Converte un V1LabelSelector nella sintassi stringa di label_selector"""
+    if label_selector is None:
+        return None
+    parts = [f"{k}={v}" for k, v in sorted((label_selector.match_labels or {}).items())]
+    for expr in label_selector.match_expressions or []:
+        values = ",".join(expr.values or [])
+        if expr.operator == "In":
+            parts.append(f"{expr.key} in ({values})")
+        elif expr.operator == "NotIn":
+            parts.append(f"{expr.key} notin ({values})")
+        elif expr.operator == "Exists":
+            parts.append(expr.key)
+        elif expr.operator == "DoesNotExist":
+            parts.append(f"!{expr.key}")
+    return ",".join(parts) or None
+
+
+def merge_selectors(selectors):
+    """
+    Unisce i selector di più workload dello stesso namespace in uno solo.
+    I label selector non supportano l'OR: si uniscono solo selector `k=v` sulla stessa
+    chiave (→ `k in (v1,v2)`); altrimenti None, e il filtro resta lato client.
+    """
+    if not selectors or any(s is None for s in selectors):
+        return None
+    unique = sorted(set(selectors))
+    if len(unique) == 1:
+        return unique[0]
+    pairs = [s.split("=", 1) for s in unique]
+    if all(len(p) == 2 and "," not in s and "!" not in s for p, s in zip(pairs, unique)):
+        keys = {k for k, _ in pairs}
+        if len(keys) == 1:
+            return f"{keys.pop()} in ({','.join(v for _, v in pairs)})"
+    return None
+
+
+def resolve_workload_selector(apps_v1, batch_v1, namespace, name):
+    """Selector del workload `name` (Deployment, StatefulSet, DaemonSet o Job), None se non trovato"""
+    readers = [
+        apps_v1.read_namespaced_deployment,
+        apps_v1.read_namespaced_stateful_set,
+        apps_v1.read_namespaced_daemon_set,
+    ]
+    if batch_v1 is not None:
+        readers.append(batch_v1.read_namespaced_job)
+    for read in readers:
+        try:
+            obj = read(name, namespace)
+        except ApiException as e:
+            if e.status == 404:
+                continue
+            raise
+        return selector_to_string(obj.spec.selector)
+    return None
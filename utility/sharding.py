@@ -0,0 +1,297 @@
+import os
+import copy
+import json
+import bisect
+import socket
+import hashlib
+import threading
+from datetime import datetime, timezone, timedelta
+from kubernetes import client
+from kubernetes.client.rest import ApiException
+
+GROUP_LABEL = "kubog.io/shard-group"
+STATE_ANNOTATION = "kubog.io/shard-state"
+NODES_KEY = "__nodes__"  # chiave del ring per il controllo nodi (un solo replica)
+
+
+def _hash(value):
+    return int(hashlib.md5(value.encode()).hexdigest()[:16], 16)
+
+
+class HashRing:
+    """Consistent hashing con nodi virtuali: aggiungere/togliere un replica sposta ~1/N chiavi"""
+
+    def __init__(self, members, vnodes=64):
+        self.members = sorted(members)
+        self._ring = sorted((_hash(f"{m}#{i}"), m) for m in self.members for i in range(vnodes))
+        self._keys = [h for h, _ in self._ring]
+
+    def owner(self, key):
+        if not self._ring:
+            return None
+        idx = bisect.bisect(self._keys, _hash(key)) % len(self._ring)
+        return self._ring[idx][1]
+
+
+class LeaseMembership:
+    """
+    Membership dei replica tramite un oggetto Lease per replica (label GROUP_LABEL).
+    Ogni heartbeat rinnova il proprio Lease e pubblica nello STATE_ANNOTATION
+    i namespace attivi e quelli rilasciati, con la relativa resourceVersion.
+    I Lease scaduti da più di `gc_seconds` (replica spariti da tempo) vengono cancellati.
+    """
+
+    def __init__(self, coordination_api, lease_namespace, group, identity, lease_seconds=15):
+        self.api = coordination_api
+        self.lease_namespace = lease_namespace
+        self.group = group
+        self.identity = identity
+        self.lease_seconds = lease_seconds
+        self.gc_seconds = max(300, 20 * lease_seconds)
+        self.lease_name = f"kubog-{group}-{identity}"[:253]
+
+    def heartbeat(self, state, lease_seconds=None):
+        now = datetime.now(timezone.utc)
+        lease = client.V1Lease(
+            metadata=client.V1ObjectMeta(
+                name=self.lease_name,
+                labels={GROUP_LABEL: self.group},
+                annotations={STATE_ANNOTATION: json.dumps(state)},
+            ),
+            spec=client.V1LeaseSpec(
+                holder_identity=self.identity,
+                lease_duration_seconds=lease_seconds or self.lease_seconds,
+                renew_time=now,
+            ),
+        )
+        try:
+            current = self.api.read_namespaced_lease(self.lease_name, self.lease_namespace)
+            lease.metadata.resource_version = current.metadata.resource_version
+            self.api.replace_namespaced_lease(self.lease_name, self.lease_namespace, lease)
+        except ApiException as e:
+            if e.status != 404:
+                raise
+            lease.spec.acquire_time = now
+            self.api.create_namespaced_lease(self.lease_namespace, lease)
+
+    def peers(self):
+        """Ritorna [(identity, alive, state)] per tutti i Lease del gruppo"""
+        now = datetime.now(timezone.utc)
+        leases = self.api.list_namespaced_lease(
+            self.lease_namespace, label_selector=f"{GROUP_LABEL}={self.group}"
+        ).items
+        result = []
+        for lease in leases:
+            spec = lease.spec
+            renew = spec.renew_time
+            if renew is not None and renew.tzinfo is None:
+                renew = renew.replace(tzinfo=timezone.utc)
+            expires = renew + timedelta(seconds=spec.lease_duration_seconds or 0) if renew is not None else None
+            alive = expires is not None and expires >= now
+            if not alive and spec.holder_identity != self.identity and (
+                    expires is None or now - expires > timedelta(seconds=self.gc_seconds)):
+                # i suoi namespace sono stati ripresi da tempo: il Lease non serve più
+                self._delete(lease.metadata.name)
+                continue
+            try:
+                state = json.loads((lease.metadata.annotations or {}).get(STATE_ANNOTATION, "{}"))
+            except ValueError:
+                state = {}
+            result.append((spec.holder_identity, alive, state))
+        return result
+
+    def _delete(self, name):
+        try:
+            self.api.delete_namespaced_lease(name, self.lease_namespace)
+        except ApiException:
+            pass
+
+
+class ShardCoordinator:
+    """
+    Distribuisce i namespace tra i replica con consistent hashing.
+    Hand-off: un namespace viene acquisito solo quando nessun altro replica vivo
+    lo dichiara attivo, ripartendo dalla resourceVersion pubblicata da chi lo ha rilasciato
+    (o da chi è morto tenendolo): il nuovo owner carica lo stato dei pod a quella versione
+    senza emettere nulla e riprende il watch da lì, senza eventi persi né duplicati.
+    """
+
+    def __init__(self, debugger, membership, interval=5):
+        self.debugger = debugger
+        self.membership = membership
+        self.interval = interval
+        self.all_namespaces = set()
+        self.active = set()
+        self.released = {}  # {namespace: resource_version}
+        self.ring = HashRing([membership.identity])
+        self._stop = threading.Event()
+        self._lock = threading.Lock()
+
+    @property
+    def identity(self):
+        return self.membership.identity
+
+    def owns(self, key):
+        return self.ring.owner(key) == self.identity
+
+    def add_namespace(self, namespace):
+        with self._lock:
+            self.all_namespaces.add(namespace)
+
+    def remove_namespace(self, namespace):
+        with self._lock:
+            self.all_namespaces.discard(namespace)
+            self.released.pop(namespace, None)
+            if namespace in self.active:
+                self.active.discard(namespace)
+                self.debugger._stop_watcher(namespace)
+
+    def _state(self):
+        rvs = self.debugger.resource_versions
+        return {
+            "active": {ns: rvs.get(ns) for ns in self.active},
+            "released": dict(self.released),
+        }
+
+    def rebalance(self):
+        with self._lock:
+            self.membership.heartbeat(self._state())
+            peers = self.membership.peers()
+
+            live = {ident for ident, alive, _ in peers if alive} | {self.identity}
+            self.ring = HashRing(live)
+
+            held_by_others = set()
+            handoff = {}
+            for ident, alive, state in peers:
+                if ident == self.identity:
+                    continue
+                if alive:
+                    held_by_others.update(state.get("active", {}))
+                    handoff.update(state.get("released", {}))
+                else:
+                    # replica morto o fermato: riprendiamo dalle sue ultime resourceVersion
+                    handoff.update(state.get("released", {}))
+                    handoff.update(state.get("active", {}))
+
+            # 1) rilascia i namespace che ora appartengono ad altri
+            for ns in sorted(self.active):
+                if not self.owns(ns):
+                    self.debugger._stop_watcher(ns)
+                    self.active.discard(ns)
+                    self.released[ns] = self.debugger.resource_versions.get(ns)
+                    print(f"📤 Shard hand-off: released {ns}")
+
+            # 2) acquisisce quelli assegnati a noi e non più tenuti da altri
+            for ns in sorted(self.all_namespaces - self.active):
+                if not self.owns(ns) or ns in held_by_others:
+                    continue
+                own = self.released.pop(ns, None)
+                rv = handoff.get(ns) or own
+                self.active.add(ns)
+                self.debugger._acquire_namespace(ns, rv)
+
+            # i rilasci già ripresi da un altro replica non servono più
+            for ns in list(self.released):
+                if ns in held_by_others:
+                    del self.released[ns]
+
+            # pubblica subito lo stato aggiornato per accorciare l'hand-off
+            self.membership.heartbeat(self._state())
+
+    def start(self, namespaces):
+        with self._lock:
+            self.all_namespaces.update(namespaces)
+        self.rebalance()
+
+        def loop():
+            while not self._stop.wait(self.interval):
+                try:
+                    self.rebalance()
+                except Exception as e:
+                    print(f"⚠️ Shard rebalance failed: {e}")
+
+        threading.Thread(target=loop, name="shard-coordinator", daemon=True).start()
+
+    def stop(self):
+        """
+        Arresto ordinato: ferma i watch, sposta tutti i namespace in `released` con la loro
+        resourceVersion e pubblica un Lease che scade subito. Il Lease non viene cancellato:
+        gli altri replica ci leggono da dove riprendere.
+        """
+        self._stop.set()
+        with self._lock:
+            for ns in sorted(self.active):
+                self.debugger._stop_watcher(ns)
+                self.released[ns] = self.debugger.resource_versions.get(ns)
+            self.active.clear()
+            try:
+                self.membership.heartbeat(self._state(), lease_seconds=1)
+            except ApiException as e:
+                print(f"⚠️ Shard hand-off on stop failed: {e.reason}")
+
+
+class InMemoryLeaseAPI:
+    """
+    Sostituto locale di CoordinationV1Api (solo i metodi usati da LeaseMembership e LeaderElector),
+    per provare più replica nello stesso processo senza un API server.
+    Come un API server vero tiene e restituisce copie: un replica che modifica il Lease letto
+    non tocca quello salvato, e una replace con resourceVersion vecchia fallisce con 409.
+    """
+
+    def __init__(self):
+        self.leases = {}
+        self._version = 0
+        self._lock = threading.Lock()
+
+    def _key(self, name, namespace):
+        return (namespace, name)
+
+    def read_namespaced_lease(self, name, namespace):
+        with self._lock:
+            lease = self.leases.get(self._key(name, namespace))
+            if lease is None:
+                raise ApiException(status=404, reason="Not Found")
+            return copy.deepcopy(lease)
+
+    def create_namespaced_lease(self, namespace, body):
+        with self._lock:
+            key = self._key(body.metadata.name, namespace)
+            if key in self.leases:
+                raise ApiException(status=409, reason="AlreadyExists")
+            stored = copy.deepcopy(body)
+            self._version += 1
+            stored.metadata.resource_version = str(self._version)
+            self.leases[key] = stored
+            return copy.deepcopy(stored)
+
+    def replace_namespaced_lease(self, name, namespace, body):
+        with self._lock:
+            current = self.leases.get(self._key(name, namespace))
+            if current is None:
+                raise ApiException(status=404, reason="Not Found")
+            if body.metadata.resource_version != current.metadata.resource_version:
+                raise ApiException(status=409, reason="Conflict")
+            stored = copy.deepcopy(body)
+            self._version += 1
+            stored.metadata.resource_version = str(self._version)
+            self.leases[self._key(name, namespace)] = stored
+            return copy.deepcopy(stored)
+
+    def delete_namespaced_lease(self, name, namespace):
+        with self._lock:
+            if self.leases.pop(self._key(name, namespace), None) is None:
+                raise ApiException(status=404, reason="Not Found")
+
+    def list_namespaced_lease(self, namespace, label_selector=None):
+        wanted = dict(s.split("=", 1) for s in label_selector.split(",")) if label_selector else {}
+        with self._lock:
+            items = [
+                copy.deepcopy(lease) for (ns, _), lease in self.leases.items()
+                if ns == namespace and all((lease.metadata.labels or {}).get(k) == v for k, v in wanted.items())
+            ]
+        return client.V1LeaseList(items=items)
+
+
+def default_identity():
+    return os.getenv("POD_NAME") or socket.gethostname()
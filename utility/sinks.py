@@ -0,0 +1,262 @@
+import json
+import time
+import queue
+import threading
+from collections import defaultdict
+import requests
+
+# Un sink è qualsiasi oggetto con `name`, `write(batch)` e (opzionale) `close()`:
+# `batch` è una lista di eventi (dict). Oltre a quelli qui sotto lo sono anche
+# NDJSONSink e LogCapture.
+
+
+class Sink:
+    name = "sink"
+    coalesce = True  # il worker può unire più batch accodati in una sola write
+
+    def write(self, batch):
+        raise NotImplementedError
+
+    def close(self):
+        pass
+
+
+class HistorySink(Sink):
+    """
+    Storico degli eventi: SQLite (--store sqlite) oppure CSV per workload.
+    Con --contexts ogni cluster ha il suo debugger (e la sua cartella): si instrada per `cluster`.
+    """
+    name = "history"
+
+    def __init__(self, debugger):
+        self.debuggers = {}
+        self.add(debugger)
+
+    def add(self, debugger):
+        self.debuggers[debugger.cluster] = debugger
+
+    def write(self, batch):
+        groups = defaultdict(list)
+        for entry in batch:
+            groups[(entry.get("cluster"), entry.get("namespace") or "-")].append(entry)
+        for (cluster, ns), entries in groups.items():
+            d = self.debuggers[cluster]
+            if d.store:
+                d.store.write_events(entries)
+            else:
+                d._write_csv(entries, ns)
+
+
+class AlertSink(Sink):
+    """
+    Selezione dell'evento più grave per pod/container, regole e invio Teams/email.
+    La selezione vale per un singolo _output: i batch non vengono uniti (coalesce = False).
+    """
+    name = "alerts"
+    coalesce = False
+
+    EVENT_PRIORITY = {
+        "OOM_KILLED":       100,
+        "ExitCode_137":     90,
+        "TERMINATION":      80,
+        "PROBE_FAILURE":    70,
+        "CrashLoopBackOff": 60,
+        "STATE_CHANGE":     10,
+        # ... altri tipi se servono
+    }
+
+    def __init__(self, debugger):
+        self.debugger = debugger
+
+    def write(self, batch):
+        d = self.debugger
+        manager = d.alert_manager
+        teams_enabled = bool(manager.teams_webhook_url)
+        email_enabled = bool(manager.mail_config)
+
+        if not teams_enabled and not d._teams_warning_printed:
+            print("⚠️ No Teams webhook configured.")
+            d._teams_warning_printed = True
+        if not email_enabled and not d._email_warning_printed:
+            print("⚠️ No email config defined.")
+            d._email_warning_printed = True
+
+        best_events = {}
+        for entry in batch:
+            key = (entry.get("cluster"), entry.get("namespace"), entry["pod"], entry.get("container", ""))
+            prio = self.EVENT_PRIORITY.get(entry["type"], 0)
+            if key not in best_events or prio > self.EVENT_PRIORITY.get(best_events[key]["type"], 0):
+                best_events[key] = entry
+
+        for entry in best_events.values():
+            if entry.get("node_condition"):
+                # causa nota: confluisce nell'alert di rollup del nodo
+                d.node_rollup.record(entry)
+                continue
+            should_alert, cfg = manager.should_alert(entry)
+            if not should_alert:
+                continue
+            # standby di --ha: l'invio resta in coda fino all'eventuale promozione
+            if teams_enabled:
+                d._send_alert(manager.send_teams_alert, entry, cfg)
+            if email_enabled:
+                d._send_alert(manager.send_email_alert, entry, cfg)
+
+
+class HTTPSink(Sink):
+    """
+    POST di ogni batch come array JSON verso un webhook/collector.
+    Ritenta con backoff su errori di rete, 429 e 5xx; `session` si può sostituire
+    (es. con un server locale di prova).
+    """
+    name = "http"
+
+    def __init__(self, url, headers=None, timeout=5, retries=3, backoff=1.0, session=None):
+        self.url = url
+        self.headers = {"Content-Type": "application/json", **(headers or {})}
+        self.timeout = timeout
+        self.retries = retries
+        self.backoff = backoff
+        self.session = session or requests.Session()
+        self.name = f"http:{url}"
+
+    def write(self, batch):
+        body = json.dumps(batch, default=str).encode("utf-8")
+        delay = self.backoff
+        for attempt in range(self.retries + 1):
+            try:
+                resp = self.session.post(self.url, data=body, headers=self.headers, timeout=self.timeout)
+                if resp.status_code < 300:
+                    return
+                if resp.status_code != 429 and resp.status_code < 500:
+                    raise RuntimeError(f"HTTP {resp.status_code}: {resp.text[:200]}")
+                error = RuntimeError(f"HTTP {resp.status_code}")
+            except requests.RequestException as e:
+                error = e
+            if attempt < self.retries:
+                time.sleep(delay)
+                delay *= 2
+        raise error
+
+    def close(self):
+        self.session.close()
+
+
+class _SinkWorker:
+    def __init__(self, sink, queue_size, max_batch):
+        self.sink = sink
+        self.max_batch = max_batch if getattr(sink, "coalesce", True) else 0
+        self.queue = queue.Queue(maxsize=queue_size)
+        self.stats = defaultdict(int)
+        self.last_drop_warning = 0.0
+        self.thread = threading.Thread(target=self._loop, name=f"sink-{sink.name}", daemon=True)
+        self.thread.start()
+
+    def _loop(self):
+        stopping = False
+        while not stopping:
+            batch = self.queue.get()
+            if batch is None:
+                self.queue.task_done()
+                return
+            taken = 1
+            # accorpa i batch già in coda fino a max_batch eventi: una write sola
+            while len(batch) < self.max_batch:
+                try:
+                    more = self.queue.get_nowait()
+                except queue.Empty:
+                    break
+                taken += 1
+                if more is None:
+                    stopping = True  # scrive quello che ha già preso, poi esce
+                    break
+                batch = batch + more
+            _write(self.sink, batch, self.stats)
+            for _ in range(taken):
+                self.queue.task_done()
+
+
+def _write(sink, batch, stats):
+    try:
+        sink.write(batch)
+        stats["batches"] += 1
+        stats["events"] += len(batch)
+    except Exception as e:
+        stats["failed"] += 1
+        stats["failed_events"] += len(batch)
+        print(f"⚠️ Sink {sink.name} failed ({len(batch)} events): {e}")
+
+
+class SinkPipeline:
+    """
+    Fan-out degli eventi verso i sink: ogni sink ha la sua coda limitata e il suo thread,
+    quindi un sink lento o in errore non blocca gli altri né il watch loop
+    (coda piena → batch scartato e contato in `dropped`).
+    Con synchronous=True (replay, benchmark) i sink vengono chiamati inline.
+    """
+
+    def __init__(self, queue_size=1000, max_batch=500, synchronous=False):
+        self.queue_size = queue_size
+        self.max_batch = max_batch
+        self.synchronous = synchronous
+        self.workers = []
+        self._closed = False
+
+    def add(self, sink):
+        if sink is not None:
+            self.workers.append(_SinkWorker(sink, self.queue_size, self.max_batch))
+        return sink
+
+    def publish(self, batch):
+        if not batch:
+            return
+        for worker in self.workers:
+            if self.synchronous:
+                _write(worker.sink, batch, worker.stats)
+                continue
+            try:
+                worker.queue.put_nowait(batch)
+            except queue.Full:
+                worker.stats["dropped"] += len(batch)
+                now = time.monotonic()
+                if now - worker.last_drop_warning >= 60:
+                    worker.last_drop_warning = now
+                    print(f"⚠️ Sink {worker.sink.name} queue full: {worker.stats['dropped']} events dropped so far")
+
+    def flush(self):
+        """Attende che tutti i batch accodati siano stati scritti"""
+        for worker in self.workers:
+            worker.queue.join()
+
+    def stats(self):
+        return {w.sink.name: dict(w.stats) for w in self.workers}
+
+    def summary(self):
+        """Una riga per le statistiche periodiche: eventi scritti, scartati e falliti per sink"""
+        parts = []
+        for w in self.workers:
+            s = w.stats
+            part = f"{w.sink.name} {s['events']} events/{s['batches']} batches"
+            if s["dropped"]:
+                part += f", {s['dropped']} dropped"
+            if s["failed"]:
+                part += f", {s['failed_events']} failed"
+            if w.queue.qsize():
+                part += f", {w.queue.qsize()} queued"
+            parts.append(part)
+        return "; ".join(parts)
+
+    def close(self):
+        if self._closed:  # pipeline condivisa tra più debugger (--contexts)
+            return
+        self._closed = True
+        for worker in self.workers:
+            try:
+                worker.queue.put(None, timeout=10)  # coda piena: il worker la sta svuotando
+            except queue.Full:
+                print(f"⚠️ Sink {worker.sink.name} did not drain its queue, closing anyway")
+        for worker in self.workers:
+            worker.thread.join(timeout=10)
+            close = getattr(worker.sink, "close", None)
+            if close:
+                close()
@@ -0,0 +1,121 @@
+import queue
+import sqlite3
+import threading
+import time
+
+NODE_COLUMNS = [
+    "timestamp", "type", "node",
+    "cpu_capacity", "cpu_allocatable", "cpu_usage", "cpu_requests", "cpu_limits",
+    "mem_capacity", "mem_allocatable", "mem_usage", "mem_requests", "mem_limits",
+    "condition_Ready", "condition_MemoryPressure", "condition_DiskPressure",
+    "condition_PIDPressure", "condition_NetworkUnavailable",
+    "taints"
+]
+
+
+def _q(col):
+    # "from"/"to" sono parole riservate in SQL
+    return f'"{col}"'
+
+
+class SQLiteStore:
+    """
+    Backend di storage SQLite (WAL) alternativo ai CSV.
+    I thread di watch accodano soltanto; un unico thread writer svuota la coda
+    e scrive in transazioni da `batch_size` righe o ogni `flush_interval` secondi.
+    """
+
+    def __init__(self, path, event_columns, batch_size=500, flush_interval=1.0):
+        self.path = path
+        self.event_columns = list(event_columns)
+        self.batch_size = batch_size
+        self.flush_interval = flush_interval
+        self.queue = queue.Queue()
+        self.rows_written = 0
+        self.commits = 0
+        self._stop = threading.Event()
+
+        self._event_sql = "INSERT INTO events ({}) VALUES ({})".format(
+            ", ".join(_q(c) for c in self.event_columns), ", ".join("?" * len(self.event_columns)))
+        self._node_sql = "INSERT INTO node_status ({}) VALUES ({})".format(
+            ", ".join(_q(c) for c in NODE_COLUMNS), ", ".join("?" * len(NODE_COLUMNS)))
+
+        # schema creato qui così eventuali errori emergono all'avvio, non nel thread
+        conn = self._connect()
+        self._create_schema(conn)
+        conn.close()
+
+        self._thread = threading.Thread(target=self._writer_loop, name="sqlite-writer", daemon=True)
+        self._thread.start()
+
+    def _connect(self):
+        conn = sqlite3.connect(self.path, check_same_thread=False)
+        conn.execute("PRAGMA journal_mode=WAL")
+        conn.execute("PRAGMA synchronous=NORMAL")
+        return conn
+
+    def _create_schema(self, conn):
+        conn.execute("CREATE TABLE IF NOT EXISTS events ({})".format(
+            ", ".join(_q(c) for c in self.event_columns)))
+        conn.execute("CREATE TABLE IF NOT EXISTS node_status ({})".format(
+            ", ".join(_q(c) for c in NODE_COLUMNS)))
+        # DB creato prima di una nuova colonna (es. `count`): la si aggiunge
+        existing = {r[1] for r in conn.execute("PRAGMA table_info(events)")}
+        for col in self.event_columns:
+            if col not in existing:
+                conn.execute(f"ALTER TABLE events ADD COLUMN {_q(col)}")
+        conn.executescript("""
+            CREATE INDEX IF NOT EXISTS idx_events_wl_ts ON events(namespace, workload, timestamp);
+            CREATE INDEX IF NOT EXISTS idx_events_type_ts ON events(type, timestamp);
+            CREATE INDEX IF NOT EXISTS idx_events_reason_ts ON events(reason, timestamp);
+            CREATE INDEX IF NOT EXISTS idx_events_exit_ts ON events(exit_code, timestamp);
+            CREATE INDEX IF NOT EXISTS idx_node_ts ON node_status(node, timestamp);
+        """)
+        conn.commit()
+
+    def write_events(self, entries):
+        for entry in entries:
+            self.queue.put(("events", tuple(entry.get(c) for c in self.event_columns)))
+
+    def write_node(self, data):
+        self.queue.put(("node_status", tuple(data.get(c) for c in NODE_COLUMNS)))
+
+    def _writer_loop(self):
+        conn = self._connect()
+        while not (self._stop.is_set() and self.queue.empty()):
+            batch = self._drain()
+            if batch:
+                self._commit(conn, batch)
+        conn.close()
+
+    def _drain(self):
+        """Raccoglie fino a batch_size righe, attendendo al massimo flush_interval"""
+        batch = []
+        deadline = time.monotonic() + self.flush_interval
+        while len(batch) < self.batch_size:
+            timeout = deadline - time.monotonic()
+            if timeout <= 0:
+                break
+            try:
+                batch.append(self.queue.get(timeout=timeout))
+            except queue.Empty:
+                break
+        return batch
+
+    def _commit(self, conn, batch):
+        events = [row for table, row in batch if table == "events"]
+        nodes = [row for table, row in batch if table == "node_status"]
+        try:
+            with conn:
+                if events:
+                    conn.executemany(self._event_sql, events)
+                if nodes:
+                    conn.executemany(self._node_sql, nodes)
+            self.rows_written += len(batch)
+            self.commits += 1
+        except sqlite3.Error as e:
+            print(f"⚠️ SQLite write failed ({len(batch)} rows dropped): {e}")
+
+    def close(self, timeout=10):
+        self._stop.set()
+        self._thread.join(timeout)
@@ -0,0 +1,293 @@
+import os
+import sys
+import gzip
+import json
+import time
+import argparse
+import threading
+from collections import defaultdict
+from types import SimpleNamespace
+from kubernetes import client
+from kubernetes.client.rest import ApiException
+
+
+class WatchRecorder:
+    """
+    Registra gli eventi grezzi dei watch (pod, namespace, event) e gli snapshot dei nodi
+    in NDJSON compresso con gzip: una riga per evento con offset temporale `t`.
+    """
+
+    def __init__(self, path):
+        self.path = path
+        self._file = gzip.open(path, "wt", encoding="utf-8")
+        self._lock = threading.Lock()
+        self._start = time.monotonic()
+        self._api_client = client.ApiClient()
+        self.records = 0
+
+    def _write(self, record):
+        record["t"] = round(time.monotonic() - self._start, 6)
+        line = json.dumps(record, default=str)
+        with self._lock:
+            self._file.write(line + "\n")
+            self.records += 1
+
+    def record_watch(self, kind, event, namespace=None):
+        """event è il dict prodotto da watch.stream (usa raw_object se presente)"""
+        obj = event.get("raw_object")
+        if obj is None:
+            obj = self._api_client.sanitize_for_serialization(event["object"])
+        self._write({"kind": kind, "type": event["type"], "namespace": namespace, "object": obj})
+
+    def record_nodes(self, nodes, pods, metrics):
+        self._write({
+            "kind": "nodes",
+            "nodes": self._api_client.sanitize_for_serialization(nodes),
+            "pods": self._api_client.sanitize_for_serialization(pods),
+            "metrics": list(metrics.values()),
+        })
+
+    def close(self):
+        with self._lock:
+            self._file.close()
+
+
+def iter_recording(path):
+    with gzip.open(path, "rt", encoding="utf-8") as f:
+        for line in f:
+            if line.strip():
+                yield json.loads(line)
+
+
+# ── REPLAY ──────────────────────────────────────────────────────────────────
+
+class _Response:
+    """Adatta un dict al formato atteso da ApiClient.deserialize"""
+
+    def __init__(self, data):
+        self.data = json.dumps(data)
+
+
+class StubCoreV1Api:
+    """CoreV1Api finta: serve liste dall'ultimo snapshot nodi registrato"""
+
+    def __init__(self, api_client):
+        self.api_client = api_client
+        self.nodes = client.V1NodeList(items=[])
+        self.pods = client.V1PodList(items=[])
+
+    def load_snapshot(self, record):
+        self.nodes = self.api_client.deserialize(_Response(record["nodes"]), "V1NodeList")
+        self.pods = self.api_client.deserialize(_Response(record["pods"]), "V1PodList")
+
+    def list_node(self, **kwargs):
+        return self.nodes
+
+    def list_pod_for_all_namespaces(self, **kwargs):
+        return self.pods
+
+    def list_namespaced_pod(self, namespace, **kwargs):
+        return client.V1PodList(metadata=client.V1ListMeta(resource_version="0"), items=[])
+
+    def read_namespaced_pod(self, name, namespace, **kwargs):
+        # il workload dei pod arriva dalla cache popolata dai watch registrati
+        raise ApiException(status=404, reason="offline")
+
+
+class StubAppsV1Api:
+    """Risolve i ReplicaSet senza API: owner = Deployment col nome senza pod-template-hash"""
+
+    def read_namespaced_replica_set(self, name, namespace, **kwargs):
+        deployment = name.rsplit("-", 1)[0]
+        return client.V1ReplicaSet(metadata=client.V1ObjectMeta(
+            name=name, namespace=namespace,
+            owner_references=[client.V1OwnerReference(
+                api_version="apps/v1", kind="Deployment", name=deployment, uid=deployment)],
+        ))
+
+
+class StubMetricsApi:
+    def __init__(self):
+        self.items = []
+
+    def list_cluster_custom_object(self, group, version, plural, **kwargs):
+        return {"items": self.items}
+
+
+class StageTimer:
+    def __init__(self):
+        self.samples = defaultdict(list)
+
+    def wrap(self, owner, name, stage=None):
+        original = getattr(owner, name)
+        samples = self.samples[stage or name]
+
+        def timed(*args, **kwargs):
+            start = time.perf_counter()
+            try:
+                return original(*args, **kwargs)
+            finally:
+                samples.append((time.perf_counter() - start) * 1000)
+
+        setattr(owner, name, timed)
+
+    def report(self):
+        result = {}
+        for stage, values in self.samples.items():
+            if not values:
+                continue
+            ordered = sorted(values)
+            result[stage] = {
+                "calls": len(ordered),
+                "total_ms": round(sum(ordered), 3),
+                "mean_ms": round(sum(ordered) / len(ordered), 4),
+                "p50_ms": round(ordered[len(ordered) // 2], 4),
+                "p99_ms": round(ordered[min(len(ordered) - 1, int(len(ordered) * 0.99))], 4),
+            }
+        return result
+
+
+def offline_args(**overrides):
+    """Argomenti CLI di default per un PodRestartDebugger senza cluster"""
+    args = SimpleNamespace(
+        workloads=None, namespaces=[], chaos=True, watch=False, nodes=True,
+        probes=True, state_changes=True, messages=True, csv=True, logs=False,
+        service_account=False, context=None, store="csv", retention_days=None,
+        shard=False, record=None, capture_logs=False, events=False, events_flush=15,
+    )
+    args.__dict__.update(overrides)
+    return args
+
+
+def build_offline_debugger(args=None, out_dir=None):
+    """
+    Crea un PodRestartDebugger con client Kubernetes finti e canali di alert
+    che contano invece di inviare. Ritorna (debugger, contatori alert).
+    """
+    from kubog_v1 import PodRestartDebugger
+
+    # il debugger carica kube-alerts.yaml dalla cwd: si cambia cartella solo dopo
+    debugger = PodRestartDebugger(args or offline_args())
+    if out_dir:
+        os.makedirs(out_dir, exist_ok=True)
+        os.chdir(out_dir)
+        # base_dir è fissato alla costruzione (cwd di allora): CSV, nodi e compattazione vanno in out_dir
+        debugger.base_dir = os.path.abspath(out_dir)
+        if debugger.compactor:
+            debugger.compactor.base_dir = debugger.base_dir
+    debugger.v1 = StubCoreV1Api(client.ApiClient())
+    debugger.apps_v1 = StubAppsV1Api()
+    debugger.metrics_api = StubMetricsApi()
+    debugger.metrics_available = True
+    debugger._warmup = False
+    debugger._teams_warning_printed = debugger._email_warning_printed = True
+    debugger.sinks.synchronous = True  # sink inline: conteggi e CSV completi a fine replay
+
+    counters = defaultdict(int)
+    alerts = debugger.alert_manager
+    alerts.teams_webhook_url = "offline://teams"
+    alerts.mail_config = {"offline": True}
+    for channel in ("send_teams_alert", "send_email_alert", "send_nodes_email_alert"):
+        setattr(alerts, channel, lambda event, rule, channel=channel: counters.__setitem__(
+            channel, counters[channel] + 1))
+    return debugger, counters
+
+
+def replay(path, speed=None, out_dir=None, debugger_args=None):
+    """
+    Rilegge una registrazione attraverso la pipeline reale di PodRestartDebugger
+    (_handle_watch_event, _check_nodes, _output) con client Kubernetes finti.
+    speed=None → massima velocità, altrimenti N× il tempo registrato.
+    """
+    debugger, counters = build_offline_debugger(debugger_args, out_dir)
+    api_client = debugger.v1.api_client
+    alerts = debugger.alert_manager
+
+    rows = defaultdict(int)
+    write_csv = debugger._write_csv
+    output_node_status = debugger._output_node_status
+
+    def counted_write_csv(data, namespace):
+        rows["workload_csv_rows"] += len(data)
+        return write_csv(data, namespace)
+
+    def counted_node_status(data, node_name):
+        rows["node_csv_rows"] += 1
+        return output_node_status(data, node_name)
+
+    debugger._write_csv = counted_write_csv
+    debugger._output_node_status = counted_node_status
+
+    timer = StageTimer()
+    for name in ("_handle_watch_event", "_get_workload", "_process_pod", "_output",
+                 "_write_csv", "_check_nodes", "_output_node_status", "_handle_namespace_event"):
+        timer.wrap(debugger, name)
+    timer.wrap(alerts, "should_alert", "should_alert")
+
+    events = defaultdict(int)
+    last_t = None
+    start = time.perf_counter()
+    for record in iter_recording(path):
+        if speed and last_t is not None:
+            delay = (record["t"] - last_t) / speed
+            if delay > 0:
+                time.sleep(delay)
+        last_t = record["t"]
+
+        kind = record["kind"]
+        if kind == "pod":
+            pod = api_client.deserialize(_Response(record["object"]), "V1Pod")
+            if debugger._should_monitor(pod, record["namespace"]):
+                debugger._handle_watch_event({"type": record["type"], "object": pod})
+        elif kind == "namespace":
+            ns = api_client.deserialize(_Response(record["object"]), "V1Namespace")
+            debugger._handle_namespace_event({"type": record["type"], "object": ns})
+        elif kind == "event" and debugger.event_watcher:
+            ev = api_client.deserialize(_Response(record["object"]), "CoreV1Event")
+            debugger.event_watcher.handle({"type": record["type"], "object": ev})
+        elif kind == "nodes":
+            debugger.v1.load_snapshot(record)
+            debugger.metrics_api.items = record.get("metrics", [])
+            debugger._check_nodes()
+        events[kind] += 1
+    if debugger.event_watcher:
+        debugger.event_watcher.flush()
+    elapsed = time.perf_counter() - start
+
+    total = sum(events.values())
+    return {
+        "recording": path,
+        "speed": speed or "max",
+        "elapsed_s": round(elapsed, 3),
+        "events": dict(events),
+        "events_per_sec": round(total / elapsed, 1) if elapsed else None,
+        "stages": timer.report(),
+        "alerts": dict(counters),
+        "rows": dict(rows),
+    }
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(prog="kubog replay", description="Replay a recorded KuBog watch stream")
+    parser.add_argument("recording", help="File produced with --record (.ndjson.gz)")
+    parser.add_argument("--speed", default="max", help="'max' or a multiplier (1 = real time, 10 = 10x)")
+    parser.add_argument("--out", default="replay_output", help="Directory for CSVs written during replay")
+    parser.add_argument("--report", help="Write the JSON report to this file")
+    parser.add_argument("--events", action="store_true", help="Also replay recorded Kubernetes events")
+    args = parser.parse_args(argv)
+
+    recording = os.path.abspath(args.recording)
+    report_path = os.path.abspath(args.report) if args.report else None
+    speed = None if args.speed == "max" else float(args.speed)
+
+    report = replay(recording, speed=speed, out_dir=args.out,
+                    debugger_args=offline_args(events=True) if args.events else None)
+    text = json.dumps(report, indent=2)
+    print(text)
+    if report_path:
+        with open(report_path, "w") as f:
+            f.write(text)
+
+
+if __name__ == "__main__":
+    sys.exit(main())